@@ -0,0 +1,83 @@
+import os
+import numpy as np
+
+from visual import top_k_rows
+
+# Exported `implicit` ALS factors (see scripts/export_als_factors.py):
+# rows are customer_id_int / article_id_int, exactly as in the notebook's user_item_matrix
+USER_FACTORS_FILENAME = "als_user_factors.npy"
+ITEM_FACTORS_FILENAME = "als_item_factors.npy"
+
+
+class ALSRetriever:
+    """
+    Online ALS candidate retrieval from stored factor matrices.
+
+    Both factor matrices are memory-mapped. For a batch of users, the item
+    factors are scanned `block_size` rows at a time (one matrix product per
+    block) reduced to its top-N with argpartition; one ordered top-N over
+    the block winners finishes the search. Memory is bounded by
+    (n_users x block_size) whatever the catalogue size.
+    Scores are user_factors . item_factors, as returned by implicit's
+    model.recommend() (which produced the notebook's als_score).
+    """
+    def __init__(self, user_factors, item_factors, n_candidates=50, block_size=16384):
+        if user_factors.shape[1] != item_factors.shape[1]:
+            raise ValueError(f"ALS factor sizes differ: {user_factors.shape[1]} vs {item_factors.shape[1]}.")
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.n_candidates = n_candidates
+        self.block_size = block_size
+        print(f"   - ALS Factors: {len(user_factors)} users, {len(item_factors)} items, "
+              f"{item_factors.shape[1]} factors (top {n_candidates} per user).")
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir, **kwargs):
+        """Returns None when the factor files are not shipped."""
+        user_path = os.path.join(artifact_dir, USER_FACTORS_FILENAME)
+        item_path = os.path.join(artifact_dir, ITEM_FACTORS_FILENAME)
+        if not (os.path.exists(user_path) and os.path.exists(item_path)):
+            print(f"Warning: ALS factors not found in {artifact_dir}. ALS candidates are disabled.")
+            return None
+        return cls(np.load(user_path, mmap_mode='r'), np.load(item_path, mmap_mode='r'), **kwargs)
+
+    def has_user(self, customer_ids):
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        return (ids >= 0) & (ids < len(self.user_factors))
+
+    def retrieve(self, customer_ids, n=None):
+        """
+        Top-n items per user. Returns (article_ids, scores), both (n_users, n),
+        best first; users without factors get article_id -1 / score -inf.
+        """
+        n = min(n or self.n_candidates, len(self.item_factors))
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        article_ids = np.full((len(ids), n), -1, dtype=np.int64)
+        scores = np.full((len(ids), n), -np.inf, dtype=np.float32)
+
+        known = np.flatnonzero(self.has_user(ids))
+        if len(known) == 0 or n == 0:
+            return article_ids, scores
+
+        # Sorted gather: sequential reads from the memory map
+        order = np.argsort(ids[known], kind='stable')
+        users = np.asarray(self.user_factors[ids[known][order]], dtype=np.float32)
+        top_scores, top_items = self._search(users, n)
+        article_ids[known[order]] = top_items
+        scores[known[order]] = top_scores
+        return article_ids, scores
+
+    def _search(self, users, n):
+        # Per block: unordered top-n (argpartition only); one final ordered top-n
+        part_scores, part_items = [], []
+        for start in range(0, len(self.item_factors), self.block_size):
+            block = np.asarray(self.item_factors[start:start + self.block_size], dtype=np.float32)
+            block_scores = users @ block.T
+            if block_scores.shape[1] > n:
+                top = np.argpartition(-block_scores, n - 1, axis=1)[:, :n]
+                block_scores = np.take_along_axis(block_scores, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(block_scores.shape[1]), block_scores.shape)
+            part_scores.append(block_scores)
+            part_items.append(top + start)
+        return top_k_rows(np.concatenate(part_scores, axis=1), np.concatenate(part_items, axis=1), n)
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from executor import Overloaded, InferenceTimeout
+
+
+class MicroBatcher:
+    """
+    Server-side request coalescer in front of RecSysEngine.
+
+    Concurrent /predict calls are queued; a single background task collects
+    everything that arrives within `max_wait_ms` (or until `max_batch_size`
+    requests are waiting), scores them with ONE recommend_many() call on the
+    InferenceExecutor, and resolves each caller's future with its own top-k
+    and the artifact version of the engine that scored the batch. LightGBM
+    then runs one large predict instead of many small ones competing for
+    the same OpenMP threads.
+
+    Batches are dispatched one at a time, so a batch holds a single executor
+    slot (bounded and counted with the other engine calls) while its predict
+    uses `predict_threads` OpenMP threads (0 = the engine's per-call setting,
+    which the default core split makes 1).
+
+    Admission control: with `max_queue` requests already waiting, submit()
+    raises Overloaded immediately; a request not answered within its
+    timeout raises InferenceTimeout and is dropped from its batch if that
+    batch has not been dispatched yet.
+    """
+    def __init__(self, engine, executor, max_wait_ms=3.0, max_batch_size=64, max_queue=None, predict_threads=0):
+        # An EngineManager: its recommend_many returns (artifact_version, results)
+        self.engine = engine
+        # The InferenceExecutor shared with the other endpoints (owned by the caller)
+        self.executor = executor
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_queue = max_queue
+        self.predict_threads = predict_threads
+
+        self.queue = None
+        self._task = None
+
+        # Metrics
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.rejected = 0
+        self.timeouts = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, customer_id, top_k=12, segment=None, recent_items=None, timeout=None):
+        """Queues one request and waits for (artifact_version, recommendations)."""
+        if self.max_queue is not None and self.queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"Micro-batch queue full ({self.queue.qsize()} requests waiting).")
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((customer_id, top_k, segment, recent_items, future, time.perf_counter()))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise InferenceTimeout(f"Micro-batched request did not finish within {timeout}s.") from None
+
+    async def _collect(self):
+        """Waits for the first request, then gathers more until the window closes."""
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Requests that timed out while queued are not scored
+            batch = [item for item in await self._collect() if not item[4].done()]
+            if not batch:
+                continue
+            dispatched = time.perf_counter()
+            self._record(batch, dispatched)
+
+            # Score once with the largest top_k, then trim per caller
+            customer_ids = [item[0] for item in batch]
+            segments = [item[2] for item in batch]
+            recent_items = [item[3] for item in batch]
+            max_k = max(item[1] for item in batch)
+            try:
+                version, results = await self.executor.run(
+                    self.engine.recommend_many, customer_ids, max_k, segments=segments,
+                    recent_items=recent_items if any(recent_items) else None, predict_threads=self.predict_threads
+                )
+            except Exception as e:
+                for _, _, _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, top_k, _, _, future, _), recs in zip(batch, results):
+                # The caller may have gone away (client disconnect / timeout)
+                if not future.done():
+                    future.set_result((version, recs[:top_k]))
+
+    def _record(self, batch, dispatched):
+        size = len(batch)
+        self.batches += 1
+        self.requests += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+        for _, _, _, _, _, enqueued in batch:
+            wait = dispatched - enqueued
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+
+    def stats(self):
+        """Batch size and queue wait metrics (reported on the health endpoint)."""
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "avg_queue_wait_ms": 1000 * self.queue_wait_total / self.requests if self.requests else 0.0,
+            "max_queue_wait_ms": 1000 * self.queue_wait_max,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
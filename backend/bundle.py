@@ -0,0 +1,211 @@
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+import numpy as np
+
+from feature_store import LAYOUT, InMemoryFeatureStore, rank_cold_start_pool
+from id_map import ArticleIdMap
+from tree_model import TreeEnsemble
+
+BUNDLE_FILENAME = "engine.bundle"
+BUNDLE_MAGIC = b"HMRECBND"
+BUNDLE_FORMAT_VERSION = 3
+
+# Raw artifacts compiled into the bundle: if any of them changes after the
+# bundle was built, the bundle is stale and the engine loads the raw files.
+BUNDLE_SOURCES = (
+    "features_user.parquet", "features_item.parquet", "candidates_pool.parquet",
+    "article_map.parquet", "lgbm_ranker.txt", "visual_index_map.pkl",
+)
+
+# Every array starts on a page boundary so it can be mapped (and shared) as-is
+ALIGNMENT = 4096
+
+# magic (8s) | format version (I) | header length (I) | header crc32 (I)
+_PREAMBLE = struct.Struct("<8sIII")
+
+
+class ArtifactBundle:
+    """
+    Read-only view of a compiled artifact bundle.
+
+    Layout: a fixed preamble, a JSON header describing each array
+    (dtype, shape, offset, size, crc32), then the raw arrays, each aligned
+    to a page boundary. The whole file is mmap'ed once and every array is a
+    zero-copy NumPy view of it, so N worker processes share the same
+    physical pages through the OS page cache.
+    """
+    def __init__(self, path, header, buffer):
+        self.path = path
+        self.header = header
+        self._buffer = buffer
+
+    @classmethod
+    def open(cls, path, verify=False):
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(buffer) < _PREAMBLE.size:
+            raise ValueError(f"{path} is not an artifact bundle (file too small).")
+        magic, version, header_len, header_crc = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not an artifact bundle (bad magic).")
+        if version != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"{path} has bundle format {version}, expected {BUNDLE_FORMAT_VERSION}.")
+
+        raw_header = buffer[_PREAMBLE.size:_PREAMBLE.size + header_len]
+        if zlib.crc32(raw_header) != header_crc:
+            raise ValueError(f"{path}: header checksum mismatch.")
+
+        bundle = cls(path, json.loads(raw_header.decode("utf-8")), buffer)
+        if verify:
+            bundle.verify()
+        return bundle
+
+    @property
+    def artifact_version(self):
+        return self.header["artifact_version"]
+
+    @property
+    def meta(self):
+        return self.header["meta"]
+
+    def __contains__(self, name):
+        return name in self.header["arrays"]
+
+    def __getitem__(self, name):
+        """Zero-copy, read-only array backed by the mapped file."""
+        spec = self.header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape)) if shape else 1
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.frombuffer(self._buffer, dtype=dtype, count=count, offset=spec["offset"]).reshape(shape)
+
+    def verify(self):
+        """Checks every array against its stored crc32 (reads the whole file)."""
+        for name, spec in self.header["arrays"].items():
+            data = self._buffer[spec["offset"]:spec["offset"] + spec["nbytes"]]
+            if zlib.crc32(data) != spec["crc32"]:
+                raise ValueError(f"{self.path}: checksum mismatch for array '{name}'.")
+
+
+def source_fingerprint(artifact_dir, names=BUNDLE_SOURCES):
+    """Fingerprint (name, size, mtime) of the raw artifacts a bundle (or the feature DB) is built from."""
+    digest = hashlib.sha1()
+    for name in names:
+        path = os.path.join(artifact_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def write_bundle(path, arrays, meta):
+    """
+    Writes `arrays` (name -> ndarray) and `meta` (JSON-serialisable) to `path`.
+    The file is written next to the target and renamed into place, so a
+    running server never sees a half-written bundle.
+    """
+    specs, prepared = {}, {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f"Array '{name}' has an object dtype and cannot be memory-mapped.")
+        prepared[name] = array
+        specs[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "nbytes": int(array.nbytes),
+            "crc32": zlib.crc32(_as_bytes(array)),
+        }
+
+    # The version identifies the content, not the file: hash of all array checksums
+    digest = hashlib.sha1()
+    for name in sorted(specs):
+        digest.update(f"{name}:{specs[name]['crc32']}:{specs[name]['nbytes']};".encode())
+    digest.update(json.dumps(meta, sort_keys=True).encode())
+
+    # Offsets depend on the header size, which depends on the offsets: lay out
+    # the data area after a generously padded header.
+    header = {"artifact_version": digest.hexdigest()[:12], "created_at": time.time(),
+              "meta": meta, "arrays": specs}
+    header_room = _align(_PREAMBLE.size + len(json.dumps(header)) + 64 * len(specs) + 1024)
+    offset = header_room
+    for name in specs:
+        specs[name]["offset"] = offset
+        offset = _align(offset + specs[name]["nbytes"])
+
+    raw_header = json.dumps(header).encode("utf-8")
+    if _PREAMBLE.size + len(raw_header) > header_room:
+        raise ValueError("Bundle header does not fit in the reserved space.")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, len(raw_header), zlib.crc32(raw_header)))
+        f.write(raw_header)
+        for name, array in prepared.items():
+            f.seek(specs[name]["offset"])
+            f.write(_as_bytes(array))
+        f.truncate(max(offset, header_room))
+    os.replace(tmp_path, path)
+    return header
+
+
+def compile_bundle(artifact_dir, output_path=None):
+    """
+    Offline "compile artifacts" step: parses the raw parquet/txt/pkl artifacts
+    once and writes everything the engine needs into one bundle.
+    """
+    output_path = output_path or os.path.join(artifact_dir, BUNDLE_FILENAME)
+    print(f"Compiling artifacts from: {artifact_dir}")
+    sources = source_fingerprint(artifact_dir)
+
+    # 1. Feature store arrays, typed as the feature layout declares
+    store = InMemoryFeatureStore.from_parquet(artifact_dir, LAYOUT)
+
+    # 2. Article ID map and ranked cold start pool
+    id_map = ArticleIdMap.from_parquet(os.path.join(artifact_dir, "article_map.parquet"))
+    cold_start_ids, cold_start_groups = rank_cold_start_pool(artifact_dir)
+
+    # 3. Ranker: flat tree arrays (native evaluator) + the model text (Booster)
+    model_path = os.path.join(artifact_dir, "lgbm_ranker.txt")
+    with open(model_path, "rb") as f:
+        model_text = f.read()
+    tree = TreeEnsemble.from_model_string(model_text.decode("utf-8"))
+    tree_arrays, tree_meta = tree.to_arrays()
+
+    arrays = {
+        **store.arrays(),
+        "article_ids": id_map.ids,
+        "cold_start_ids": cold_start_ids,
+        "cold_start_groups": cold_start_groups,
+        "model_text": np.frombuffer(model_text, dtype=np.uint8),
+    }
+    arrays.update({f"tree/{name}": value for name, value in tree_arrays.items()})
+
+    # 4. Visual index map (FAISS row -> article_id), if shipped
+    visual_path = os.path.join(artifact_dir, "visual_index_map.pkl")
+    if os.path.exists(visual_path):
+        with open(visual_path, "rb") as f:
+            arrays["visual_index_map"] = np.asarray(pickle.load(f), dtype=np.int64)
+
+    header = write_bundle(output_path, arrays, {"feature_order": LAYOUT.names, "tree": tree_meta,
+                                                   "source_fingerprint": sources})
+    size_mb = os.path.getsize(output_path) / 1e6
+    print(f"Bundle written: {output_path} ({size_mb:.1f} MB, version {header['artifact_version']})")
+    return output_path
+
+
+def _as_bytes(array):
+    return array.reshape(-1).view(np.uint8)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class SharedCacheBackend(ABC):
+    """
+    Interface for a cache shared between uvicorn workers (e.g. Redis/Memcached).
+    Values are JSON strings; implementations only need get/set with a TTL.
+    """
+    @abstractmethod
+    def get(self, key):
+        """The stored string, or None when missing or expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl_seconds):
+        """Stores `value` under `key` for `ttl_seconds`."""
+
+
+class InMemorySharedCache(SharedCacheBackend):
+    """Local stand-in for a shared cache (tests / single process)."""
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl_seconds)
+
+
+class RecommendationCache:
+    """
+    Bounded per-customer recommendation cache (LRU + TTL).
+
+    Entries are keyed by (customer_id_int, segment, artifact_version) and
+    remember the top_k they were computed with, so a top_k=5 request is
+    served from a cached top-12 list. The artifact version is part of the
+    key: when the engine's artifacts change, old entries can never be hit
+    again and the local store is cleared on the first request with the new
+    version. A per-customer index of the keys makes discard() O(1) per
+    customer; changes that touch every customer (the feature reference day
+    moving) call bump_epoch() instead, which drops the whole local store at
+    once and moves the shared keys to a new epoch.
+    """
+    def __init__(self, max_entries=100_000, ttl_seconds=300, shared=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._entries = OrderedDict()  # (customer_id, segment, version) -> (top_k, recs, expires)
+        self._keys_of = {}  # customer_id -> set of its keys in _entries
+        self._lock = threading.Lock()
+        self._version = None
+        self.epoch = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.discarded = 0
+
+    def get(self, customer_id, top_k, version, segment=None):
+        """Returns the cached top_k list, or None on a miss."""
+        with self._lock:
+            self._check_version(version)
+            key = (customer_id, segment, version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_k, recs, expires = entry
+                if expires < time.monotonic():
+                    self._remove(key)
+                    self.expirations += 1
+                elif cached_k >= top_k:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return recs[:top_k]
+
+        # Local miss: try the shared backend (other workers may have computed it)
+        if self.shared is not None:
+            raw = self.shared.get(self._shared_key(key))
+            if raw is not None:
+                payload = json.loads(raw)
+                if payload["top_k"] >= top_k:
+                    self._store(key, payload["top_k"], payload["recs"])
+                    with self._lock:
+                        self.hits += 1
+                        self.shared_hits += 1
+                    return payload["recs"][:top_k]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, customer_id, top_k, version, recs, segment=None):
+        """Stores the recommendations computed with `top_k`."""
+        with self._lock:
+            if self._version is None:
+                self._version = version
+            # A late result from a previous artifact version is not worth keeping
+            if version != self._version:
+                return
+        key = (customer_id, segment, version)
+        self._store(key, top_k, recs)
+        if self.shared is not None:
+            payload = json.dumps({"top_k": top_k, "recs": recs})
+            self.shared.set(self._shared_key(key), payload, self.ttl_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_of.clear()
+
+    def discard(self, customer_ids):
+        """
+        Drops the local entries (all segments) of customers whose features
+        just changed. Shared-backend entries expire with their TTL.
+        """
+        with self._lock:
+            for customer_id in customer_ids:
+                keys = self._keys_of.pop(int(customer_id), None)
+                if keys:
+                    for key in keys:
+                        del self._entries[key]
+                    self.discarded += len(keys)
+
+    def bump_epoch(self):
+        """
+        Invalidates every entry at once (e.g. a day roll changed every
+        customer's recency): the local store is swapped for an empty one and
+        shared keys carry the epoch, so entries of the old epoch are never hit.
+        """
+        with self._lock:
+            self.epoch += 1
+            self._entries = OrderedDict()
+            self._keys_of = {}
+            self.invalidations += 1
+
+    def stats(self):
+        """Hit/miss/eviction counters (reported on the health endpoint)."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "shared_hits": self.shared_hits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "discarded": self.discarded,
+            "epoch": self.epoch,
+            "artifact_version": self._version,
+        }
+
+    def _store(self, key, top_k, recs):
+        with self._lock:
+            current = self._entries.get(key)
+            # Never replace a longer list with a shorter one
+            if current is not None and current[0] > top_k and current[2] >= time.monotonic():
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (top_k, list(recs), time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            self._keys_of.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """Deletes one entry and its index slot (lock held)."""
+        del self._entries[key]
+        keys = self._keys_of.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_of[key[0]]
+
+    def _check_version(self, version):
+        """Drops every local entry when the artifact version changes (lock held)."""
+        if version != self._version:
+            if self._version is not None:
+                self._entries.clear()
+                self._keys_of.clear()
+                self.invalidations += 1
+            self._version = version
+
+    def _shared_key(self, key):
+        customer_id, segment, version = key
+        prefix = f"recs:{version}:{self.epoch}:{customer_id}"
+        return prefix if segment is None else f"{prefix}:{segment}"
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+
+# Built by scripts/build_copurchase_index.py: (n_articles, K) arrays by article_id_int
+NEIGHBOURS_FILENAME = "copurchase_neighbours.npy"
+WEIGHTS_FILENAME = "copurchase_weights.npy"
+
+
+class CoPurchaseIndex:
+    """
+    Item-to-item "bought together" neighbours.
+
+    neighbours[a] holds the top-K articles co-purchased with article_id_int a
+    (-1 padding) and weights[a] their cosine co-occurrence, best first. Both
+    are fixed-width and memory-mapped, so expanding a set of seed articles
+    is one fancy-indexing gather plus a grouped sum.
+    """
+    def __init__(self, neighbours, weights):
+        if neighbours.shape != weights.shape:
+            raise ValueError(f"Co-purchase neighbours {neighbours.shape} and weights {weights.shape} differ.")
+        self.neighbours = neighbours
+        self.weights = weights
+        print(f"   - Co-Purchase Index: {len(neighbours)} articles x {neighbours.shape[1]} neighbours.")
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir):
+        """Returns None when the index is not shipped."""
+        neighbours_path = os.path.join(artifact_dir, NEIGHBOURS_FILENAME)
+        weights_path = os.path.join(artifact_dir, WEIGHTS_FILENAME)
+        if not (os.path.exists(neighbours_path) and os.path.exists(weights_path)):
+            print(f"Warning: co-purchase neighbours not found in {artifact_dir}. Co-purchase candidates are disabled.")
+            return None
+        return cls(np.load(neighbours_path, mmap_mode='r'), np.load(weights_path, mmap_mode='r'))
+
+    @staticmethod
+    def build(basket_ids, article_ids, n_articles, k=20, min_count=2, chunk_size=2048):
+        """
+        Top-k co-purchase neighbours from (basket, article) pairs.
+
+        With X the binary basket x article matrix, C = X^T X counts the
+        baskets two articles share. C is computed `chunk_size` articles at a
+        time (one sparse product per chunk), scored as cosine
+        C_ij / sqrt(n_i * n_j), and cut to its top-k per row before the next
+        chunk, so memory is bounded by one chunk of C.
+        Returns (neighbours int32, weights float32), both (n_articles, k).
+        """
+        import scipy.sparse as sp
+
+        basket_ids = np.asarray(basket_ids, dtype=np.int64)
+        article_ids = np.asarray(article_ids, dtype=np.int64)
+        _, baskets = np.unique(basket_ids, return_inverse=True)
+        X = sp.csr_matrix((np.ones(len(baskets), dtype=np.float32), (baskets, article_ids)),
+                          shape=(int(baskets.max()) + 1 if len(baskets) else 0, n_articles))
+        X.data[:] = 1  # duplicate pairs count once
+        XT = X.T.tocsr()
+        counts = np.asarray(X.sum(axis=0)).ravel()
+
+        neighbours = np.full((n_articles, k), -1, dtype=np.int32)
+        weights = np.zeros((n_articles, k), dtype=np.float32)
+        for start in range(0, n_articles, chunk_size):
+            C = (XT[start:start + chunk_size] @ X).tocoo()
+            rows, cols, shared = C.row, C.col, C.data
+            keep = (cols != rows + start) & (shared >= min_count)
+            rows, cols, shared = rows[keep], cols[keep], shared[keep]
+            score = shared / np.sqrt(counts[rows + start] * counts[cols])
+
+            # Top-k per row: sort by (row, -score), rank inside each row
+            order = np.lexsort((cols, -score, rows))
+            rows, cols, score = rows[order], cols[order], score[order]
+            row_start = np.searchsorted(rows, rows, side='left')
+            rank = np.arange(len(rows)) - row_start
+            top = rank < k
+            neighbours[rows[top] + start, rank[top]] = cols[top]
+            weights[rows[top] + start, rank[top]] = score[top]
+        return neighbours, weights
+
+    def expand_many(self, seed_lists, n=12):
+        """
+        Candidate expansion for several users at once. Each user's seeds
+        (article_id_int arrays, e.g. cart or recent views) are gathered in
+        one go; a candidate's weight is summed over the seeds that point to
+        it, and the seeds themselves are excluded.
+        Returns (article_ids, weights), both (n_users, n), best first, -1 padding.
+        """
+        owner = np.repeat(np.arange(len(seed_lists)), [len(s) for s in seed_lists])
+        seeds = np.concatenate([np.asarray(s, dtype=np.int64) for s in seed_lists]) if len(owner) else \
+            np.empty(0, dtype=np.int64)
+        valid = (seeds >= 0) & (seeds < len(self.neighbours))
+        owner, seeds = owner[valid], seeds[valid]
+
+        article_ids = np.full((len(seed_lists), n), -1, dtype=np.int64)
+        scores = np.zeros((len(seed_lists), n), dtype=np.float32)
+        if len(seeds) == 0 or n == 0:
+            return article_ids, scores
+
+        # One gather for every distinct seed of every user
+        span = len(self.neighbours)
+        pairs = np.unique(owner * span + seeds)
+        order = np.argsort(pairs % span, kind='stable')  # sequential reads from the memory map
+        owner, seeds = pairs[order] // span, pairs[order] % span
+        found = np.asarray(self.neighbours[seeds], dtype=np.int64)
+        found_weights = np.asarray(self.weights[seeds], dtype=np.float32)
+        found_owner = np.broadcast_to(owner[:, None], found.shape)
+        keep = found >= 0
+        found, found_weights, found_owner = found[keep], found_weights[keep], found_owner[keep]
+
+        # Sum the weights per (user, article), then drop each user's own seeds
+        keys, inverse = np.unique(found_owner * span + found, return_inverse=True)
+        totals = np.bincount(inverse, weights=found_weights)
+        own = np.isin(keys, owner * span + seeds)
+        keys, totals = keys[~own], totals[~own]
+
+        users, items = keys // span, keys % span
+        order = np.lexsort((items, -totals, users))
+        users, items, totals = users[order], items[order], totals[order]
+        rank = np.arange(len(users)) - np.searchsorted(users, users, side='left')
+        top = rank < n
+        article_ids[users[top], rank[top]] = items[top]
+        scores[users[top], rank[top]] = totals[top]
+        return article_ids, scores
@@ -0,0 +1,276 @@
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from inference import compute_artifact_version
+
+logger = logging.getLogger(__name__)
+
+
+class ReloadInProgress(RuntimeError):
+    pass
+
+
+class EngineGeneration:
+    """One loaded RecSysEngine plus the bookkeeping needed to retire it safely."""
+    def __init__(self, engine, artifact_dir, load_seconds, warmup_seconds):
+        self.engine = engine
+        self.artifact_dir = artifact_dir
+        self.artifact_version = engine.artifact_version
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self._drained = threading.Condition()
+
+    def enter(self):
+        with self._drained:
+            self.in_flight += 1
+
+    def exit(self):
+        with self._drained:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._drained.notify_all()
+
+    def wait_drained(self, timeout):
+        """Blocks until no request is using this generation (or the timeout expires)."""
+        with self._drained:
+            return self._drained.wait_for(lambda: self.in_flight == 0, timeout)
+
+    def info(self):
+        return {
+            "artifact_version": self.artifact_version,
+            "artifact_dir": self.artifact_dir,
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": round(self.warmup_seconds, 3),
+            "loaded_at": self.loaded_at,
+            "in_flight": self.in_flight,
+        }
+
+
+class EngineManager:
+    """
+    Owns the active RecSysEngine and swaps in new ones without downtime.
+
+    A reload:
+    1. builds a new engine in the caller's (background) thread
+    2. warms it up with a sample of real requests
+    3. swaps it in atomically: new requests immediately use the new engine
+    4. waits for in-flight requests on the old engine, then releases it
+
+    Reloads are serialised and the old generation is released before the
+    next one may start, so at most two engines are ever held in memory: an
+    old generation still busy after `drain_timeout` stays tracked, and the
+    next reload first waits for it (ReloadInProgress if it is still busy).
+    Request handlers use `with manager.acquire() as engine:` so a request
+    runs start to finish on one engine even if a swap happens meanwhile.
+    """
+    def __init__(self, engine_factory, artifact_dir, warmup_users=32, drain_timeout=30.0):
+        self.engine_factory = engine_factory
+        self.artifact_dir = artifact_dir
+        self.warmup_users = warmup_users
+        self.drain_timeout = drain_timeout
+
+        self._current = None
+        # Previous generation that did not drain in time (closed by the next reload)
+        self._retiring = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+        # Reload history (reported on the health endpoint)
+        self.generation = 0
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_reload = None
+
+    # --- Request path ---
+
+    @property
+    def engine(self):
+        current = self._current
+        return current.engine if current is not None else None
+
+    @contextmanager
+    def acquire(self):
+        """Pins the active engine for the duration of one request."""
+        with self._swap_lock:
+            current = self._current
+            if current is None:
+                raise RuntimeError("No engine loaded.")
+            current.enter()
+        try:
+            yield current.engine
+        finally:
+            current.exit()
+
+    def recommend_many(self, customer_ids, top_k=12, chunk_size=None, segments=None, recent_items=None,
+                       predict_threads=0):
+        """
+        recommend_many on the active engine (used by the micro-batcher).
+        Returns (artifact_version, results): the version of the generation
+        that actually scored them, which may be newer than the one active
+        when the requests were queued.
+        """
+        with self.acquire() as engine:
+            return engine.artifact_version, engine.recommend_many(customer_ids, top_k=top_k, chunk_size=chunk_size,
+                                                                  segments=segments, recent_items=recent_items,
+                                                                  predict_threads=predict_threads)
+
+    # --- Loading ---
+
+    def load(self, artifact_dir=None, force=True):
+        """
+        Builds, warms up and activates an engine. Blocking: call it from a
+        background thread when serving traffic.
+        Returns a summary dict; raises if the new engine fails to load
+        (the current engine then stays active).
+        """
+        artifact_dir = artifact_dir or self.artifact_dir
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("A reload is already running.")
+        try:
+            return self._load_locked(artifact_dir, force)
+        finally:
+            self._reload_lock.release()
+
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    def _load_locked(self, artifact_dir, force):
+        if not self._release_retiring():
+            error = (f"{self._retiring.in_flight} requests still running on the previous "
+                     f"version {self._retiring.artifact_version}.")
+            self.last_reload = {"status": "refused", "error": error, "finished_at": time.time()}
+            raise ReloadInProgress(error)
+        started = time.time()
+        engine = None
+        try:
+            # 1. Build
+            t0 = time.perf_counter()
+            engine = self.engine_factory(artifact_dir)
+            load_seconds = time.perf_counter() - t0
+
+            current = self._current
+            if not force and current is not None and engine.artifact_version == current.artifact_version:
+                engine.close()
+                self.last_reload = {"status": "unchanged", "artifact_version": engine.artifact_version,
+                                    "started_at": started, "finished_at": time.time()}
+                logger.info(f"Reload skipped: artifacts unchanged ({engine.artifact_version}).")
+                return self.last_reload
+
+            # 2. Warm up
+            t0 = time.perf_counter()
+            warmed = engine.warm_up(self.warmup_users) if self.warmup_users else 0
+            warmup_seconds = time.perf_counter() - t0
+        except Exception as e:
+            if engine is not None:
+                engine.close()
+            self.failed_reloads += 1
+            self.last_reload = {"status": "failed", "error": str(e), "started_at": started, "finished_at": time.time()}
+            logger.error(f"Reload failed, keeping the current engine: {e}")
+            raise
+
+        # 3. Swap
+        new = EngineGeneration(engine, artifact_dir, load_seconds, warmup_seconds)
+        with self._swap_lock:
+            old, self._current = self._current, new
+            self.artifact_dir = artifact_dir
+            self.generation += 1
+        if old is not None:
+            self.reloads += 1
+        logger.info(f"Engine generation {self.generation} active: version {new.artifact_version} "
+                    f"(load {load_seconds:.2f}s, warm-up {warmup_seconds:.2f}s on {warmed} users).")
+
+        # 4. Drain and release the previous generation
+        drained = True
+        if old is not None:
+            self._retiring = old
+            drained = self._release_retiring()
+            if not drained:
+                logger.warning(f"{old.in_flight} requests still running on version {old.artifact_version} "
+                               f"after {self.drain_timeout}s; the next reload waits for them.")
+            old = None
+
+        self.last_reload = {"status": "ok", "artifact_version": new.artifact_version, "drained": drained,
+                            "started_at": started, "finished_at": time.time()}
+        return self.last_reload
+
+    def _release_retiring(self):
+        """
+        Waits up to drain_timeout for the previous generation's requests,
+        then closes it. Returns False (and keeps it tracked) if it is still busy.
+        """
+        old = self._retiring
+        if old is None:
+            return True
+        if not old.wait_drained(self.drain_timeout):
+            return False
+        old.engine.close()
+        old.engine = None
+        self._retiring = None
+        gc.collect()
+        return True
+
+    def stats(self):
+        current, retiring = self._current, self._retiring
+        return {
+            "generation": self.generation,
+            "active": current.info() if current is not None else None,
+            "retiring": retiring.info() if retiring is not None else None,
+            "reloading": self.reloading,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_reload": self.last_reload,
+        }
+
+
+class ArtifactWatcher:
+    """
+    Polls the artifact directory and triggers a reload when its fingerprint
+    (file names, sizes, mtimes) changes. A change must be stable for one
+    extra poll, so a reload never starts on a half-copied file.
+    """
+    def __init__(self, manager, interval_seconds=30.0):
+        self.manager = manager
+        self.interval = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = None
+
+    def start(self):
+        self._seen = compute_artifact_version(self.manager.artifact_dir)
+        self._thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            fingerprint = compute_artifact_version(self.manager.artifact_dir)
+            if fingerprint == self._seen:
+                pending = None
+                continue
+            if fingerprint != pending:
+                # Changed since the last poll: wait until it settles
+                pending = fingerprint
+                continue
+
+            logger.info(f"Artifact change detected in {self.manager.artifact_dir}, reloading.")
+            try:
+                self.manager.load(force=False)
+                self._seen = fingerprint
+            except ReloadInProgress:
+                continue
+            except Exception:
+                # Broken artifacts: don't retry until they change again
+                self._seen = fingerprint
+            pending = None
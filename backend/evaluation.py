@@ -0,0 +1,228 @@
+import time
+import numpy as np
+
+from inference import SOURCE_ALS, SOURCE_BESTSELLER, SOURCE_REPURCHASE, SOURCE_VISUAL
+from recent_purchases import isin_rows
+
+# Hit attribution labels: the ranker's `source` codes, plus the cold start lists
+# (users without features never reach the ranker)
+SOURCE_NAMES = {SOURCE_ALS: "als", SOURCE_BESTSELLER: "bestseller", SOURCE_REPURCHASE: "repurchase",
+                SOURCE_VISUAL: "visual"}
+COLD_START = "cold_start"
+
+
+def _transactions_source(paths):
+    from feature_db import sql_string
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    reader = "read_parquet" if all(p.endswith(".parquet") for p in paths) else "read_csv_auto"
+    return f"{reader}([{', '.join(sql_string(p) for p in paths)}])"
+
+
+def last_window_start(paths, days=7, con=None):
+    """First day (YYYY-MM-DD) of the last `days` days of the transaction files."""
+    import duckdb
+    con = con or duckdb.connect(database=':memory:')
+    last = con.execute(f"SELECT MAX(CAST(t_dat AS DATE)) FROM {_transactions_source(paths)}").fetchone()[0]
+    return str(np.datetime64(last, 'D') - np.timedelta64(int(days) - 1, 'D'))
+
+
+def holdout_batches(paths, start_date, days=7, chunk_size=10_000, sample=1.0, con=None):
+    """
+    Ground truth of the holdout window [start_date, start_date + days),
+    streamed by customer. Reads transaction files (parquet or CSV with
+    t_dat, customer_id_int, article_id_int) through DuckDB; `sample` keeps
+    a deterministic share of the customers (hash of the id).
+    Yields (customer_ids (n,), truth (n, width) distinct articles padded
+    with -1), `chunk_size` customers at a time in customer order, so only
+    one chunk is ever materialised in NumPy.
+    """
+    import duckdb
+    con = con or duckdb.connect(database=':memory:')
+    sampled = f"AND hash(customer_id_int) % 10000 < {int(round(sample * 10000))}" if sample < 1.0 else ""
+    reader = con.execute(f"""
+        SELECT customer_id_int, list(DISTINCT article_id_int) AS articles
+        FROM {_transactions_source(paths)}
+        WHERE CAST(t_dat AS DATE) >= CAST(? AS DATE)
+          AND CAST(t_dat AS DATE) < CAST(? AS DATE) + INTERVAL {int(days)} DAY
+          AND customer_id_int >= 0 AND article_id_int >= 0 {sampled}
+        GROUP BY customer_id_int
+        ORDER BY customer_id_int
+    """, [str(start_date), str(start_date)]).fetch_record_batch(chunk_size)
+
+    for batch in reader:
+        customer_ids = batch.column(0).to_numpy().astype(np.int64)
+        # Arrow list column -> padded matrix without a Python loop
+        articles = batch.column(1)
+        offsets = articles.offsets.to_numpy()
+        values = articles.values.to_numpy().astype(np.int64)[offsets[0]:offsets[-1]]
+        lengths = np.diff(offsets)
+        truth = np.full((len(customer_ids), int(lengths.max(initial=0))), -1, dtype=np.int64)
+        rows = np.repeat(np.arange(len(customer_ids)), lengths)
+        truth[rows, np.arange(len(values)) - np.repeat(offsets[:-1] - offsets[0], lengths)] = values
+        yield customer_ids, truth
+
+
+def average_precision_at_k(hits, n_truth, k=12):
+    """
+    AP@k per user from a (n_users, >= k) hit matrix in rank order (the H&M
+    competition metric): mean of precision@i over the hit ranks i <= k,
+    divided by min(#purchased, k). Users without purchases get 0.
+    """
+    hits = hits[:, :k]
+    precision = np.cumsum(hits, axis=1) / np.arange(1, hits.shape[1] + 1)
+    denominator = np.minimum(n_truth, k)
+    return np.where(denominator > 0, (precision * hits).sum(axis=1) / np.maximum(denominator, 1), 0.0)
+
+
+class OfflineEvaluator:
+    """
+    Replays a holdout window through the engine's serving path and scores it.
+
+    Known users go through RecSysEngine.score_chunk (the candidates, feature
+    matrix, predict, already-bought rules and grouped top-k of
+    recommend_many); users without features get the engine's cold start
+    lists. Per chunk, all metrics are grouped NumPy operations on the
+    (n_users, k) ranked ids against the padded ground truth (row-wise
+    isin via one searchsorted, no sorts of the candidate rows):
+    - MAP@k (the competition metric) over every holdout user
+    - recall@k for each k in `recall_ks` and candidate recall (any
+      candidate), as hits / purchases (the notebook's recall)
+    - hits by the `source` of the ranked row (als / bestseller /
+      repurchase / visual / cold start), at k and among the candidates
+    Memory is bounded by the chunk size; accumulators are a few counters.
+    """
+    def __init__(self, engine, k=12, recall_ks=(12,), chunk_size=None):
+        self.engine = engine
+        self.k = k
+        self.recall_ks = sorted(set(recall_ks) | {k})
+        self.depth = max(self.recall_ks)
+        self.chunk_size = chunk_size or engine.batch_chunk_size
+        self.source_col = engine.layout.index['source']
+        self.labels = [SOURCE_NAMES[code] for code in sorted(SOURCE_NAMES)] + [COLD_START]
+        self.reset()
+
+    def reset(self):
+        self.totals = {path: {"users": 0, "purchases": 0, "ap_sum": 0.0, "candidates": 0, "candidate_hits": 0,
+                              **{f"hits_at_{k}": 0 for k in self.recall_ks}}
+                       for path in ("known", "cold")}
+        self.hits_by_source = {label: 0 for label in self.labels}
+        self.candidate_hits_by_source = {label: 0 for label in self.labels}
+        self.scoring_seconds = 0.0
+        self.metric_seconds = 0.0
+
+    def evaluate(self, batches, progress=None):
+        """
+        Consumes (customer_ids, truth) chunks (see holdout_batches) and
+        returns the report. `progress(users_done, seconds)` is called
+        after every chunk.
+        """
+        start = time.perf_counter()
+        for customer_ids, truth in batches:
+            user_rows, found = self.engine.features.get_users(customer_ids)
+            known = np.flatnonzero(found)
+            for offset in range(0, len(known), self.chunk_size):
+                idx = known[offset:offset + self.chunk_size]
+                self._known_chunk(customer_ids[idx], user_rows[idx], truth[idx])
+            cold = np.flatnonzero(~found)
+            if len(cold):
+                self._cold_chunk(customer_ids[cold], truth[cold])
+            if progress is not None:
+                progress(sum(t["users"] for t in self.totals.values()), time.perf_counter() - start)
+        return self.report(time.perf_counter() - start)
+
+    def _known_chunk(self, customer_ids, user_rows, truth):
+        t0 = time.perf_counter()
+        article_ids, X, top_idx = self.engine.score_chunk(customer_ids.tolist(), user_rows,
+                                                          [None] * len(customer_ids), self.depth)
+        if top_idx is None:
+            self.scoring_seconds += time.perf_counter() - t0
+            self._accumulate("known", np.full((len(customer_ids), 0), -1), truth, None)
+            return
+        # X is the thread's reusable buffer: keep only the source codes
+        sources = X[:, self.source_col].astype(np.int8).reshape(article_ids.shape)
+        # -1 slots (fewer scorable candidates than depth) never hit
+        top_ids = self.engine._ranked_ids(article_ids, top_idx)
+        top_sources = np.take_along_axis(sources, np.maximum(top_idx, 0), axis=1)
+        t1 = time.perf_counter()
+        self.scoring_seconds += t1 - t0
+
+        self._accumulate("known", top_ids, truth, top_sources)
+        candidate_hits = isin_rows(article_ids, truth)
+        totals = self.totals["known"]
+        totals["candidates"] += int((article_ids >= 0).sum())
+        totals["candidate_hits"] += int(candidate_hits.sum())
+        self._count_sources(self.candidate_hits_by_source, sources[candidate_hits])
+        self.metric_seconds += time.perf_counter() - t1
+
+    def _cold_chunk(self, customer_ids, truth):
+        t0 = time.perf_counter()
+        lists = self.engine._cold_start_many(customer_ids.tolist(), self.depth, [None] * len(customer_ids),
+                                             [None] * len(customer_ids))
+        top_ids = np.full((len(customer_ids), self.depth), -1, dtype=np.int64)
+        for u, recs in enumerate(lists):
+            top_ids[u, :len(recs)] = self.engine.id_map.encode(recs)
+        t1 = time.perf_counter()
+        self.scoring_seconds += t1 - t0
+
+        self._accumulate("cold", top_ids, truth, None)
+        totals = self.totals["cold"]
+        hits = isin_rows(top_ids, truth)
+        totals["candidates"] += int((top_ids >= 0).sum())
+        totals["candidate_hits"] += int(hits.sum())
+        self.candidate_hits_by_source[COLD_START] += int(hits.sum())
+        self.metric_seconds += time.perf_counter() - t1
+
+    def _accumulate(self, path, top_ids, truth, top_sources):
+        """MAP / recall@k / hit attribution of one chunk's ranked ids (n_users, depth)."""
+        hits = isin_rows(top_ids, truth)
+        n_truth = (truth >= 0).sum(axis=1)
+        totals = self.totals[path]
+        totals["users"] += len(truth)
+        totals["purchases"] += int(n_truth.sum())
+        if hits.shape[1] == 0:
+            return
+        totals["ap_sum"] += float(average_precision_at_k(hits, n_truth, self.k).sum())
+        for k in self.recall_ks:
+            totals[f"hits_at_{k}"] += int(hits[:, :k].sum())
+        at_k = hits[:, :self.k]
+        if top_sources is None:
+            self.hits_by_source[COLD_START] += int(at_k.sum())
+        else:
+            self._count_sources(self.hits_by_source, top_sources[:, :self.k][at_k])
+
+    def _count_sources(self, counter, codes):
+        counts = np.bincount(codes.astype(np.int64), minlength=len(SOURCE_NAMES))
+        for code, label in SOURCE_NAMES.items():
+            counter[label] += int(counts[code])
+
+    def report(self, seconds):
+        """Quality per user path and overall, with the evaluation throughput."""
+        def summary(totals):
+            users, purchases = totals["users"], totals["purchases"]
+            result = {
+                "users": users,
+                "purchases": purchases,
+                "map": round(totals["ap_sum"] / users, 6) if users else 0.0,
+                "candidate_recall": round(totals["candidate_hits"] / purchases, 6) if purchases else 0.0,
+                "candidates_per_user": round(totals["candidates"] / users, 1) if users else 0.0,
+            }
+            for k in self.recall_ks:
+                result[f"recall_at_{k}"] = round(totals[f"hits_at_{k}"] / purchases, 6) if purchases else 0.0
+            return result
+
+        overall = {key: sum(t[key] for t in self.totals.values()) for key in self.totals["known"]}
+        users = overall["users"]
+        return {
+            "k": self.k,
+            "all": {
+                **summary(overall),
+                "hits_by_source": dict(self.hits_by_source),
+                "candidate_hits_by_source": dict(self.candidate_hits_by_source),
+                "seconds": round(seconds, 3),
+                "scoring_seconds": round(self.scoring_seconds, 3),
+                "metric_seconds": round(self.metric_seconds, 3),
+                "users_per_second": round(users / seconds, 1) if seconds else 0.0,
+            },
+            "known": summary(self.totals["known"]),
+            "cold": summary(self.totals["cold"]),
+        }
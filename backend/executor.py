@@ -0,0 +1,116 @@
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(RuntimeError):
+    """Raised instead of queueing when the executor is at capacity (HTTP 429)."""
+
+
+class InferenceTimeout(RuntimeError):
+    """Raised when a call did not finish within its timeout (HTTP 503)."""
+
+
+def split_cores(workers=0, threads_per_call=0, cpu_count=None):
+    """
+    Splits the cores between concurrent inference calls and the OpenMP
+    threads of each LightGBM predict: workers x threads_per_call ~= cores.
+    0 means auto (one worker per core; then the cores left per worker).
+    Returns (workers, threads_per_call).
+    """
+    cores = cpu_count or os.cpu_count() or 1
+    if workers <= 0:
+        workers = max(1, cores // threads_per_call) if threads_per_call > 0 else cores
+    if threads_per_call <= 0:
+        threads_per_call = max(1, cores // workers)
+    return workers, threads_per_call
+
+
+class InferenceExecutor:
+    """
+    Explicitly sized thread pool for engine calls, with admission control.
+
+    At most `workers` calls run at once and `max_queue` more may wait; any
+    call beyond that is rejected immediately with Overloaded rather than
+    queued behind work that would make it miss its deadline anyway. A call
+    that exceeds its timeout raises InferenceTimeout: if it was still
+    queued it is cancelled, if it is already running its slot is held
+    until the thread finishes, so admission always reflects real load.
+    Context variables (request traces) are carried into the worker thread.
+    """
+    def __init__(self, workers, max_queue=64, default_timeout=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+
+        # Counters (reported on the health endpoint and /metrics)
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failed = 0
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Runs fn(*args, **kwargs) on an inference thread and awaits its result."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"Inference queue full ({self._pending} calls in flight).")
+            self._pending += 1
+
+        context = contextvars.copy_context()
+        try:
+            future = self._pool.submit(context.run, self._call, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise InferenceTimeout(f"Inference did not finish within {timeout}s.") from None
+
+    def _call(self, fn):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future is None or future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "failed": self.failed,
+            }
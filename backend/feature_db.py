@@ -0,0 +1,150 @@
+import os
+import json
+import logging
+import duckdb
+import numpy as np
+
+from bundle import source_fingerprint
+from feature_store import LAYOUT
+
+logger = logging.getLogger(__name__)
+
+# Indexed feature database for the low-memory "duckdb" backend.
+#
+# The parquet views of the duckdb backend are filtered on every request: a
+# point lookup reads the customer_id_int column of every row group whose
+# min/max may contain the id (all of them for an unsorted file), so its cost
+# grows with the number of customers. The compiled database stores the same
+# tables in DuckDB's own format, sorted by key and with an ART index
+# (PRIMARY KEY), so an equality or IN (?, ...) lookup is an index probe
+# whatever the table size. Only the pages touched are read; nothing is
+# loaded up front, so memory stays as low as with the parquet views.
+FEATURE_DB_FILENAME = "features.duckdb"
+# 2: candidates.pool_position
+FEATURE_DB_FORMAT_VERSION = 2
+FEATURE_DB_SOURCES = ("features_user.parquet", "features_item.parquet", "candidates_pool.parquet")
+
+# Catalog name of the attached database on the engine's connection
+_ALIAS = "feature_db"
+
+_SQL_TYPES = {np.dtype(np.float32): "FLOAT", np.dtype(np.int16): "SMALLINT", np.dtype(np.int8): "TINYINT"}
+
+
+def sql_string(value):
+    """`value` as a SQL string literal (for statements that take no parameters, e.g. ATTACH)."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _columns(layout, block):
+    return ", ".join(f"{spec.name} {_SQL_TYPES[np.dtype(spec.dtype)]}"
+                     for spec in layout.specs if spec.block == block)
+
+
+def compile_feature_db(artifact_dir, path=None, layout=LAYOUT):
+    """
+    Compiles the feature parquet files into an indexed DuckDB database:
+    1. users / items: the layout's columns in their storage dtypes, sorted
+       by key, with a PRIMARY KEY (ART index) on customer_id_int / article_id_int
+    2. candidates: the pool's article ids with their pool_position (row
+       number in candidates_pool.parquet), which fixes the pool order
+    3. meta: format version, source fingerprint and feature order, checked
+       when the engine attaches the file
+    The database is written next to the target and renamed into place.
+    Returns the path.
+    """
+    path = path or os.path.join(artifact_dir, FEATURE_DB_FILENAME)
+    # Per process: several serve.py workers may recompile after the same snapshot
+    tmp_path = path + f".{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    source = {name: os.path.join(artifact_dir, name) for name in FEATURE_DB_SOURCES}
+    missing = [p for p in source.values() if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Cannot compile the feature database, missing {missing}")
+
+    user_names = ", ".join(layout.names_in('user'))
+    item_names = ", ".join(layout.names_in('item'))
+    con = duckdb.connect(tmp_path)
+    try:
+        con.execute(f"CREATE TABLE users (customer_id_int BIGINT PRIMARY KEY, {_columns(layout, 'user')})")
+        con.execute(f"""
+            INSERT INTO users
+            SELECT customer_id_int, {user_names} FROM read_parquet(?) ORDER BY customer_id_int
+        """, [source["features_user.parquet"]])
+        con.execute(f"CREATE TABLE items (article_id_int BIGINT PRIMARY KEY, {_columns(layout, 'item')})")
+        con.execute(f"""
+            INSERT INTO items
+            SELECT article_id_int, {item_names} FROM read_parquet(?) ORDER BY article_id_int
+        """, [source["features_item.parquet"]])
+        con.execute("""
+            CREATE TABLE candidates AS
+            SELECT article_id_int, file_row_number AS pool_position
+            FROM read_parquet(?, file_row_number = true) ORDER BY file_row_number
+        """, [source["candidates_pool.parquet"]])
+        meta = {"format_version": FEATURE_DB_FORMAT_VERSION, "feature_order": layout.names,
+                "source_fingerprint": source_fingerprint(artifact_dir, FEATURE_DB_SOURCES)}
+        con.execute("CREATE TABLE meta (meta VARCHAR)")
+        con.execute("INSERT INTO meta VALUES (?)", [json.dumps(meta)])
+        counts = [con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("users", "items", "candidates")]
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    print(f"Feature DB {path}: {counts[0]} users, {counts[1]} items, {counts[2]} pool articles "
+          f"({os.path.getsize(path) / 1e6:.1f} MB)")
+    return path
+
+
+def _check_meta(meta_json, path, artifact_dir, layout):
+    """Raises ValueError when the database does not match this code's format / layout or the parquet files."""
+    meta = json.loads(meta_json)
+    if meta.get("format_version") != FEATURE_DB_FORMAT_VERSION or meta.get("feature_order") != layout.names:
+        raise ValueError(f"{path} was compiled for another format or feature layout.")
+    if meta.get("source_fingerprint") != source_fingerprint(artifact_dir, FEATURE_DB_SOURCES):
+        raise ValueError(f"{path} is older than the feature parquet files.")
+
+
+def feature_db_is_fresh(artifact_dir, layout=LAYOUT):
+    """True when artifacts/features.duckdb exists and would be attached."""
+    path = os.path.join(artifact_dir, FEATURE_DB_FILENAME)
+    if not os.path.exists(path):
+        return False
+    try:
+        con = duckdb.connect(path, read_only=True)
+        try:
+            _check_meta(con.execute("SELECT meta FROM meta").fetchone()[0], path, artifact_dir, layout)
+        finally:
+            con.close()
+    except (duckdb.Error, ValueError, TypeError):
+        return False
+    return True
+
+
+def attach_feature_db(con, artifact_dir, layout=LAYOUT):
+    """
+    Attaches artifacts/features.duckdb read-only to `con` and points the
+    users / items / candidates views at its indexed tables. Returns False
+    (the parquet views stay in place) when the file is missing, stale
+    (older than the parquet files, e.g. after a streaming snapshot) or was
+    compiled for another layout; that fallback scans the parquet files on
+    every lookup, so it is logged as a warning.
+    Several processes may attach the same file read-only.
+    """
+    path = os.path.join(artifact_dir, FEATURE_DB_FILENAME)
+    if not os.path.exists(path):
+        return False
+    try:
+        con.execute(f"ATTACH {sql_string(path)} AS {_ALIAS} (READ_ONLY)")
+        _check_meta(con.execute(f"SELECT meta FROM {_ALIAS}.meta").fetchone()[0], path, artifact_dir, layout)
+    except (duckdb.Error, ValueError, TypeError) as e:
+        logger.warning(f"{e} Falling back to the unindexed parquet views (a scan per lookup) until "
+                       f"scripts/compile_artifacts.py --feature-db recompiles it.")
+        try:
+            con.execute(f"DETACH {_ALIAS}")
+        except duckdb.Error:
+            pass
+        return False
+    for table in ("users", "items", "candidates"):
+        con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM {_ALIAS}.{table}")
+    print(f"   - Indexed Feature DB Attached: {path}")
+    return True
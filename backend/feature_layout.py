@@ -0,0 +1,111 @@
+import re
+import threading
+from collections import namedtuple
+import numpy as np
+
+# One ranker feature: where its value comes from and how it is stored.
+# - block "candidate": set per candidate row by candidate generation (default = pool value)
+# - block "user" / "item": copied from the user / item feature tables
+# - block "derived": computed while assembling the matrix (price_diff)
+# `dtype` is the storage dtype of the feature tables (and the bundle); the
+# ranker input itself is always one float32 matrix.
+FeatureSpec = namedtuple("FeatureSpec", ["name", "block", "dtype", "default"])
+
+# The 14 ranker features, in the exact order the LightGBM model was trained with
+RANKER_FEATURES = (
+    FeatureSpec('source', 'candidate', 'int8', 1),  # 1 = bestseller pool
+    FeatureSpec('als_score', 'candidate', 'float32', -1),
+    FeatureSpec('visual_score', 'candidate', 'float32', -1),
+    FeatureSpec('user_avg_price', 'user', 'float32', 0),
+    FeatureSpec('user_price_std', 'user', 'float32', 0),
+    FeatureSpec('user_total_purchases', 'user', 'float32', 0),
+    FeatureSpec('user_tenure_days', 'user', 'float32', 0),
+    FeatureSpec('days_since_last_buy', 'user', 'float32', 0),
+    FeatureSpec('item_avg_price', 'item', 'float32', 0),
+    FeatureSpec('item_total_sales', 'item', 'float32', 0),
+    FeatureSpec('product_group', 'item', 'int16', 0),
+    FeatureSpec('index_group', 'item', 'int16', 0),
+    FeatureSpec('garment_group', 'item', 'int16', 0),
+    FeatureSpec('price_diff', 'derived', 'float32', 0),
+)
+
+# Ranker input dtype (LightGBM reads float32 matrices without converting them)
+MATRIX_DTYPE = np.float32
+
+# LightGBM's names for models trained on unnamed columns
+_DEFAULT_NAME = re.compile(r"^Column_\d+$")
+
+
+class FeatureLayout:
+    """
+    Column layout of the ranker input, built from a declarative schema.
+
+    Gives each block's columns (names, positions in the matrix, storage
+    dtypes) and the default row every candidate starts from, so the
+    feature stores fill a matrix by block instead of by name.
+    """
+    def __init__(self, specs=RANKER_FEATURES):
+        self.specs = tuple(specs)
+        self.names = [spec.name for spec in self.specs]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError("Duplicate feature names in the layout.")
+
+        # Default values of a candidate row (user/item/derived columns are always overwritten)
+        self.defaults = np.array([spec.default for spec in self.specs], dtype=MATRIX_DTYPE)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def names_in(self, block, dtype=None):
+        """Feature names of a block (optionally only those stored as `dtype`), in matrix order."""
+        return [spec.name for spec in self.specs
+                if spec.block == block and (dtype is None or np.dtype(spec.dtype) == np.dtype(dtype))]
+
+    def columns(self, block, dtype=None):
+        """Matrix column positions of `names_in(block, dtype)`."""
+        return [self.index[name] for name in self.names_in(block, dtype)]
+
+    def storage_dtypes(self, block):
+        """Distinct storage dtypes used by a block, in first-use order."""
+        dtypes = []
+        for spec in self.specs:
+            if spec.block == block and np.dtype(spec.dtype) not in dtypes:
+                dtypes.append(np.dtype(spec.dtype))
+        return dtypes
+
+    def validate(self, model_feature_names):
+        """
+        Checks the layout against the ranker's feature names (in order).
+        Raises ValueError on a mismatch; models trained on unnamed columns
+        (Column_0, ...) are only checked for the feature count.
+        """
+        names = list(model_feature_names)
+        if len(names) != len(self.names):
+            raise ValueError(f"Ranker expects {len(names)} features, the feature layout has {len(self.names)}.")
+        if all(_DEFAULT_NAME.match(name) for name in names):
+            return
+        if names != self.names:
+            diff = [f"{i}: model '{m}' != layout '{l}'" for i, (m, l) in enumerate(zip(names, self.names)) if m != l]
+            raise ValueError("Ranker feature names do not match the feature layout (" + ", ".join(diff) + ").")
+
+
+class FeatureBuffer:
+    """
+    Reusable, C-contiguous float32 ranker input, one per thread.
+
+    take(n) returns the first n rows of the calling thread's buffer, which
+    grows (doubling) when a larger matrix is needed and is reused by the
+    next call on that thread. The returned matrix is only valid until the
+    same thread asks for another one, so it must not be kept past predict.
+    """
+    def __init__(self, n_features):
+        self.n_features = n_features
+        self._local = threading.local()
+
+    def take(self, n_rows):
+        array = getattr(self._local, "array", None)
+        if array is None or len(array) < n_rows:
+            capacity = max(n_rows, 2 * len(array)) if array is not None else n_rows
+            array = self._local.array = np.empty((capacity, self.n_features), dtype=MATRIX_DTYPE)
+        return array[:n_rows]
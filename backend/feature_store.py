@@ -0,0 +1,461 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from feature_layout import FeatureLayout, FeatureBuffer, MATRIX_DTYPE
+
+# The ranker's feature layout (schema: feature_layout.RANKER_FEATURES)
+LAYOUT = FeatureLayout()
+
+# The exact feature order expected by LightGBM (CRITICAL)
+FEATURE_ORDER = LAYOUT.names
+
+# Column groups as they appear in the feature parquet files
+USER_FEATURES = LAYOUT.names_in('user')
+ITEM_FEATURES = LAYOUT.names_in('item')
+
+# Ids per parameterised IN (?, ...) lookup of the DuckDB store (longer lists are split)
+MAX_LOOKUP_IDS = 1024
+
+
+def _load_pool_items(artifact_dir, columns):
+    """Candidate pool joined with the given item feature columns (inner join, pool order kept)."""
+    pool = pd.read_parquet(os.path.join(artifact_dir, "candidates_pool.parquet"), columns=['article_id_int'])
+    items = pd.read_parquet(os.path.join(artifact_dir, "features_item.parquet"), columns=['article_id_int'] + columns)
+    return pool.merge(items, on='article_id_int', how='inner')
+
+
+def rank_cold_start_pool(artifact_dir):
+    """
+    Ranks the candidate pool by popularity (item_total_sales, ties by id).
+    Returns (article_ids_int, index_groups) in ranked order.
+    """
+    pool_items = _load_pool_items(artifact_dir, ['item_total_sales', 'index_group'])
+    ranked = pool_items.sort_values(['item_total_sales', 'article_id_int'], ascending=[False, True], kind='stable')
+    return (
+        ranked['article_id_int'].to_numpy(dtype=np.int64),
+        ranked['index_group'].to_numpy(dtype=np.int64),
+    )
+
+
+def _typed(frame, columns, dtype):
+    """frame[columns] as a `dtype` array; integer codes must fit the dtype exactly."""
+    values = frame[columns].to_numpy(dtype=np.float64)
+    typed = values.astype(dtype)
+    if np.dtype(dtype).kind in "iu" and not np.array_equal(typed, values):
+        raise ValueError(f"Features {columns} do not fit the layout dtype {np.dtype(dtype).name}.")
+    return typed
+
+
+def _as_index(columns):
+    """A slice for contiguous column positions (plain strided copies), else the list."""
+    if columns and columns == list(range(columns[0], columns[-1] + 1)):
+        return slice(columns[0], columns[-1] + 1)
+    return columns
+
+
+class InMemoryFeatureStore:
+    """
+    Columnar feature store held in RAM (the fast path).
+
+    Everything the ranker needs is loaded ONCE at startup, typed as the
+    feature layout declares (float32 values, int16 group codes):
+    1. User features -> dense (n_customers, 5) array indexed by customer_id_int
+    2. Item features for the whole catalogue -> one dense table per storage
+       dtype, indexed by article_id_int (per-user candidates outside the pool)
+    3. The candidate pool's item columns, precomputed as a ranker matrix block
+
+    A request then becomes a copy of that block plus the user's columns,
+    written into the calling thread's reusable matrix (FeatureBuffer).
+    """
+    def __init__(self, layout, user_features, user_present, candidate_ids, item_tables, item_present):
+        self.layout = layout
+        self.feature_order = layout.names
+        self.user_features = user_features
+        self.user_present = user_present
+        self.candidate_ids = candidate_ids
+        self.item_tables = item_tables
+        self.item_present = item_present
+        self.buffer = FeatureBuffer(len(layout))
+
+        # Pool membership by article_id_int (extra candidates already in the pool are dropped)
+        self._in_pool = np.zeros(len(item_present), dtype=bool)
+        self._in_pool[candidate_ids] = True
+
+        # Column positions of each block inside the ranker's feature matrix
+        self._col = layout.index
+        self._user_cols = _as_index(layout.columns('user'))
+        self._item_groups = [(_as_index(layout.columns('item', dtype)), item_tables[dtype.name])
+                             for dtype in layout.storage_dtypes('item')]
+
+        # User-independent part of the candidate matrix, precomputed once:
+        # item columns + the default source/als_score/visual_score columns.
+        # Requests copy this block and only fill the user columns + price_diff.
+        self.item_block = np.empty((len(candidate_ids), len(layout)), dtype=MATRIX_DTYPE)
+        self.item_block[:] = layout.defaults
+        for cols, table in self._item_groups:
+            self.item_block[:, cols] = table[candidate_ids]
+
+        print(f"   - In-Memory Feature Store: {int(self.user_present.sum())} users, {len(self.candidate_ids)} candidates.")
+
+    @classmethod
+    def from_parquet(cls, artifact_dir, layout=LAYOUT):
+        """Loads the store from the raw parquet artifacts (only the layout's columns are read)."""
+        user_features = layout.names_in('user')
+        if len(layout.storage_dtypes('user')) != 1:
+            raise ValueError("User features must share one storage dtype.")
+
+        # 1. User features (dense by customer_id_int, with a presence mask)
+        user_path = os.path.join(artifact_dir, "features_user.parquet")
+        if os.path.exists(user_path):
+            users = pd.read_parquet(user_path, columns=['customer_id_int'] + user_features)
+        else:
+            print(f"Warning: {user_path} not found. Every user will be a cold start.")
+            users = pd.DataFrame(columns=['customer_id_int'] + user_features)
+
+        user_ids = users['customer_id_int'].to_numpy(dtype=np.int64)
+        n_slots = int(user_ids.max()) + 1 if len(user_ids) else 0
+        user_dtype = layout.storage_dtypes('user')[0]
+        user_table = np.zeros((n_slots, len(user_features)), dtype=user_dtype)
+        user_present = np.zeros(n_slots, dtype=bool)
+        user_table[user_ids] = _typed(users, user_features, user_dtype)
+        user_present[user_ids] = True
+
+        # 2. Item features: whole catalogue (dense by article_id_int), one table per dtype
+        items = pd.read_parquet(os.path.join(artifact_dir, "features_item.parquet"),
+                                columns=['article_id_int'] + layout.names_in('item'))
+        item_ids = items['article_id_int'].to_numpy(dtype=np.int64)
+        n_items = int(item_ids.max()) + 1 if len(item_ids) else 0
+        item_present = np.zeros(n_items, dtype=bool)
+        item_present[item_ids] = True
+        item_tables = {}
+        for dtype in layout.storage_dtypes('item'):
+            columns = layout.names_in('item', dtype)
+            table = np.zeros((n_items, len(columns)), dtype=dtype)
+            table[item_ids] = _typed(items, columns, dtype)
+            item_tables[dtype.name] = table
+
+        # 3. Candidate pool: the pool's articles that have item features, pool order kept
+        pool_ids = pd.read_parquet(os.path.join(artifact_dir, "candidates_pool.parquet"),
+                                   columns=['article_id_int'])['article_id_int'].to_numpy(dtype=np.int64)
+        known = (pool_ids >= 0) & (pool_ids < n_items)
+        known[known] = item_present[pool_ids[known]]
+        return cls(layout, user_table, user_present, pool_ids[known], item_tables, item_present)
+
+    @classmethod
+    def from_bundle(cls, bundle, layout=LAYOUT):
+        """Zero-copy store over the arrays of a compiled bundle (see arrays())."""
+        item_tables = {dtype.name: bundle[f"item_features/{dtype.name}"] for dtype in layout.storage_dtypes('item')}
+        return cls(layout, bundle["user_features"], bundle["user_present"], bundle["candidate_ids"],
+                   item_tables, bundle["item_present"])
+
+    def arrays(self):
+        """The store's arrays by bundle name (compile_bundle)."""
+        arrays = {"user_features": self.user_features, "user_present": self.user_present,
+                  "candidate_ids": self.candidate_ids, "item_present": self.item_present}
+        arrays.update({f"item_features/{dtype}": table for dtype, table in self.item_tables.items()})
+        return arrays
+
+    def get_user(self, customer_id_int):
+        """Returns the user's feature row, or None for unknown users (cold start)."""
+        if customer_id_int < 0 or customer_id_int >= len(self.user_present):
+            return None
+        if not self.user_present[customer_id_int]:
+            return None
+        return self.user_features[customer_id_int]
+
+    def get_users(self, customer_ids):
+        """
+        Batched lookup. Returns (rows, found):
+        rows is (n, 5) with zeros for unknown users, found is a boolean mask.
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        in_range = (ids >= 0) & (ids < len(self.user_present))
+        found[in_range] = self.user_present[ids[in_range]]
+
+        rows = np.zeros((len(ids), len(USER_FEATURES)), dtype=self.user_features.dtype)
+        rows[found] = self.user_features[ids[found]]
+        return rows, found
+
+    def sample_customer_ids(self, n, seed=0):
+        """Up to n known customer ids (used to warm up a freshly loaded engine)."""
+        known = np.flatnonzero(self.user_present)
+        if len(known) <= n:
+            return known
+        return np.sort(np.random.default_rng(seed).choice(known, size=n, replace=False))
+
+    def update_users(self, customer_ids, rows):
+        """
+        Overwrites user feature rows in place (streaming ingestion).
+        Memory-mapped (read-only) arrays are copied on the first write, and
+        the arrays grow for new customer ids. Features are swapped in before
+        the presence mask, so concurrent readers never see a row they can't read.
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        n_slots = max(len(self.user_present), int(ids.max()) + 1)
+        writeable = self.user_features.flags.writeable and self.user_present.flags.writeable
+        if n_slots > len(self.user_present) or not writeable:
+            features = np.zeros((n_slots, len(USER_FEATURES)), dtype=self.user_features.dtype)
+            present = np.zeros(n_slots, dtype=bool)
+            features[:len(self.user_features)] = self.user_features
+            present[:len(self.user_present)] = self.user_present
+            features[ids] = rows
+            self.user_features = features
+            present[ids] = True
+            self.user_present = present
+            return
+        self.user_features[ids] = rows
+        self.user_present[ids] = True
+
+    def candidate_matrix(self, user_row):
+        """
+        Builds the (n_candidates, 14) ranker input for one user.
+        Returns (article_ids, X) with X columns in `feature_order`.
+        """
+        article_ids, X = self.candidate_matrix_many(np.asarray(user_row)[None, :])
+        return article_ids[0], X
+
+    def eligible_extra(self, article_ids):
+        """
+        Mask of per-user extra candidates worth scoring: known items with
+        features that are not already in the static pool (-1 = padding).
+        """
+        ids = np.asarray(article_ids, dtype=np.int64)
+        ok = (ids >= 0) & (ids < len(self.item_present))
+        ok[ok] = self.item_present[ids[ok]] & ~self._in_pool[ids[ok]]
+        return ok
+
+    def candidate_matrix_many(self, user_rows, extra_ids=None, extra_columns=None):
+        """
+        Builds the stacked ranker input for several users (one block per user).
+        Each block is the static pool, optionally followed by per-user extra
+        candidates: `extra_ids` is (n_users, m) article_id_int with -1 padding
+        and `extra_columns` maps a feature name (e.g. 'source', 'als_score')
+        to its (n_users, m) values for those rows.
+        Returns (article_ids, X): article_ids is (n_users, n_candidates) (-1 for
+        padding rows) and X is (n_users * n_candidates, 14) float32 with
+        columns in `feature_order`. X lives in the thread's FeatureBuffer: it is
+        overwritten by the thread's next call.
+        """
+        n_users, n = len(user_rows), len(self.candidate_ids)
+        m = 0 if extra_ids is None else extra_ids.shape[1]
+        user_rows = np.asarray(user_rows, dtype=MATRIX_DTYPE)
+        X = self.buffer.take(n_users * (n + m)).reshape(n_users, n + m, len(self.layout))
+        X[:, :n] = self.item_block
+
+        if m:
+            # Extra rows: the layout defaults, then the item's own features
+            X[:, n:] = self.layout.defaults
+            rows = np.where(extra_ids >= 0, extra_ids, 0)
+            for cols, table in self._item_groups:
+                X[:, n:, cols] = table[rows]
+            for name, values in (extra_columns or {}).items():
+                X[:, n:, self._col[name]] = values
+
+        # Per-user work: the five user columns and price_diff
+        X[:, :, self._user_cols] = user_rows[:, None, :]
+        np.subtract(X[:, :, self._col['item_avg_price']], user_rows[:, :1], out=X[:, :, self._col['price_diff']])
+
+        if m:
+            article_ids = np.concatenate([np.broadcast_to(self.candidate_ids, (n_users, n)), extra_ids], axis=1)
+        else:
+            article_ids = np.broadcast_to(self.candidate_ids, (n_users, n))
+        return article_ids, X.reshape(n_users * (n + m), len(self.layout))
+
+
+class DuckDBFeatureStore:
+    """
+    Low-memory feature store: queries the users / items / candidates views
+    registered on the engine's DuckDB connection on every request (parquet
+    files, or the indexed tables of features.duckdb, see feature_db.py).
+    Only the pool block (the candidate x item join, a few thousand rows) is
+    cached in RAM, on first use. Lookups are parameterised statements
+    (IN (?, ...) over the ids), select only the layout's columns and are
+    fetched as NumPy arrays, written straight into the thread's reusable
+    ranker matrix.
+
+    A DuckDB connection must not be used by two threads at once, so every
+    thread queries through its own cursor of that connection (same
+    database and views), created on first use.
+    """
+    def __init__(self, con, layout=LAYOUT):
+        self.root = con
+        self.layout = layout
+        self.feature_order = layout.names
+        self.buffer = FeatureBuffer(len(layout))
+        self._col = layout.index
+        self._user_cols = _as_index(layout.columns('user'))
+        self._user_select = ", ".join(layout.names_in('user'))
+        self._item_select = ", ".join(layout.names_in('item'))
+        self._local = threading.local()
+        self._cursors = []
+        self._cursors_lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def con(self):
+        """The calling thread's cursor."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.root.cursor()
+            with self._cursors_lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        """Closes every thread's cursor (the root connection is the engine's)."""
+        with self._cursors_lock:
+            cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            cursor.close()
+
+    def _fetch_by_ids(self, table, key, select, ids):
+        """
+        Rows of `table` whose `key` is in `ids` (unique int64), as one dict of
+        NumPy arrays: parameterised IN (?, ...) lists of at most MAX_LOOKUP_IDS,
+        which DuckDB answers with index / row-group min-max lookups.
+        """
+        parts = []
+        for start in range(0, len(ids), MAX_LOOKUP_IDS):
+            chunk = ids[start:start + MAX_LOOKUP_IDS].tolist()
+            parts.append(self.con.execute(
+                f"SELECT {key}, {select} FROM {table} WHERE {key} IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchnumpy())
+        if len(parts) == 1:
+            return {name: np.asarray(values) for name, values in parts[0].items()}
+        return {name: np.concatenate([np.asarray(part[name]) for part in parts]) for name in parts[0]}
+
+    def get_user(self, customer_id_int):
+        """Returns the user's feature row, or None for unknown users (cold start)."""
+        row = self.con.execute(
+            f"SELECT {self._user_select} FROM users WHERE customer_id_int = ? LIMIT 1", [int(customer_id_int)]
+        ).fetchone()
+        if row is None:
+            return None
+        return np.array(row, dtype=MATRIX_DTYPE)
+
+    def get_users(self, customer_ids):
+        """
+        Batched lookup. Returns (rows, found):
+        rows is (n, 5) with zeros for unknown users, found is a boolean mask.
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        rows = np.zeros((len(ids), len(USER_FEATURES)), dtype=MATRIX_DTYPE)
+        found = np.zeros(len(ids), dtype=bool)
+        if len(ids) == 0:
+            return rows, found
+
+        result = self._fetch_by_ids("users", "customer_id_int", self._user_select, np.unique(ids))
+        user_ids, first = np.unique(result['customer_id_int'].astype(np.int64), return_index=True)
+        if len(user_ids) == 0:
+            return rows, found
+
+        positions = np.minimum(np.searchsorted(user_ids, ids), len(user_ids) - 1)
+        found = user_ids[positions] == ids
+        for j, name in enumerate(USER_FEATURES):
+            rows[found, j] = result[name][first][positions[found]]
+        return rows, found
+
+    def sample_customer_ids(self, n, seed=0):
+        """Up to n known customer ids (used to warm up a freshly loaded engine)."""
+        result = self.con.execute(
+            f"SELECT customer_id_int FROM users USING SAMPLE {int(n)} ROWS (reservoir, {int(seed)})"
+        ).fetchnumpy()
+        return np.sort(np.asarray(result['customer_id_int'], dtype=np.int64))
+
+    def candidate_matrix(self, user_row):
+        """
+        Builds the (n_candidates, 14) ranker input for one user via a SQL join.
+        Returns (article_ids, X) with X columns in `feature_order`.
+        """
+        article_ids, X = self.candidate_matrix_many(np.asarray(user_row)[None, :])
+        return article_ids[0], X
+
+    def eligible_extra(self, article_ids):
+        """
+        Mask of per-user extra candidates worth scoring: known items with
+        features that are not already in the static pool (-1 = padding).
+        """
+        ids = np.asarray(article_ids, dtype=np.int64)
+        ok = ids >= 0
+        if not ok.any():
+            return ok
+        pool_ids = self._pool_block()['article_id_int']
+        candidates = np.unique(ids[ok])
+        candidates = candidates[~np.isin(candidates, pool_ids)]
+        known = self._fetch_by_ids("items", "article_id_int", "1 AS present", candidates)['article_id_int'] \
+            if len(candidates) else np.empty(0, dtype=np.int64)
+        ok[ok] = np.isin(ids[ok], known.astype(np.int64))
+        return ok
+
+    def _pool_block(self):
+        """
+        The candidate x item join (pool article ids + item columns, in pool
+        order: ORDER BY the candidates' pool_position, a join keeps no
+        order), queried once and kept: it is the same for every request.
+        """
+        pool = self._pool
+        if pool is None:
+            item_names = self.layout.names_in('item')
+            pool = self.con.execute(f"""
+                SELECT c.article_id_int, {", ".join(f"i.{name}" for name in item_names)}
+                FROM candidates c
+                JOIN items i ON c.article_id_int = i.article_id_int
+                ORDER BY c.pool_position
+            """).fetchnumpy()
+            pool = self._pool = {name: np.asarray(values) for name, values in pool.items()}
+            pool['article_id_int'] = pool['article_id_int'].astype(np.int64)
+        return pool
+
+    def candidate_matrix_many(self, user_rows, extra_ids=None, extra_columns=None):
+        """
+        Builds the stacked ranker input for several users (one block per user).
+        The pool block (the cached candidate x item join) is broadcast into
+        every user's block. Per-user extra candidates work as in
+        InMemoryFeatureStore (and X lives in the thread's FeatureBuffer too).
+        Returns (article_ids, X): article_ids is (n_users, n_candidates) and
+        X is (n_users * n_candidates, 14) float32 with columns in `feature_order`.
+        """
+        item_names = self.layout.names_in('item')
+        pool = self._pool_block()
+        pool_ids = pool['article_id_int']
+        n_users, n = len(user_rows), len(pool_ids)
+        m = 0 if extra_ids is None else extra_ids.shape[1]
+        user_rows = np.asarray(user_rows, dtype=MATRIX_DTYPE)
+        X = self.buffer.take(n_users * (n + m)).reshape(n_users, n + m, len(self.layout))
+
+        # Pool rows: layout defaults, then the joined item columns (same for every user)
+        X[:, :n] = self.layout.defaults
+        for name in item_names:
+            X[:, :n, self._col[name]] = pool[name]
+        if m:
+            self._extra_block(extra_ids, extra_columns or {}, X[:, n:])
+
+        # Per-user work: the five user columns and price_diff
+        X[:, :, self._user_cols] = user_rows[:, None, :]
+        np.subtract(X[:, :, self._col['item_avg_price']], user_rows[:, :1], out=X[:, :, self._col['price_diff']])
+
+        article_ids = np.broadcast_to(pool_ids, (n_users, n))
+        if m:
+            article_ids = np.concatenate([article_ids, extra_ids], axis=1)
+        return article_ids, X.reshape(n_users * (n + m), len(self.layout))
+
+    def _extra_block(self, extra_ids, extra_columns, out):
+        """Fills `out` (n_users, m, 14) for per-user extra candidates (item features via SQL)."""
+        out[:] = self.layout.defaults
+        valid = extra_ids >= 0
+        if valid.any():
+            items = self._fetch_by_ids("items", "article_id_int", self._item_select,
+                                       np.unique(extra_ids[valid]).astype(np.int64))
+            item_ids, first = np.unique(items['article_id_int'].astype(np.int64), return_index=True)
+            if len(item_ids):
+                positions = np.minimum(np.searchsorted(item_ids, extra_ids), len(item_ids) - 1)
+                found = item_ids[positions] == extra_ids
+                for name in self.layout.names_in('item'):
+                    out[..., self._col[name]][found] = items[name][first][positions[found]]
+        for name, values in extra_columns.items():
+            out[..., self._col[name]] = values
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class ArticleIdMap:
+    """
+    Integer -> String article ID translation, built once at engine load.
+
+    article_id_int is a dense 0..N-1 row number (see the notebook's article_map),
+    so the map is a fixed-width string array where position == article_id_int.
+    Decoding k IDs is a single O(k) gather; there is no SQL and no dict.
+    """
+    def __init__(self, ids):
+        self.ids = ids
+        self._sorted_numeric = None
+        self._sorted_order = None
+
+    @classmethod
+    def from_parquet(cls, path):
+        if not os.path.exists(path):
+            print(f"Warning: {path} not found. Article IDs cannot be decoded.")
+            return cls(np.empty(0, dtype='U10'))
+
+        mapping = pd.read_parquet(path, columns=['article_id_int', 'article_id_str'])
+        int_ids = mapping['article_id_int'].to_numpy(dtype=np.int64)
+        str_ids = mapping['article_id_str'].to_numpy(dtype=str)
+
+        # Unmapped slots (gaps in article_id_int, if any) decode to ''
+        ids = np.zeros(int(int_ids.max()) + 1 if len(int_ids) else 0, dtype=str_ids.dtype)
+        ids[int_ids] = str_ids
+        return cls(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def decode(self, article_ids_int):
+        """
+        Returns the string IDs for `article_ids_int`, in the same order.
+        Raises ValueError on negative IDs (padding must be dropped first).
+        """
+        article_ids_int = np.asarray(article_ids_int, dtype=np.int64)
+        if article_ids_int.size and article_ids_int.min() < 0:
+            raise ValueError(f"Cannot decode negative article_id_int {int(article_ids_int.min())}.")
+        return self.ids[article_ids_int].tolist()
+
+    def encode(self, article_ids):
+        """
+        String (or raw numeric) article IDs -> article_id_int, -1 when unknown.
+        Uses a sorted numeric copy of the map built on first use (binary search).
+        """
+        if self._sorted_numeric is None:
+            numeric = np.array([int(a) if a else -1 for a in self.ids.tolist()], dtype=np.int64)
+            self._sorted_order = np.argsort(numeric, kind='stable')
+            self._sorted_numeric = numeric[self._sorted_order]
+
+        keys = np.array([_to_numeric(a) for a in article_ids], dtype=np.int64)
+        pos = np.searchsorted(self._sorted_numeric, keys)
+        pos = np.minimum(pos, len(self._sorted_numeric) - 1)
+        if len(self._sorted_numeric) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        hit = (self._sorted_numeric[pos] == keys) & (keys >= 0)
+        return np.where(hit, self._sorted_order[pos], -1).astype(np.int64)
+
+
+def _to_numeric(article_id):
+    """'0108775015' / 108775015 -> 108775015; anything unparsable -> -1."""
+    try:
+        return int(article_id)
+    except (TypeError, ValueError):
+        return -1
@@ -1,135 +1,651 @@
 import lightgbm as lgb
-import pandas as pd
 import duckdb
 import numpy as np
 import os
-import pickle
+import hashlib
+
+from feature_store import LAYOUT, InMemoryFeatureStore, DuckDBFeatureStore, rank_cold_start_pool
+from bundle import BUNDLE_FILENAME, ArtifactBundle, source_fingerprint
+from feature_db import attach_feature_db, sql_string
+from id_map import ArticleIdMap
+from tree_model import TreeEnsemble
+from visual import VisualIndex, EMBEDDINGS_FILENAME, IVF_FILENAME
+from als import ALSRetriever, USER_FACTORS_FILENAME, ITEM_FACTORS_FILENAME
+from recent_purchases import RecentPurchaseIndex, RECENT_PURCHASES_FILENAME, isin_rows
+from copurchase import CoPurchaseIndex, NEIGHBOURS_FILENAME, WEIGHTS_FILENAME
+from metrics import Metrics
+
+# Supported feature backends:
+# - "memory": preload features into NumPy arrays at startup (fast, more RAM)
+# - "duckdb": query the parquet files on every request (slow, low memory)
+FEATURE_BACKENDS = ("memory", "duckdb")
+
+# Supported ranker backends:
+# - "lightgbm": lgb.Booster (C++ evaluator)
+# - "native": TreeEnsemble, a NumPy evaluator compiled from the same model file
+RANKER_BACKENDS = ("lightgbm", "native")
+
+# `source` codes the ranker was trained with (category codes in the notebook)
+SOURCE_ALS, SOURCE_BESTSELLER, SOURCE_REPURCHASE, SOURCE_VISUAL = 0, 1, 2, 3
+
+# Optional artifacts loaded from the raw directory even when a bundle is mapped:
+# part of the artifact version, so retraining them alone still triggers a reload
+SIDE_ARTIFACTS = (
+    EMBEDDINGS_FILENAME, IVF_FILENAME, USER_FACTORS_FILENAME, ITEM_FACTORS_FILENAME,
+    RECENT_PURCHASES_FILENAME, NEIGHBOURS_FILENAME, WEIGHTS_FILENAME,
+)
+
+def compute_artifact_version(artifact_dir):
+    """
+    Short fingerprint of the artifact files (name, size, mtime).
+    Changes whenever a model or feature file is replaced.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(artifact_dir):
+        for name in sorted(os.listdir(artifact_dir)):
+            path = os.path.join(artifact_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
 
 class RecSysEngine:
-    def __init__(self, artifact_dir="artifacts"):
+    def __init__(self, artifact_dir="artifacts", feature_backend="memory", batch_chunk_size=64,
+                 ranker_backend="lightgbm", use_bundle=True, verify_bundle=False,
+                 visual_search="ivf", visual_nprobe=8, visual_neighbours=5, als_candidates=50,
+                 repurchase_window_days=28, repurchase_candidates=32, seed_history_days=14,
+                 exclude_purchased_days=0, repurchase_boost=0.0, copurchase_candidates=20, metrics=None,
+                 predict_threads=0):
         """
         Initializes the Recommendation Engine.
         1. Loads the LightGBM model (The Brain)
         2. Sets up the DuckDB In-Memory Database (The Memory)
+        3. Sets up the Feature Store used on the request path
+
+        With the memory backend, a compiled bundle (artifacts/engine.bundle,
+        see scripts/compile_artifacts.py) is preferred: the model, features and
+        ID maps are then memory-mapped instead of parsed. Without a usable
+        bundle the raw parquet/txt artifacts are loaded as before. With the
+        duckdb backend, the compiled feature database (artifacts/features.duckdb,
+        compile_artifacts.py --feature-db) is preferred over the parquet views.
         """
         print(f"Initializing Engine from: {artifact_dir}")
-        
+        if feature_backend not in FEATURE_BACKENDS:
+            raise ValueError(f"Unknown feature_backend '{feature_backend}'. Expected one of {FEATURE_BACKENDS}")
+        if ranker_backend not in RANKER_BACKENDS:
+            raise ValueError(f"Unknown ranker_backend '{ranker_backend}'. Expected one of {RANKER_BACKENDS}")
+
+        # Define the exact feature order expected by LightGBM (CRITICAL):
+        # the typed feature layout, checked against the model once it is loaded
+        self.layout = LAYOUT
+        self.feature_order = self.layout.names
+        self.feature_backend = feature_backend
+        self.ranker_backend = ranker_backend
+
+        # Stage timings / counters (shared across hot reloads; disabled = no-op)
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+
+        # 0. Compiled bundle (optional)
+        self.bundle = None
+        bundle_path = os.path.join(artifact_dir, BUNDLE_FILENAME)
+        if use_bundle and feature_backend == "memory" and os.path.exists(bundle_path):
+            try:
+                self.bundle = ArtifactBundle.open(bundle_path, verify=verify_bundle)
+                if self.bundle.meta.get("source_fingerprint") != source_fingerprint(artifact_dir):
+                    raise ValueError(f"{bundle_path} is older than the raw artifacts (recompile it).")
+                if self.bundle.meta.get("feature_order") != self.feature_order:
+                    raise ValueError(f"{bundle_path} was compiled for another feature layout (recompile it).")
+                print(f"   - Artifact Bundle Mapped: {bundle_path} (version {self.bundle.artifact_version})")
+            except ValueError as e:
+                print(f"Warning: {e} Falling back to raw artifacts.")
+                self.bundle = None
+        if self.bundle is not None:
+            digest = hashlib.sha1(f"{self.bundle.artifact_version}:"
+                                  f"{source_fingerprint(artifact_dir, SIDE_ARTIFACTS)}".encode())
+            self.artifact_version = digest.hexdigest()[:12]
+        else:
+            self.artifact_version = compute_artifact_version(artifact_dir)
+
         # 1. Load LightGBM Model
-        model_path = os.path.join(artifact_dir, "lgbm_ranker.txt")
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model not found at {model_path}")
-        
-        self.model = lgb.Booster(model_file=model_path)
-        print("   - LightGBM Model Loaded.")
+        if self.bundle is not None:
+            self._load_model_from_bundle()
+        else:
+            model_path = os.path.join(artifact_dir, "lgbm_ranker.txt")
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Model not found at {model_path}")
+
+            if ranker_backend == "native":
+                self.model = TreeEnsemble.from_model_file(model_path)
+                print(f"   - LightGBM Model Compiled to Native Evaluator ({self.model.num_trees} trees).")
+            else:
+                self.model = lgb.Booster(model_file=model_path)
+                print("   - LightGBM Model Loaded.")
+
+        # The model must have been trained on exactly this layout (fail at load, not per request)
+        self.layout.validate(self.model.feature_name())
 
         # 2. Setup DuckDB & Load Views
         # We use DuckDB to query the parquet files directly without loading everything into RAM
         self.con = duckdb.connect(database=':memory:')
         
-        # Register Parquet files as tables
-        self._register_view("users", os.path.join(artifact_dir, "features_user.parquet"))
-        self._register_view("items", os.path.join(artifact_dir, "features_item.parquet"))
-        self._register_view("mapping", os.path.join(artifact_dir, "article_map.parquet"))
-        self._register_view("candidates", os.path.join(artifact_dir, "candidates_pool.parquet"))
-        
-        print("   - Feature Tables Registered in DuckDB.")
-        
-        # Define the exact feature order expected by LightGBM (CRITICAL)
-        self.feature_order = [
-            'source', 'als_score', 'visual_score', 
-            'user_avg_price', 'user_price_std', 'user_total_purchases', 
-            'user_tenure_days', 'days_since_last_buy', 
-            'item_avg_price', 'item_total_sales', 
-            'product_group', 'index_group', 'garment_group', 
-            'price_diff'
-        ]
+        # Register Parquet files as tables (not needed when running from the bundle)
+        if self.bundle is None:
+            self._register_view("users", os.path.join(artifact_dir, "features_user.parquet"))
+            self._register_view("items", os.path.join(artifact_dir, "features_item.parquet"))
+            self._register_view("mapping", os.path.join(artifact_dir, "article_map.parquet"))
+            # pool_position: the pool order (row number in the file), as in features.duckdb
+            self._register_view("candidates", os.path.join(artifact_dir, "candidates_pool.parquet"),
+                                row_number="pool_position")
+            print("   - Feature Tables Registered in DuckDB.")
+            # duckdb backend: the compiled, indexed features.duckdb replaces the
+            # users/items/candidates parquet views when it is fresh
+            if feature_backend == "duckdb" and use_bundle:
+                attach_feature_db(self.con, artifact_dir, self.layout)
+
+        # 3. Feature Store (memory = array gathers, duckdb = SQL per request)
+        if self.bundle is not None:
+            self.features = InMemoryFeatureStore.from_bundle(self.bundle, self.layout)
+        elif feature_backend == "memory":
+            self.features = InMemoryFeatureStore.from_parquet(artifact_dir, self.layout)
+        else:
+            self.features = DuckDBFeatureStore(self.con, self.layout)
+        print(f"   - Feature Backend: {feature_backend}")
+
+        # 4. Article ID Map (int -> str), decoded by position
+        if self.bundle is not None:
+            self.id_map = ArticleIdMap(self.bundle["article_ids"])
+        else:
+            self.id_map = ArticleIdMap.from_parquet(os.path.join(artifact_dir, "article_map.parquet"))
+        print(f"   - Article ID Map Loaded: {len(self.id_map)} articles.")
+
+        # Users per stacked predict call in recommend_many (bounds matrix memory)
+        self.batch_chunk_size = batch_chunk_size
+
+        # OpenMP threads per LightGBM predict (0 = LightGBM's default, all cores).
+        # With several concurrent inference threads, cores / threads avoids oversubscription.
+        self.predict_kwargs = {}
+        if predict_threads > 0 and isinstance(self.model, lgb.Booster):
+            self.predict_kwargs["num_threads"] = predict_threads
+
+        # 5. Cold Start lists, ranked once (global + per index_group)
+        if self.bundle is not None:
+            ranked_ids, ranked_groups = self.bundle["cold_start_ids"], self.bundle["cold_start_groups"]
+        else:
+            ranked_ids, ranked_groups = rank_cold_start_pool(artifact_dir)
+        self.cold_start = self._build_cold_start(ranked_ids, ranked_groups)
+        print(f"   - Cold Start Lists Ranked: {len(self.cold_start) - 1} segments.")
 
-    def _register_view(self, name, path):
-        """Helper to register parquet files as SQL views"""
+        # 6. Visual similarity (optional: needs visual_embeddings.npy).
+        #    Drives /similar and the visual_score feature for recent items.
+        index_map = self.bundle["visual_index_map"] if self.bundle is not None and "visual_index_map" in self.bundle else None
+        self.visual = VisualIndex.from_artifacts(artifact_dir, self.id_map, index_map=index_map,
+                                                 use_ivf=visual_search == "ivf", nprobe=visual_nprobe)
+        self.visual_neighbours = visual_neighbours
+
+        # 7. ALS retrieval (optional: needs the exported factor matrices).
+        #    Adds per-user candidates with real als_score on top of the static pool.
+        self.als = ALSRetriever.from_artifacts(artifact_dir, n_candidates=als_candidates) if als_candidates > 0 else None
+
+        # 8. Recent purchases (optional: needs recent_purchases.npz, see
+        #    scripts/build_recent_purchases.py; appended to by the transaction feed).
+        #    Repurchase candidates, seed articles and the already-bought rules.
+        self.purchases = RecentPurchaseIndex.from_artifacts(artifact_dir) if repurchase_window_days > 0 else None
+        self.repurchase_window_days = repurchase_window_days
+        self.repurchase_candidates = repurchase_candidates
+        self.seed_history_days = seed_history_days
+        self.exclude_purchased_days = exclude_purchased_days
+        self.repurchase_boost = repurchase_boost
+
+        # 9. Co-purchase neighbours (optional: see scripts/build_copurchase_index.py).
+        #    Expands seed articles (cart, recent views/purchases) into candidates,
+        #    including for users without features.
+        self.copurchase = CoPurchaseIndex.from_artifacts(artifact_dir) if copurchase_candidates > 0 else None
+        self.copurchase_candidates = copurchase_candidates
+
+    def _load_model_from_bundle(self):
+        """Ranker from the bundle: tree arrays (native) or the embedded model text."""
+        if self.ranker_backend == "native":
+            arrays = {name: self.bundle[f"tree/{name}"] for name in TreeEnsemble.ARRAY_FIELDS}
+            self.model = TreeEnsemble.from_arrays(arrays, self.bundle.meta["tree"])
+            print(f"   - Native Evaluator Mapped From Bundle ({self.model.num_trees} trees).")
+        else:
+            model_str = self.bundle["model_text"].tobytes().decode("utf-8")
+            self.model = lgb.Booster(model_str=model_str)
+            print("   - LightGBM Model Loaded From Bundle.")
+
+    def _register_view(self, name, path, row_number=None):
+        """Helper to register parquet files as SQL views (`row_number`: column with the file row number)"""
         if os.path.exists(path):
-            self.con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM '{path}'")
+            if row_number:
+                self.con.execute(f"""
+                    CREATE OR REPLACE VIEW {name} AS
+                    SELECT * EXCLUDE (file_row_number), file_row_number AS {row_number}
+                    FROM read_parquet({sql_string(path)}, file_row_number = true)
+                """)
+            else:
+                self.con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet({sql_string(path)})")
         else:
             print(f"Warning: {path} not found. {name} table will be missing.")
 
-    def recommend(self, customer_id_int, top_k=12):
+    def recommend(self, customer_id_int, top_k=12, segment=None, recent_items=None):
         """
         Generates recommendations for a specific User ID.
+        `segment` (an index_group code) picks the cold start list for unknown users.
+        `recent_items` (article IDs the user just bought/viewed) are seed
+        articles: they feed visual_score and co-purchase candidates.
+        Each stage is timed into self.metrics (no-op when metrics are off).
         """
-        # A. Fetch User Features
-        print("   - Fetching User Features...")
-        user_df = self.con.execute(f"SELECT * FROM users WHERE customer_id_int = {customer_id_int}").df()
-        
-        # B. Cold Start Check
-        if user_df.empty:
-            print(f"   - Cold Start for User {customer_id_int}")
-            return self._get_global_bestsellers(top_k)
-
-        # C. Candidate Generation
-        print("   - Generating Candidates...")
-        query = f"""
-            SELECT 
-                c.article_id_int,
-                i.item_avg_price, i.item_total_sales, 
-                i.product_group, i.index_group, i.garment_group,
-                u.user_avg_price, u.user_price_std, u.user_total_purchases, 
-                u.user_tenure_days, u.days_since_last_buy
-            FROM candidates c
-            JOIN items i ON c.article_id_int = i.article_id_int,
-            (SELECT * FROM users WHERE customer_id_int = {customer_id_int}) u
-        """
-        candidates_df = self.con.execute(query).df()
-        print(f"   - Candidates Generated: {len(candidates_df)} rows")
-        
-        if candidates_df.empty:
-            return self._get_global_bestsellers(top_k)
-
-        # D. Dynamic Feature Engineering
-        print("   - Feature Engineering...")
-        candidates_df['price_diff'] = candidates_df['item_avg_price'] - candidates_df['user_avg_price']
-        candidates_df['source'] = 1  
-        candidates_df['als_score'] = -1
-        candidates_df['visual_score'] = -1
-        
-        # E. Prepare Data
-        X = candidates_df[self.feature_order]
-        
-        # F. Predict
-        print("   - Running LightGBM Predict...")
-        scores = self.model.predict(X)
-        candidates_df['score'] = scores
-        print("   - Prediction Complete.")
-        
-        # G. Sort and Select Top K
-        top_recs = candidates_df.sort_values('score', ascending=False).head(top_k)
-        top_ids = top_recs['article_id_int'].tolist()
-        
-        # H. Convert Integer IDs back to String IDs (for the UI)
-        if not top_ids:
-            return []
-            
-        id_list_str = ",".join(map(str, top_ids))
-        res = self.con.execute(f"""
-            SELECT article_id_str 
-            FROM mapping 
-            WHERE article_id_int IN ({id_list_str})
-        """).df()
-        
-        # Preserve the order of the recommendation (DuckDB query might shuffle)
-        # We create a map and re-order list
-        final_map = dict(zip(res.index, res['article_id_str'])) # Simplified fallback
-        # Better: use pandas merge to keep order
-        mapping_dict = self.con.execute("SELECT * FROM mapping").df().set_index('article_id_int')['article_id_str'].to_dict()
-        top_recs['article_id_str'] = top_recs['article_id_int'].map(mapping_dict)
-        
-        # Fallback if map is slow: just return the strings we found
-        return res['article_id_str'].tolist()
-
-    def _get_global_bestsellers(self, k):
-        """Fallback: Just return the most popular items"""
-        res = self.con.execute(f"""
-            SELECT m.article_id_str 
-            FROM candidates c
-            JOIN mapping m ON c.article_id_int = m.article_id_int
-            LIMIT {k}
-        """).df()
-        return res['article_id_str'].tolist()
\ No newline at end of file
+        metrics = self.metrics
+        with metrics.call("recommend"):
+            # A. Fetch User Features
+            with metrics.stage("feature_fetch"):
+                user_row = self.features.get_user(customer_id_int)
+
+            # B. Cold Start Check
+            if user_row is None:
+                metrics.inc("recsys_users_total", path="cold")
+                with metrics.stage("cold_start"):
+                    return self._cold_start_many([customer_id_int], top_k, [segment], [recent_items])[0]
+            metrics.inc("recsys_users_total", path="known")
+
+            # C. Candidate Generation + D./E. Feature Engineering (X is in feature_order)
+            article_ids, X, history = self._candidates([customer_id_int], np.asarray(user_row)[None, :], [recent_items])
+
+            if article_ids.shape[1] == 0:
+                return self._get_global_bestsellers(top_k, segment)
+
+            # F. Predict (padding rows of the per-user candidates can never win)
+            scores = self._predict(article_ids, X)
+            with metrics.stage("top_k"):
+                scores = self._apply_purchase_rules(article_ids, scores, history)
+
+                # G. Select Top K (argpartition, then order only the k winners);
+                # padding and excluded rows (-inf) are dropped, so fewer than k may remain
+                top_idx = self._top_k_indices(scores[0], top_k)
+                top_ids = article_ids[0][top_idx[top_idx >= 0]]
+
+            # H. Convert Integer IDs back to String IDs (for the UI), in score order
+            with metrics.stage("decode"):
+                return self.id_map.decode(top_ids)
+
+    def recommend_many(self, customer_ids, top_k=12, chunk_size=None, segments=None, recent_items=None,
+                       predict_threads=0):
+        """
+        Generates recommendations for many users at once.
+        Users are scored in chunks of `chunk_size`: one stacked feature matrix
+        and ONE LightGBM predict call per chunk, then a grouped top-k.
+        `segments` / `recent_items` (optional, aligned with customer_ids) pick
+        cold start lists and seed visual_score / co-purchase candidates.
+        `predict_threads` overrides the engine's OpenMP threads per predict
+        for this call (0 = the engine's setting).
+        Returns a list of recommendation lists aligned with `customer_ids`.
+        """
+        chunk_size = chunk_size or self.batch_chunk_size
+        segments = segments or [None] * len(customer_ids)
+        recent_items = recent_items or [None] * len(customer_ids)
+        results = [None] * len(customer_ids)
+        metrics = self.metrics
+
+        with metrics.call("recommend_many"):
+            # A. Fetch User Features (one batched lookup)
+            with metrics.stage("feature_fetch"):
+                user_rows, found = self.features.get_users(customer_ids)
+
+            # B. Cold Start users: co-purchase expansion of their seeds, then the segment list
+            cold = np.flatnonzero(~found)
+            if len(cold):
+                metrics.inc("recsys_users_total", len(cold), path="cold")
+                with metrics.stage("cold_start"):
+                    lists = self._cold_start_many([customer_ids[i] for i in cold], top_k,
+                                                  [segments[i] for i in cold], [recent_items[i] for i in cold])
+                for i, recs in zip(cold, lists):
+                    results[i] = recs
+
+            # C-G. Score known users chunk by chunk
+            known = np.flatnonzero(found)
+            if len(known):
+                metrics.inc("recsys_users_total", len(known), path="known")
+            for start in range(0, len(known), chunk_size):
+                idx = known[start:start + chunk_size]
+                article_ids, _, top_idx = self.score_chunk([customer_ids[i] for i in idx], user_rows[idx],
+                                                           [recent_items[i] for i in idx], top_k, predict_threads)
+                if top_idx is None:
+                    for i in idx:
+                        results[i] = self._get_global_bestsellers(top_k, segments[i])
+                    continue
+                top_ids = self._ranked_ids(article_ids, top_idx)
+
+                # H. Decode per user, in score order (-1: fewer than top_k scorable candidates)
+                with metrics.stage("decode"):
+                    for i, ids in zip(idx, top_ids):
+                        results[i] = self.id_map.decode(ids[ids >= 0])
+
+        return results
+
+    def score_chunk(self, customer_ids, user_rows, recent_items, top_k, predict_threads=0):
+        """
+        Ranks one chunk of known users (the path of recommend_many, shared
+        with the offline evaluation in evaluation.py): candidates + feature
+        matrix, ONE predict, the already-bought rules, then a grouped top-k.
+        Returns (article_ids, X, top_idx): article_ids is (n_users, n) with
+        -1 padding (also for excluded already-bought items), X the stacked
+        feature matrix (only valid until this thread's next chunk) and
+        top_idx (n_users, top_k) positions into article_ids, best first, -1
+        past a user's scorable candidates (see _ranked_ids); top_idx is None
+        when no user has candidates.
+        """
+        article_ids, X, history = self._candidates(customer_ids, user_rows, recent_items)
+        if article_ids.shape[1] == 0:
+            return article_ids, X, None
+        scores = self._predict(article_ids, X, predict_threads)
+        with self.metrics.stage("top_k"):
+            scores = self._apply_purchase_rules(article_ids, scores, history)
+            if self.exclude_purchased_days > 0 and history is not None:
+                # Excluded items are no longer candidates (e.g. for the evaluation's candidate recall)
+                article_ids = np.where(np.isfinite(scores), article_ids, -1)
+            return article_ids, X, self._top_k_indices_grouped(scores, top_k)
+
+    def _candidates(self, customer_ids, user_rows, recent_items):
+        """
+        Candidate generation + feature matrix for a chunk of known users:
+        the static pool plus per-user candidates (repurchase, ALS,
+        co-purchase, visual neighbours of each user's seed articles).
+        Returns (article_ids, X, history) with article_ids/X as the feature
+        store builds them (article_id -1 marks padding rows) and history the
+        users' recent purchases (or None).
+        """
+        metrics = self.metrics
+        with metrics.stage("candidates"):
+            history = self._purchase_history(customer_ids)
+            seeds = self._seed_articles(recent_items, history)
+            extra_ids, extra_columns = self._extra_candidates(customer_ids, history, seeds)
+        with metrics.stage("feature_matrix"):
+            article_ids, X = self.features.candidate_matrix_many(user_rows, extra_ids, extra_columns)
+        if metrics.enabled:
+            metrics.observe_many("recsys_candidates_per_user", (article_ids >= 0).sum(axis=1))
+        return article_ids, X, history
+
+    def _predict(self, article_ids, X, predict_threads=0):
+        """Ranker scores as an (n_users, n) matrix; padding rows (article_id -1) get -inf."""
+        metrics = self.metrics
+        predict_kwargs = self.predict_kwargs
+        if predict_threads > 0 and isinstance(self.model, lgb.Booster):
+            predict_kwargs = {**predict_kwargs, "num_threads": predict_threads}
+        if metrics.enabled:
+            metrics.observe("recsys_predict_users", article_ids.shape[0])
+            metrics.observe("recsys_predict_rows", X.shape[0])
+        with metrics.stage("predict"):
+            raw = self.model.predict(X, **predict_kwargs)
+            return np.where(article_ids >= 0, raw.reshape(article_ids.shape), -np.inf)
+
+    def _purchase_history(self, customer_ids):
+        """Recent purchases (article_ids, days), (n_users, width) with -1 padding, or None."""
+        if self.purchases is None:
+            return None
+        return self.purchases.lookup(customer_ids, within_days=self.repurchase_window_days,
+                                     max_items=self.repurchase_candidates)
+
+    def _extra_candidates(self, customer_ids, history=None, seeds=None):
+        """
+        Per-user candidates outside the static pool, padded to a common width.
+        As in the notebook's merge (bestsellers, then repurchase, then ALS,
+        deduplicated), an item keeps the row of the first source it came
+        from: pool items keep their pool row, repurchases are added with
+        source=Repurchase (als_score=-1), then the remaining ALS items with
+        source=ALS and the ALS dot product as als_score. Co-purchase
+        neighbours of the seed articles follow; the ranker has no source
+        code for them, so they use the other collaborative one (ALS) with
+        als_score=-1 (no ALS score). The visual neighbours of the seeds come
+        last with source=Visual and visual_score=cosine similarity; every
+        other row keeps visual_score=-1.
+        Returns (extra_ids, extra_columns) or (None, None).
+        """
+        blocks = []  # (article_ids, source, als_score, visual_score)
+        if history is not None:
+            repurchase_ids = np.where(self.features.eligible_extra(history[0]), history[0], -1)
+            blocks.append((repurchase_ids, SOURCE_REPURCHASE, -1, -1))
+        if self.als is not None:
+            als_ids, als_scores = self.als.retrieve(customer_ids)
+            als_ids = self._new_extra(als_ids, blocks)
+            blocks.append((als_ids, SOURCE_ALS, np.where(als_ids >= 0, als_scores, -1), -1))
+        if seeds is not None and any(len(items) for items in seeds):
+            if self.copurchase is not None:
+                copurchase_ids, _ = self.copurchase.expand_many(seeds, self.copurchase_candidates)
+                copurchase_ids = self._new_extra(copurchase_ids, blocks)
+                blocks.append((copurchase_ids, SOURCE_ALS, -1, -1))
+            visual_ids, visual_scores = self._visual_candidates(seeds)
+            if visual_ids is not None:
+                visual_ids = self._new_extra(visual_ids, blocks)
+                blocks.append((visual_ids, SOURCE_VISUAL, -1, np.where(visual_ids >= 0, visual_scores, -1)))
+
+        blocks = [block for block in blocks if (block[0] >= 0).any()]
+        if not blocks:
+            return None, None
+        # Scalar column values (a whole block's source, -1 scores) are broadcast to its shape
+        extra_columns = {
+            name: np.concatenate([np.broadcast_to(np.asarray(block[i], dtype=np.float32), block[0].shape)
+                                  for block in blocks], axis=1)
+            for i, name in ((1, 'source'), (2, 'als_score'), (3, 'visual_score'))
+        }
+        return np.concatenate([block[0] for block in blocks], axis=1), extra_columns
+
+    def _new_extra(self, article_ids, blocks):
+        """Eligible extra candidates (not in the pool) not already added by an earlier block."""
+        article_ids = np.where(self.features.eligible_extra(article_ids), article_ids, -1)
+        for earlier, *_ in blocks:
+            article_ids = np.where(isin_rows(article_ids, earlier), -1, article_ids)
+        return article_ids
+
+    def _seed_articles(self, recent_items, history):
+        """
+        Per-user article_id_int seeds: the request's recent items plus the
+        purchases of the last `seed_history_days` (the notebook's visual
+        candidates came from the last weeks of history).
+        """
+        seeds = [self.id_map.encode(items) if items else np.empty(0, dtype=np.int64) for items in recent_items]
+        if history is not None and self.seed_history_days > 0:
+            ids, days = history
+            recent = days > self.purchases.reference_day - self.seed_history_days
+            seeds = [np.concatenate([mine, ids[u][recent[u]]]) for u, mine in enumerate(seeds)]
+        return [mine[mine >= 0] for mine in seeds]
+
+    def expand_seeds(self, article_ids, k=12):
+        """
+        "Bought together": co-purchase candidates for a list of seed article
+        IDs (cart, recent views). Returns [(article_id, weight), ...] best
+        first, excluding the seeds. Raises RuntimeError without the index.
+        """
+        if self.copurchase is None:
+            raise RuntimeError("Co-purchase expansion is not available (copurchase_neighbours.npy not loaded).")
+        ids, weights = self.copurchase.expand_many([self.id_map.encode(article_ids)], k)
+        found = ids[0] >= 0
+        return list(zip(self.id_map.decode(ids[0][found]), weights[0][found].tolist()))
+
+    def _cold_start_many(self, customer_ids, top_k, segments, recent_items):
+        """
+        Users without features: their seed articles (request items and any
+        recent purchases) expanded through the co-purchase index, ranked by
+        co-purchase weight and completed with the segment's cold start list.
+        Without seeds (or without the index) this is the cold start list.
+        """
+        results = [self._get_global_bestsellers(top_k, segment) for segment in segments]
+        if self.copurchase is None:
+            return results
+        seeds = self._seed_articles(recent_items, self._purchase_history(customer_ids))
+        has_seeds = [u for u, mine in enumerate(seeds) if len(mine)]
+        if not has_seeds:
+            return results
+
+        expanded, _ = self.copurchase.expand_many([seeds[u] for u in has_seeds], top_k)
+        for u, ids in zip(has_seeds, expanded):
+            personal = self.id_map.decode(ids[ids >= 0])
+            seen = set(personal)
+            fallback = [a for a in self._get_global_bestsellers(top_k + len(personal), segments[u]) if a not in seen]
+            results[u] = (personal + fallback)[:top_k]
+        return results
+
+    def _apply_purchase_rules(self, article_ids, scores, history):
+        """
+        Already-bought rules on the (n_users, n) score matrix (vectorised set
+        membership against each user's recent purchases):
+        - exclude_purchased_days > 0: items bought that recently get -inf;
+          top-k drops every non-finite pick, so they are never recommended,
+          also when top_k exceeds the remaining candidates
+        - repurchase_boost: added to the score of items bought within the window
+        """
+        if history is None or (self.exclude_purchased_days <= 0 and not self.repurchase_boost):
+            return scores
+        ids, days = history
+        if self.repurchase_boost:
+            scores = np.where(isin_rows(article_ids, ids), scores + self.repurchase_boost, scores)
+        if self.exclude_purchased_days > 0:
+            blocked = np.where(days > self.purchases.reference_day - self.exclude_purchased_days, ids, -1)
+            scores = np.where(isin_rows(article_ids, blocked), -np.inf, scores)
+        return scores
+
+    def add_purchases(self, customer_ids, article_ids, days):
+        """
+        Folds new transactions (article_id_int, day = days since epoch) into
+        the recent purchases index. The new index is swapped in atomically.
+        """
+        if self.purchases is None:
+            if self.repurchase_window_days <= 0:
+                return
+            self.purchases = RecentPurchaseIndex.build(customer_ids, article_ids, days,
+                                                       window_days=self.repurchase_window_days)
+        else:
+            self.purchases = self.purchases.append(customer_ids, article_ids, days)
+
+    def similar_items(self, article_ids, k=12, exact=False):
+        """
+        "More like this": visually similar articles for each string article ID.
+        Returns a list aligned with `article_ids` of [(article_id, score), ...]
+        or None when the article is unknown or has no image.
+        Raises RuntimeError when the visual embeddings are not loaded.
+        """
+        if self.visual is None:
+            raise RuntimeError("Visual similarity is not available (visual_embeddings.npy not loaded).")
+        neighbours = self.visual.similar_many(self.id_map.encode(article_ids), k=k, exact=exact)
+        return [
+            None if found is None else list(zip(self.id_map.decode([a for a, _ in found]), [s for _, s in found]))
+            for found in neighbours
+        ]
+
+    def _visual_candidates(self, seeds):
+        """
+        The notebook's visual candidates: every seed article contributes its
+        `visual_neighbours` nearest articles (not the seed itself), scored by
+        cosine similarity (best over the user's seeds).
+        Returns (article_ids, scores), both (n_users, m) best first with -1
+        padding, or (None, None) without embeddings or seeds with an image.
+        """
+        if self.visual is None or self.visual_neighbours <= 0:
+            return None, None
+
+        # One batched search for all seed articles of all users in the chunk
+        owners, query_rows = [], []
+        for u, items in enumerate(seeds):
+            if len(items):
+                rows = self.visual.rows_for(items)
+                rows = np.unique(rows[rows >= 0])
+                owners.extend([u] * len(rows))
+                query_rows.extend(rows.tolist())
+        if not query_rows:
+            return None, None
+
+        query_rows = np.asarray(query_rows, dtype=np.int64)
+        scores, neighbours = self.visual.search(self.visual.vectors(query_rows), self.visual_neighbours + 1)
+        keep = (neighbours != query_rows[:, None]) & (neighbours >= 0)
+        owners = np.broadcast_to(np.asarray(owners)[:, None], neighbours.shape)[keep]
+        article_ids = self.visual.row_article_ids[neighbours[keep]]
+        scores = scores[keep]
+
+        # Best similarity per (user, article), then each user's articles best first
+        order = np.lexsort((-scores, article_ids, owners))
+        owners, article_ids, scores = owners[order], article_ids[order], scores[order]
+        first = np.concatenate([[True], (owners[1:] != owners[:-1]) | (article_ids[1:] != article_ids[:-1])])
+        owners, article_ids, scores = owners[first], article_ids[first], scores[first]
+        order = np.lexsort((-scores, owners))
+        owners, article_ids, scores = owners[order], article_ids[order], scores[order]
+
+        counts = np.bincount(owners, minlength=len(seeds))
+        slots = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ids_out = np.full((len(seeds), int(counts.max())), -1, dtype=np.int64)
+        scores_out = np.full(ids_out.shape, -1, dtype=np.float32)
+        ids_out[owners, slots] = article_ids
+        scores_out[owners, slots] = scores
+        return ids_out, scores_out
+
+    def warm_up(self, n_users=32, top_k=12):
+        """
+        Runs a sample of real requests (single, batched and cold start) so the
+        first live requests do not pay for lazy initialisation and page faults.
+        Warm-up requests are not recorded in the metrics.
+        """
+        metrics, self.metrics = self.metrics, Metrics(enabled=False)
+        try:
+            customer_ids = self.features.sample_customer_ids(n_users).tolist()
+            if customer_ids:
+                self.recommend(customer_ids[0], top_k=top_k)
+                self.recommend_many(customer_ids, top_k=top_k)
+            self.recommend(-1, top_k=top_k)
+        finally:
+            self.metrics = metrics
+        return len(customer_ids)
+
+    def close(self):
+        """Releases the DuckDB connection and cursors (the engine must no longer be used)."""
+        if isinstance(self.features, DuckDBFeatureStore):
+            self.features.close()
+        self.con.close()
+
+    @staticmethod
+    def _top_k_indices(scores, k):
+        """Indices of the k highest scores, best first."""
+        return RecSysEngine._top_k_indices_grouped(scores[None, :], k)[0]
+
+    @staticmethod
+    def _top_k_indices_grouped(scores, k):
+        """
+        Row-wise top-k for a (n_users, n_candidates) score matrix.
+        argpartition per row, then order only the k winners. Returns (n_users, k);
+        picks with a non-finite score (-1 padding, excluded items) are -1, so
+        a row with fewer than k scorable candidates ends in -1s.
+        """
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.empty((scores.shape[0], 0), dtype=np.int64)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        return np.where(np.isfinite(np.take_along_axis(top_scores, order, axis=1)), top, -1)
+
+    @staticmethod
+    def _ranked_ids(article_ids, top_idx):
+        """article_id_int of the top_idx picks (n_users, k), -1 where top_idx is -1."""
+        return np.where(top_idx >= 0, np.take_along_axis(article_ids, np.maximum(top_idx, 0), axis=1), -1)
+
+    def _build_cold_start(self, ranked_ids, ranked_groups):
+        """
+        Builds the cold start lists from the pool ranked by popularity.
+        Returns {None: global list, index_group: segment list}; each segment
+        list is that segment's items followed by the rest of the global list,
+        so any top_k is a plain slice.
+        """
+        ranked_strs = self.id_map.decode(ranked_ids)
+        groups = np.asarray(ranked_groups)
+
+        cold_start = {None: ranked_strs}
+        for segment in np.unique(groups):
+            in_segment = groups == segment
+            cold_start[int(segment)] = (
+                [a for a, m in zip(ranked_strs, in_segment) if m] +
+                [a for a, m in zip(ranked_strs, in_segment) if not m]
+            )
+        return cold_start
+
+    def _get_global_bestsellers(self, k, segment=None):
+        """Fallback: the most popular items (optionally for one index_group segment)"""
+        ranked = self.cold_start.get(segment, self.cold_start[None])
+        return ranked[:k]
@@ -1,11 +1,23 @@
 import os
+import hmac
+import time
 import logging
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+import threading
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 
 from inference import RecSysEngine
+from engine_manager import EngineManager, ArtifactWatcher, ReloadInProgress
+from batching import MicroBatcher
+from cache import RecommendationCache, InMemorySharedCache
+from streaming import FeatureIngestor, TransactionFileSource, IngestLease
+from metrics import Metrics, SamplingProfiler, start_trace, end_trace
+from executor import InferenceExecutor, Overloaded, InferenceTimeout, split_cores
+from serve import WorkerRegistry
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -19,25 +31,268 @@ ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
 # Note: In Docker, we might map artifacts to /app/artifacts, so default might need adjusting based on deployment.
 # For local testing from 'hm_recsys_app/backend', '../artifacts' is correct.
 
+# Feature backend: "memory" preloads features into NumPy arrays (fast),
+# "duckdb" queries the parquet files per request (low memory).
+FEATURE_BACKEND = os.getenv("FEATURE_BACKEND", "memory")
+
+# Ranker backend: "lightgbm" (Booster) or "native" (NumPy tree evaluator)
+RANKER_BACKEND = os.getenv("RANKER_BACKEND", "lightgbm")
+
+# Compiled artifact bundle (artifacts/engine.bundle): memory-mapped at startup
+# when present. BUNDLE_VERIFY checks every array checksum (reads the whole file).
+# With FEATURE_BACKEND=duckdb, USE_BUNDLE picks the indexed artifacts/features.duckdb
+# (compile_artifacts.py --feature-db) over the parquet views instead.
+USE_BUNDLE = os.getenv("USE_BUNDLE", "true").lower() in ("1", "true", "yes")
+BUNDLE_VERIFY = os.getenv("BUNDLE_VERIFY", "false").lower() in ("1", "true", "yes")
+
+# Batch scoring: max customers per /predict/batch call, and users per LightGBM call
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "64"))
+# Largest top_k accepted by /predict and /predict/batch (422 beyond it)
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "100"))
+
+# Inference executor: engine calls run on INFERENCE_WORKERS threads (0 = one per core),
+# each LightGBM predict using INFERENCE_THREADS OpenMP threads (0 = cores / workers),
+# so workers x threads ~= cores. Up to INFERENCE_QUEUE_SIZE more calls may wait; beyond
+# that requests get 429 at once. Calls slower than REQUEST_TIMEOUT_SECONDS
+# (BATCH_TIMEOUT_SECONDS for the batch endpoints) get 503.
+INFERENCE_WORKERS, INFERENCE_THREADS = split_cores(int(os.getenv("INFERENCE_WORKERS", "0")),
+                                                   int(os.getenv("INFERENCE_THREADS", "0")))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "10"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "120"))
+
+# Micro-batching (opt-in): coalesce concurrent /predict calls arriving within
+# BATCH_WINDOW_MS (or until BATCH_MAX_REQUESTS are queued) into one predict.
+# Batches run one at a time as one call on the inference executor, each predict
+# using the whole INFERENCE_WORKERS x INFERENCE_THREADS budget: while a batch
+# runs, concurrent /predict/batch or /similar calls briefly oversubscribe the cores.
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "false").lower() in ("1", "true", "yes")
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "3"))
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "64"))
+
+# Result cache: per-customer recommendations (LRU + TTL, keyed by artifact version).
+# Misses are computed with at least CACHE_FILL_K items so smaller top_k requests hit.
+# CACHE_SHARED_BACKEND="memory" plugs in the local stand-in for a shared cache.
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "100000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_FILL_K = int(os.getenv("CACHE_FILL_K", "12"))
+CACHE_SHARED_BACKEND = os.getenv("CACHE_SHARED_BACKEND", "")
+
+# Hot reload: POST /admin/reload and an optional watcher polling ARTIFACT_DIR
+# every ARTIFACT_WATCH_INTERVAL seconds. New engines are warmed with
+# RELOAD_WARMUP_USERS requests before the swap; the old engine is released once
+# its in-flight requests finish. The /admin endpoints (reload, profiler) answer
+# 404 unless ADMIN_TOKEN is set, and then require it in X-Admin-Token. A reload
+# can only switch to a directory under RELOAD_ARTIFACT_ROOT (default: the
+# artifact directory loaded at startup); relative paths are taken from there.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+RELOAD_ARTIFACT_ROOT = os.getenv("RELOAD_ARTIFACT_ROOT", "")
+ARTIFACT_WATCH = os.getenv("ARTIFACT_WATCH", "false").lower() in ("1", "true", "yes")
+ARTIFACT_WATCH_INTERVAL = float(os.getenv("ARTIFACT_WATCH_INTERVAL", "30"))
+RELOAD_WARMUP_USERS = int(os.getenv("RELOAD_WARMUP_USERS", "32"))
+RELOAD_DRAIN_TIMEOUT = float(os.getenv("RELOAD_DRAIN_TIMEOUT", "30"))
+
+# Visual similarity (needs artifacts/visual_embeddings.npy, see scripts/build_visual_index.py):
+# VISUAL_SEARCH="ivf" uses artifacts/visual_ivf.npz when present (approximate,
+# VISUAL_NPROBE clusters), "exact" always scans every embedding.
+VISUAL_SEARCH = os.getenv("VISUAL_SEARCH", "ivf")
+VISUAL_NPROBE = int(os.getenv("VISUAL_NPROBE", "8"))
+VISUAL_NEIGHBOURS = int(os.getenv("VISUAL_NEIGHBOURS", "5"))
+MAX_SIMILAR_K = int(os.getenv("MAX_SIMILAR_K", "100"))
+
+# ALS candidates per user on top of the static pool (needs the exported factor
+# matrices, see scripts/export_als_factors.py); 0 disables ALS retrieval.
+ALS_CANDIDATES = int(os.getenv("ALS_CANDIDATES", "50"))
+
+# Recent purchases (needs artifacts/recent_purchases.npz, see scripts/build_recent_purchases.py,
+# and/or the transaction feed below): up to REPURCHASE_CANDIDATES items bought in the last
+# REPURCHASE_WINDOW_DAYS are added as repurchase candidates (0 days disables the index);
+# purchases of the last SEED_HISTORY_DAYS (with the request's recent_article_ids) seed
+# visual_score and co-purchase candidates. Already-bought rules:
+# EXCLUDE_PURCHASED_DAYS > 0 never recommends items bought that recently,
+# REPURCHASE_BOOST is added to the score of items bought within the window.
+REPURCHASE_WINDOW_DAYS = int(os.getenv("REPURCHASE_WINDOW_DAYS", "28"))
+REPURCHASE_CANDIDATES = int(os.getenv("REPURCHASE_CANDIDATES", "32"))
+SEED_HISTORY_DAYS = int(os.getenv("SEED_HISTORY_DAYS", "14"))
+EXCLUDE_PURCHASED_DAYS = int(os.getenv("EXCLUDE_PURCHASED_DAYS", "0"))
+REPURCHASE_BOOST = float(os.getenv("REPURCHASE_BOOST", "0"))
+
+# Co-purchase expansion of seed articles (needs artifacts/copurchase_neighbours.npy +
+# copurchase_weights.npy, see scripts/build_copurchase_index.py); 0 disables it.
+COPURCHASE_CANDIDATES = int(os.getenv("COPURCHASE_CANDIDATES", "20"))
+
+# Streaming user features (memory backend only): new transactions appended to
+# FEATURE_STREAM_PATH (CSV: t_dat,customer_id_int,article_id_int,price) update
+# the user features in place; snapshots + the feed offset go to FEATURE_SNAPSHOT_DIR.
+# FEATURE_REFERENCE_DATE anchors days_since_last_buy ("latest" = newest transaction seen).
+# A features.duckdb in FEATURE_SNAPSHOT_DIR (an artifact directory served with
+# FEATURE_BACKEND=duckdb elsewhere) is recompiled after each snapshot, else it goes stale.
+# With serve.py, one worker (holder of FEATURE_SNAPSHOT_DIR/ingest.lock) reads the feed and
+# writes the snapshots; the others apply each snapshot, i.e. lag by up to FEATURE_SNAPSHOT_SECONDS,
+# and take over when it exits. A day roll bumps the result cache's epoch (one O(1) reset).
+FEATURE_STREAM_PATH = os.getenv("FEATURE_STREAM_PATH", "")
+FEATURE_STREAM_POLL_SECONDS = float(os.getenv("FEATURE_STREAM_POLL_SECONDS", "5"))
+FEATURE_SNAPSHOT_DIR = os.getenv("FEATURE_SNAPSHOT_DIR", "snapshots")
+FEATURE_SNAPSHOT_SECONDS = float(os.getenv("FEATURE_SNAPSHOT_SECONDS", "300"))
+FEATURE_REFERENCE_DATE = os.getenv("FEATURE_REFERENCE_DATE", "2020-09-15")
+
+# Metrics: GET /metrics (Prometheus text format) with per-stage latency histograms,
+# candidate counts, cold start rate, predict batch sizes and cache / micro-batching /
+# reload gauges. METRICS_ENABLED=false turns recording into no-ops.
+# Trace headers (Server-Timing with the stage timings, X-Request-ID) are added to
+# every response with TRACE_HEADERS=true, otherwise only to requests sent with "X-Trace: 1".
+# Sampling profiler for slow engine calls: off until PROFILER_ENABLED=true or
+# POST /admin/profiler; calls slower than PROFILER_SLOW_MS keep their stacks
+# (sampled every PROFILER_INTERVAL_MS) for GET /admin/profiler.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_HEADERS = os.getenv("TRACE_HEADERS", "false").lower() in ("1", "true", "yes")
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", "250"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+
+# Multi-process serving (set by serve.py): SERVE_WORKERS processes share the mapped
+# engine bundle and register in SERVE_STATE_DIR once loaded; GET /ready answers 503
+# until all of them have attached. Without serve.py the process is its own only worker.
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "1"))
+SERVE_STATE_DIR = os.getenv("SERVE_STATE_DIR", "")
+
 # --- Global Components ---
-rec_engine = None
+engine_manager = None
+watcher = None
+batcher = None
+result_cache = None
+ingestor = None
+inference = None
+worker_registry = None
+artifact_root = None
+
+# Process-wide: survives engine hot reloads
+profiler = SamplingProfiler(interval_ms=PROFILER_INTERVAL_MS, slow_ms=PROFILER_SLOW_MS)
+metrics = Metrics(enabled=METRICS_ENABLED, profiler=profiler)
 
 class RecommendationRequest(BaseModel):
     customer_id: int
-    top_k: int = 12
+    top_k: int = Field(12, gt=0, le=MAX_TOP_K)
+    # Optional index_group code used to pick the cold start list for unknown users
+    segment: Optional[int] = None
+    # Optional article IDs the user just bought/viewed/added to cart
+    # (seed visual_score and co-purchase candidates, also for unknown users)
+    recent_article_ids: Optional[List[str]] = None
 
 class RecommendationResponse(BaseModel):
     customer_id: int
     recommendations: List[str]
 
+class BatchRecommendationRequest(BaseModel):
+    customer_ids: List[int]
+    top_k: int = Field(12, gt=0, le=MAX_TOP_K)
+    segment: Optional[int] = None
+    # Optional, aligned with customer_ids
+    recent_article_ids: Optional[List[Optional[List[str]]]] = None
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse]
+
+class SimilarItem(BaseModel):
+    article_id: str
+    score: float
+
+class SimilarResponse(BaseModel):
+    article_id: str
+    similar: List[SimilarItem]
+
+class BatchSimilarRequest(BaseModel):
+    article_ids: List[str]
+    k: int = 12
+    exact: bool = False
+
+class BatchSimilarResponse(BaseModel):
+    # Articles that are unknown or have no image are returned with an empty list
+    results: List[SimilarResponse]
+
+class BoughtTogetherRequest(BaseModel):
+    # Seed articles, e.g. the cart or recently viewed items
+    article_ids: List[str]
+    k: int = 12
+
+class BoughtTogetherResponse(BaseModel):
+    article_ids: List[str]
+    candidates: List[SimilarItem]
+
+class ReloadRequest(BaseModel):
+    # Defaults to the directory the current engine was loaded from;
+    # otherwise a directory under RELOAD_ARTIFACT_ROOT
+    artifact_dir: Optional[str] = None
+    # Swap even if the new engine has the same artifact version
+    force: bool = False
+    # Block until the new engine is active (otherwise reload in the background)
+    wait: bool = False
+
+class ProfilerRequest(BaseModel):
+    enabled: bool
+    # Keep the stacks of engine calls slower than this
+    slow_ms: Optional[float] = None
+    interval_ms: Optional[float] = None
+
+def _build_engine(artifact_dir):
+    return RecSysEngine(artifact_dir=artifact_dir, feature_backend=FEATURE_BACKEND,
+                        batch_chunk_size=BATCH_CHUNK_SIZE, ranker_backend=RANKER_BACKEND,
+                        use_bundle=USE_BUNDLE, verify_bundle=BUNDLE_VERIFY,
+                        visual_search=VISUAL_SEARCH, visual_nprobe=VISUAL_NPROBE,
+                        visual_neighbours=VISUAL_NEIGHBOURS, als_candidates=ALS_CANDIDATES,
+                        repurchase_window_days=REPURCHASE_WINDOW_DAYS, repurchase_candidates=REPURCHASE_CANDIDATES,
+                        seed_history_days=SEED_HISTORY_DAYS, exclude_purchased_days=EXCLUDE_PURCHASED_DAYS,
+                        repurchase_boost=REPURCHASE_BOOST, copurchase_candidates=COPURCHASE_CANDIDATES,
+                        metrics=metrics, predict_threads=INFERENCE_THREADS)
+
+def _component_metrics():
+    """Scrape-time samples from the serving components (name, type, help, labels, value)."""
+    if engine_manager is not None:
+        engine_stats = engine_manager.stats()
+        yield "recsys_model_loaded", "gauge", "1 when an engine is serving.", {}, engine_stats["active"] is not None
+        yield "recsys_engine_generation", "gauge", "Engine generation (incremented per swap).", {}, engine_stats["generation"]
+        yield "recsys_reloads_total", "counter", "Completed hot reloads.", {}, engine_stats["reloads"]
+        yield "recsys_failed_reloads_total", "counter", "Failed hot reloads.", {}, engine_stats["failed_reloads"]
+    if result_cache is not None:
+        cache_stats = result_cache.stats()
+        yield "recsys_cache_hits_total", "counter", "Result cache hits.", {}, cache_stats["hits"]
+        yield "recsys_cache_misses_total", "counter", "Result cache misses.", {}, cache_stats["misses"]
+        yield "recsys_cache_hit_ratio", "gauge", "Result cache hits / lookups.", {}, cache_stats["hit_ratio"]
+        yield "recsys_cache_entries", "gauge", "Result cache entries.", {}, cache_stats["entries"]
+        yield "recsys_cache_evictions_total", "counter", "Result cache LRU evictions.", {}, cache_stats["evictions"]
+    if batcher is not None:
+        batch_stats = batcher.stats()
+        yield "recsys_microbatch_batches_total", "counter", "Micro-batches scored.", {}, batch_stats["batches"]
+        yield "recsys_microbatch_requests_total", "counter", "Requests scored in micro-batches.", {}, batch_stats["requests"]
+        yield "recsys_microbatch_queue_depth", "gauge", "Requests waiting for a micro-batch.", {}, batch_stats["queue_depth"]
+    if inference is not None:
+        executor_stats = inference.stats()
+        yield "recsys_inference_running", "gauge", "Engine calls running on inference threads.", {}, executor_stats["running"]
+        yield "recsys_inference_queued", "gauge", "Engine calls waiting for an inference thread.", {}, executor_stats["queued"]
+        yield "recsys_inference_rejected_total", "counter", "Calls rejected with 429 (queue full).", {}, executor_stats["rejected"]
+        yield "recsys_inference_timeouts_total", "counter", "Calls that exceeded their timeout (503).", {}, executor_stats["timeouts"]
+    if ingestor is not None:
+        stream_stats = ingestor.stats()
+        yield "recsys_stream_transactions_total", "counter", "Transactions ingested from the feed.", {}, stream_stats["transactions"]
+        yield "recsys_stream_customers_updated_total", "counter", "User feature rows updated by the feed.", {}, stream_stats["customers_updated"]
+
+metrics.add_collector(_component_metrics)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Load the model on startup.
     """
-    global rec_engine
+    global engine_manager, watcher, batcher, result_cache, ingestor, inference, worker_registry, artifact_root
     logger.info("Server Starting: Loading Recommendation Engine...")
     try:
+        inference = InferenceExecutor(INFERENCE_WORKERS, max_queue=INFERENCE_QUEUE_SIZE,
+                                      default_timeout=REQUEST_TIMEOUT_SECONDS)
+        logger.info(f"Inference executor: {INFERENCE_WORKERS} worker(s) x {INFERENCE_THREADS} predict thread(s), "
+                    f"queue {INFERENCE_QUEUE_SIZE}.")
+
         # Check if we are in Docker (standard path usually /app/artifacts or similar) or local
         # If running from backend dir locally, artifacts are at ../artifacts
         path_to_use = ARTIFACT_DIR
@@ -47,8 +302,56 @@ async def lifespan(app: FastAPI):
              path_to_use = "artifacts"
         
         logger.info(f"Loading artifacts from: {os.path.abspath(path_to_use)}")
-        rec_engine = RecSysEngine(artifact_dir=path_to_use)
+        artifact_root = os.path.realpath(RELOAD_ARTIFACT_ROOT or path_to_use)
+        manager = EngineManager(_build_engine, path_to_use, warmup_users=RELOAD_WARMUP_USERS,
+                                drain_timeout=RELOAD_DRAIN_TIMEOUT)
+        await run_in_threadpool(manager.load)
+        engine_manager = manager
         logger.info("Recommendation Engine Loaded Successfully.")
+
+        if ARTIFACT_WATCH:
+            watcher = ArtifactWatcher(engine_manager, interval_seconds=ARTIFACT_WATCH_INTERVAL)
+            watcher.start()
+            logger.info(f"Watching {path_to_use} for artifact changes (every {ARTIFACT_WATCH_INTERVAL}s).")
+
+        if RESULT_CACHE:
+            shared = InMemorySharedCache() if CACHE_SHARED_BACKEND == "memory" else None
+            result_cache = RecommendationCache(max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, shared=shared)
+            logger.info(f"Result cache enabled ({CACHE_MAX_ENTRIES} entries, {CACHE_TTL_SECONDS}s TTL).")
+
+        if FEATURE_STREAM_PATH:
+            if FEATURE_BACKEND != "memory":
+                logger.warning("FEATURE_STREAM_PATH needs FEATURE_BACKEND=memory; streaming updates are disabled.")
+            else:
+                manager = engine_manager
+                ingestor = FeatureIngestor.resume(
+                    lambda: manager.engine, TransactionFileSource(FEATURE_STREAM_PATH), FEATURE_SNAPSHOT_DIR,
+                    reference_date=FEATURE_REFERENCE_DATE, snapshot_seconds=FEATURE_SNAPSHOT_SECONDS,
+                    poll_seconds=FEATURE_STREAM_POLL_SECONDS,
+                    on_update=result_cache.discard if result_cache is not None else None,
+                    on_reset=result_cache.bump_epoch if result_cache is not None else None,
+                    lease=IngestLease(FEATURE_SNAPSHOT_DIR),
+                )
+                ingestor.start()
+                logger.info(f"Streaming user features from {FEATURE_STREAM_PATH} (every {FEATURE_STREAM_POLL_SECONDS}s).")
+
+        if MICRO_BATCHING:
+            batcher = MicroBatcher(engine_manager, inference, max_wait_ms=BATCH_WINDOW_MS,
+                                   max_batch_size=BATCH_MAX_REQUESTS, max_queue=INFERENCE_QUEUE_SIZE,
+                                   predict_threads=INFERENCE_WORKERS * INFERENCE_THREADS)
+            await batcher.start()
+            logger.info(f"Micro-batching enabled ({BATCH_WINDOW_MS} ms window, max {BATCH_MAX_REQUESTS} requests).")
+
+        if PROFILER_ENABLED:
+            profiler.start()
+            logger.info(f"Sampling profiler on (calls slower than {PROFILER_SLOW_MS} ms are kept).")
+
+        if SERVE_STATE_DIR:
+            active = engine_manager.stats()["active"]
+            worker_registry = WorkerRegistry(SERVE_STATE_DIR, SERVE_WORKERS)
+            worker_registry.register({"artifact_version": active["artifact_version"],
+                                      "load_seconds": active["load_seconds"]})
+            logger.info(f"Worker {os.getpid()} attached ({len(worker_registry.attached())}/{SERVE_WORKERS}).")
     except Exception as e:
         logger.error(f"Failed to load Recommendation Engine: {e}")
         raise e
@@ -56,38 +359,326 @@ async def lifespan(app: FastAPI):
     yield
     
     # Clean up (if needed)
-    rec_engine = None
+    if worker_registry is not None:
+        worker_registry.unregister()
+        worker_registry = None
+    if ingestor is not None:
+        ingestor.stop()
+        ingestor = None
+    if watcher is not None:
+        watcher.stop()
+        watcher = None
+    if batcher is not None:
+        await batcher.stop()
+        batcher = None
+    profiler.stop()
+    if inference is not None:
+        inference.shutdown(wait=False)
+        inference = None
+    engine_manager = None
     logger.info("Server Shutting Down.")
 
+def _on_engine(method, *args, **kwargs):
+    """
+    Runs engine.<method> on an inference thread, pinned to one engine
+    generation for the whole call (also if the request times out meanwhile).
+    Returns (artifact_version, result).
+    """
+    with engine_manager.acquire() as engine:
+        return engine.artifact_version, getattr(engine, method)(*args, **kwargs)
+
+def _rejected(e):
+    """429 when the inference queue is full, 503 when the call timed out."""
+    status_code = 429 if isinstance(e, Overloaded) else 503
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": "1"})
+
+def _require_admin(x_admin_token):
+    """The /admin endpoints do not exist without ADMIN_TOKEN; with it they need the token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+def _reload_dir(artifact_dir):
+    """Resolves a reload's artifact_dir, which must be a directory under the artifact root."""
+    path = os.path.realpath(os.path.join(artifact_root, artifact_dir))
+    if os.path.commonpath([artifact_root, path]) != artifact_root:
+        raise HTTPException(status_code=403, detail=f"Artifact directory outside {artifact_root}: {artifact_dir}")
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail=f"Artifact directory not found: {artifact_dir}")
+    return path
+
 # --- API Definition ---
 app = FastAPI(title="H&M RecSys API", version="1.0", lifespan=lifespan)
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Request duration by route and status, and (when tracing) the engine's
+    stage timings as a Server-Timing header plus an X-Request-ID.
+    """
+    traced = TRACE_HEADERS or request.headers.get("x-trace") == "1"
+    if not traced and not metrics.enabled:
+        return await call_next(request)
+
+    start = time.perf_counter()
+    trace, token = start_trace(request.headers.get("x-request-id")) if traced else (None, None)
+    try:
+        response = await call_next(request)
+    finally:
+        if token is not None:
+            end_trace(token)
+    route = request.scope.get("route")
+    metrics.observe("recsys_http_request_seconds", time.perf_counter() - start,
+                    route=route.path if route is not None else "unmatched", status=response.status_code)
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Request-ID"] = trace.request_id
+    return response
+
 @app.get("/")
 def health_check():
     """Health check endpoint for cloud orchestration."""
-    if rec_engine is None:
+    if engine_manager is None or engine_manager.engine is None:
         return {"status": "starting", "model_loaded": False}
-    return {"status": "alive", "model_loaded": True}
+    engine_stats = engine_manager.stats()
+    active = engine_stats["active"]
+    status = {"status": "alive", "model_loaded": True, "feature_backend": FEATURE_BACKEND,
+              "ranker_backend": RANKER_BACKEND, "artifact_version": active["artifact_version"],
+              "load_seconds": active["load_seconds"], "engine": engine_stats}
+    if batcher is not None:
+        status["micro_batching"] = batcher.stats()
+    if result_cache is not None:
+        status["result_cache"] = result_cache.stats()
+    if ingestor is not None:
+        status["feature_stream"] = ingestor.stats()
+    if inference is not None:
+        status["inference"] = {**inference.stats(), "predict_threads": INFERENCE_THREADS}
+    if worker_registry is not None:
+        status["serving"] = {"pid": os.getpid(), **worker_registry.stats()}
+    return status
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """Readiness probe: 503 until this worker and every other serving worker have loaded."""
+    if engine_manager is None or engine_manager.engine is None:
+        response.status_code = 503
+        return {"ready": False, "model_loaded": False}
+    if worker_registry is None:
+        return {"ready": True, "model_loaded": True, "expected": 1, "attached": 1}
+    serving = worker_registry.stats()
+    ready = serving["attached"] >= serving["expected"]
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "model_loaded": True, **serving}
 
 @app.post("/predict", response_model=RecommendationResponse)
-def predict(request: RecommendationRequest):
+async def predict(request: RecommendationRequest):
     """
     Generate recommendations for a given user.
     """
-    if rec_engine is None:
+    if engine_manager is None:
         raise HTTPException(status_code=503, detail="Model not yet loaded.")
     
     try:
         logger.info(f"Received request for User {request.customer_id}")
-        recs = rec_engine.recommend(request.customer_id, top_k=request.top_k)
+        # Results that depend on the request's recent items are never cached
+        cache = result_cache if not request.recent_article_ids else None
+        if cache is not None:
+            recs = cache.get(request.customer_id, request.top_k, engine_manager.engine.artifact_version,
+                             segment=request.segment)
+            if recs is not None:
+                return {"customer_id": request.customer_id, "recommendations": recs}
+
+        # Compute at least CACHE_FILL_K so the entry also serves smaller top_k requests
+        fill_k = max(request.top_k, CACHE_FILL_K) if cache is not None else request.top_k
+        if batcher is not None:
+            # The version of the engine that scored the batch: a reload may land while queued
+            version, recs = await batcher.submit(request.customer_id, top_k=fill_k, segment=request.segment,
+                                        recent_items=request.recent_article_ids, timeout=REQUEST_TIMEOUT_SECONDS)
+        else:
+            version, recs = await inference.run(_on_engine, "recommend", request.customer_id, top_k=fill_k,
+                                                segment=request.segment, recent_items=request.recent_article_ids)
+
+        if cache is not None:
+            cache.put(request.customer_id, fill_k, version, recs, segment=request.segment)
+            recs = recs[:request.top_k]
         return {
             "customer_id": request.customer_id,
             "recommendations": recs
         }
+    except (Overloaded, InferenceTimeout) as e:
+        raise _rejected(e)
     except Exception as e:
         logger.error(f"Prediction Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/predict/batch", response_model=BatchRecommendationResponse)
+async def predict_batch(request: BatchRecommendationRequest):
+    """
+    Generate recommendations for many users in one call
+    (campaign precompute, cache warming).
+    """
+    if engine_manager is None:
+        raise HTTPException(status_code=503, detail="Model not yet loaded.")
+    if len(request.customer_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(request.customer_ids)} > {MAX_BATCH_SIZE} customers.")
+    recent = request.recent_article_ids or [None] * len(request.customer_ids)
+    if len(recent) != len(request.customer_ids):
+        raise HTTPException(status_code=422, detail="recent_article_ids must be aligned with customer_ids.")
+    
+    try:
+        logger.info(f"Received batch request for {len(request.customer_ids)} users")
+        recs = [None] * len(request.customer_ids)
+        if result_cache is not None:
+            version = engine_manager.engine.artifact_version
+            recs = [result_cache.get(cid, request.top_k, version, segment=request.segment)
+                    if not items else None
+                    for cid, items in zip(request.customer_ids, recent)]
+
+        misses = [i for i, r in enumerate(recs) if r is None]
+        if misses:
+            version, computed = await inference.run(
+                _on_engine, "recommend_many", [request.customer_ids[i] for i in misses], top_k=request.top_k,
+                segments=[request.segment] * len(misses), recent_items=[recent[i] for i in misses],
+                timeout=BATCH_TIMEOUT_SECONDS,
+            )
+            for i, r in zip(misses, computed):
+                recs[i] = r
+                if result_cache is not None and not recent[i]:
+                    result_cache.put(request.customer_ids[i], request.top_k, version, r, segment=request.segment)
+        return {
+            "results": [
+                {"customer_id": cid, "recommendations": r}
+                for cid, r in zip(request.customer_ids, recs)
+            ]
+        }
+    except (Overloaded, InferenceTimeout) as e:
+        raise _rejected(e)
+    except Exception as e:
+        logger.error(f"Batch Prediction Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/similar/{article_id}", response_model=SimilarResponse)
+async def similar(article_id: str, k: int = 12, exact: bool = False):
+    """
+    "More like this": the k most visually similar articles (cosine similarity
+    of the ResNet embeddings), best first.
+    """
+    if engine_manager is None:
+        raise HTTPException(status_code=503, detail="Model not yet loaded.")
+    if not 0 < k <= MAX_SIMILAR_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {MAX_SIMILAR_K}.")
+    if engine_manager.engine.visual is None:
+        raise HTTPException(status_code=503, detail="Visual similarity is not available.")
+    try:
+        _, found = await inference.run(_on_engine, "similar_items", [article_id], k=k, exact=exact)
+    except (Overloaded, InferenceTimeout) as e:
+        raise _rejected(e)
+    found = found[0]
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"No visual embedding for article {article_id}.")
+    return {"article_id": article_id, "similar": [{"article_id": a, "score": s} for a, s in found]}
+
+@app.post("/similar/batch", response_model=BatchSimilarResponse)
+async def similar_batch(request: BatchSimilarRequest):
+    """Visually similar articles for many articles in one batched search."""
+    if engine_manager is None:
+        raise HTTPException(status_code=503, detail="Model not yet loaded.")
+    if not 0 < request.k <= MAX_SIMILAR_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {MAX_SIMILAR_K}.")
+    if len(request.article_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(request.article_ids)} > {MAX_BATCH_SIZE} articles.")
+    if engine_manager.engine.visual is None:
+        raise HTTPException(status_code=503, detail="Visual similarity is not available.")
+    try:
+        _, found = await inference.run(_on_engine, "similar_items", request.article_ids, k=request.k,
+                                       exact=request.exact, timeout=BATCH_TIMEOUT_SECONDS)
+    except (Overloaded, InferenceTimeout) as e:
+        raise _rejected(e)
+    return {
+        "results": [
+            {"article_id": aid, "similar": [{"article_id": a, "score": s} for a, s in (items or [])]}
+            for aid, items in zip(request.article_ids, found)
+        ]
+    }
+
+@app.post("/bought-together", response_model=BoughtTogetherResponse)
+async def bought_together(request: BoughtTogetherRequest):
+    """
+    Co-purchase expansion of a set of seed articles (cart, recent views):
+    articles most often bought with them, weighted over all seeds.
+    """
+    if engine_manager is None:
+        raise HTTPException(status_code=503, detail="Model not yet loaded.")
+    if not 0 < request.k <= MAX_SIMILAR_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {MAX_SIMILAR_K}.")
+    if engine_manager.engine.copurchase is None:
+        raise HTTPException(status_code=503, detail="Co-purchase expansion is not available.")
+    try:
+        _, found = await inference.run(_on_engine, "expand_seeds", request.article_ids, k=request.k)
+    except (Overloaded, InferenceTimeout) as e:
+        raise _rejected(e)
+    return {"article_ids": request.article_ids, "candidates": [{"article_id": a, "score": s} for a, s in found]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/profiler")
+def configure_profiler(request: ProfilerRequest, x_admin_token: Optional[str] = Header(default=None)):
+    """Switches the slow-call sampling profiler on or off at runtime."""
+    _require_admin(x_admin_token)
+    if request.enabled:
+        profiler.start(interval_ms=request.interval_ms, slow_ms=request.slow_ms)
+    else:
+        profiler.stop()
+    return profiler.stats()
+
+@app.get("/admin/profiler")
+def profiler_report(format: str = "json", x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Slow engine calls captured by the profiler: a JSON summary, or with
+    format=folded all their samples as folded stacks (flamegraph.pl / speedscope).
+    """
+    _require_admin(x_admin_token)
+    if format == "folded":
+        return PlainTextResponse(profiler.folded())
+    return profiler.stats()
+
+@app.post("/admin/reload", status_code=202)
+async def reload_artifacts(request: ReloadRequest, response: Response,
+                           x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Loads a new engine from the artifact directory and swaps it in without
+    dropping traffic. Runs in the background unless `wait` is set.
+    """
+    _require_admin(x_admin_token)
+    if engine_manager is None:
+        raise HTTPException(status_code=503, detail="Model not yet loaded.")
+    if engine_manager.reloading:
+        raise HTTPException(status_code=409, detail="A reload is already running.")
+    artifact_dir = _reload_dir(request.artifact_dir) if request.artifact_dir is not None else None
+
+    if request.wait:
+        response.status_code = 200
+        try:
+            return await run_in_threadpool(engine_manager.load, artifact_dir, request.force)
+        except ReloadInProgress as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+    def _reload():
+        try:
+            engine_manager.load(artifact_dir, request.force)
+        except Exception:
+            pass  # recorded in engine_manager.last_reload
+
+    threading.Thread(target=_reload, name="engine-reload", daemon=True).start()
+    return {"status": "reloading", "artifact_version": engine_manager.engine.artifact_version}
+
 if __name__ == "__main__":
     import uvicorn
     # Allow running directly for debugging
@@ -0,0 +1,354 @@
+import sys
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import Counter, deque
+
+import numpy as np
+
+# Histogram buckets (Prometheus `le` bounds; +Inf is implicit)
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CANDIDATE_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 7500, 10000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+ROW_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000)
+
+# name -> (type, help, buckets); every metric the engine and the API record
+METRICS = {
+    "recsys_stage_seconds": ("histogram", "Time spent in each recommendation stage.", SECONDS_BUCKETS),
+    "recsys_engine_seconds": ("histogram", "Engine call duration (recommend / recommend_many).", SECONDS_BUCKETS),
+    "recsys_users_total": ("counter", "Users scored, by path (known = ranked, cold = cold start).", None),
+    "recsys_candidates_per_user": ("histogram", "Candidate rows scored per known user.", CANDIDATE_BUCKETS),
+    "recsys_predict_users": ("histogram", "Users per ranker predict call.", BATCH_BUCKETS),
+    "recsys_predict_rows": ("histogram", "Feature rows per ranker predict call.", ROW_BUCKETS),
+    "recsys_http_request_seconds": ("histogram", "HTTP request duration by route and status.", SECONDS_BUCKETS),
+    "recsys_slow_profiles_total": ("counter", "Engine calls captured by the sampling profiler.", None),
+}
+
+# Trace of the request being handled (set by the API middleware). Starlette's
+# threadpool copies the context, so engine stages running in a worker thread
+# add their timings to the request's trace.
+_current_trace = contextvars.ContextVar("recsys_trace", default=None)
+
+
+class RequestTrace:
+    """Per-request stage timings, returned as Server-Timing / X-Request-ID headers."""
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """Server-Timing header value (durations in ms), total last."""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def start_trace(request_id=None):
+    """Makes a new trace current for this request; returns (trace, token for end_trace)."""
+    trace = RequestTrace(request_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+class _NullTimer:
+    """Shared no-op timer: what a stage costs when metrics and tracing are off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "trace", "start")
+
+    def __init__(self, metrics, stage, trace):
+        self.metrics = metrics
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.metrics.enabled:
+            self.metrics.observe("recsys_stage_seconds", elapsed, stage=self.stage)
+        if self.trace is not None:
+            self.trace.add(self.stage, elapsed)
+        return False
+
+
+class _CallTimer:
+    """Times a whole engine call; registers the thread with the profiler while it runs."""
+    __slots__ = ("metrics", "method", "start", "profiling")
+
+    def __init__(self, metrics, method):
+        self.metrics = metrics
+        self.method = method
+
+    def __enter__(self):
+        profiler = self.metrics.profiler
+        self.profiling = profiler is not None and profiler.running
+        if self.profiling:
+            profiler.begin()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.metrics.enabled:
+            self.metrics.observe("recsys_engine_seconds", elapsed, method=self.method)
+        if self.profiling and self.metrics.profiler.end(self.method, elapsed) and self.metrics.enabled:
+            self.metrics.inc("recsys_slow_profiles_total", method=self.method)
+        return False
+
+
+class Metrics:
+    """
+    In-process metrics registry with Prometheus text exposition.
+
+    Counters and histograms are plain dicts keyed by (name, labels) behind
+    one lock; histograms keep per-bucket counts, a sum and a count. Values
+    owned by other components (cache hit ratio, micro-batch queue depth,
+    reload counters) are not pushed on the request path: `collectors` are
+    called at scrape time and return (name, type, help, labels, value)
+    samples.
+
+    With enabled=False every record call returns immediately and stage()
+    hands out a shared no-op timer (unless the request is being traced).
+    """
+    def __init__(self, enabled=True, profiler=None):
+        self.enabled = enabled
+        self.profiler = profiler
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    # --- Recording ---
+
+    def stage(self, name):
+        """Context manager timing one stage into recsys_stage_seconds and the current trace."""
+        trace = _current_trace.get()
+        if not self.enabled and trace is None:
+            return _NULL_TIMER
+        return _StageTimer(self, name, trace)
+
+    def call(self, method):
+        """Context manager around a whole engine call (duration + slow-call profiling)."""
+        if not self.enabled and self.profiler is None:
+            return _NULL_TIMER
+        return _CallTimer(self, method)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            hist[0][bisect.bisect_left(buckets, value)] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def observe_many(self, name, values, **labels):
+        """observe() for an array of values (one bucket count per batch, not per value)."""
+        if not self.enabled or len(values) == 0:
+            return
+        buckets = METRICS[name][2]
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.bincount(np.searchsorted(buckets, values, side='left'), minlength=len(buckets) + 1)
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            for i in np.flatnonzero(counts):
+                hist[0][i] += int(counts[i])
+            hist[1] += float(values.sum())
+            hist[2] += len(values)
+
+    def add_collector(self, collector):
+        """collector() -> iterable of (name, type, help, labels dict, value), called per scrape."""
+        self._collectors.append(collector)
+
+    # --- Exposition ---
+
+    def render(self):
+        """Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            samples = counters if kind == "counter" else histograms
+            keys = sorted(key for key in samples if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = dict(key[1])
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(samples[key])}")
+                    continue
+                bucket_counts, total, count = samples[key]
+                cumulative = np.cumsum(bucket_counts)
+                for bound, n in zip(buckets + (float("inf"),), cumulative):
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {int(n)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        described = set()
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                if value is None:
+                    continue
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    return repr(float(value))
+
+
+class SamplingProfiler:
+    """
+    Low-rate stack sampler for slow engine calls, switched on at runtime.
+
+    While running, a daemon thread wakes every `interval_ms` and reads the
+    current stack of each thread inside an engine call (sys._current_frames).
+    Stacks are kept in folded form ("module:function;module:function" ->
+    sample count, the flamegraph.pl / speedscope input). When a call ends,
+    its samples are kept only if it took at least `slow_ms`; the last
+    `keep` slow calls are retained.
+    """
+    def __init__(self, interval_ms=5.0, slow_ms=250.0, keep=20):
+        self.interval = interval_ms / 1000.0
+        self.slow_ms = slow_ms
+        self.profiles = deque(maxlen=keep)
+        self._active = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_ms=None, slow_ms=None):
+        if interval_ms is not None:
+            self.interval = interval_ms / 1000.0
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+        with self._lock:
+            self._active.clear()
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self, label, seconds):
+        """Stops sampling the calling thread; returns True if the call was kept as slow."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or seconds * 1000 < self.slow_ms:
+            return False
+        trace = _current_trace.get()
+        self.profiles.append({
+            "label": label,
+            "request_id": trace.request_id if trace is not None else None,
+            "duration_ms": round(seconds * 1000, 2),
+            "captured_at": time.time(),
+            "samples": sum(samples.values()),
+            "stacks": dict(samples.most_common()),
+        })
+        return True
+
+    def folded(self):
+        """All retained slow-call samples merged, one "stack count" line per stack."""
+        merged = Counter()
+        for profile in list(self.profiles):
+            merged.update(profile["stacks"])
+        return "\n".join(f"{stack} {n}" for stack, n in merged.most_common()) + "\n"
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "slow_ms": self.slow_ms,
+            "profiles": [{k: v for k, v in p.items() if k != "stacks"} for p in list(self.profiles)],
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = list(self._active.items())
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    samples[";".join(reversed(stack))] += 1
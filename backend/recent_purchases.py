@@ -0,0 +1,206 @@
+import os
+import numpy as np
+
+# Built by scripts/build_recent_purchases.py from the transactions
+RECENT_PURCHASES_FILENAME = "recent_purchases.npz"
+
+
+class RecentPurchaseIndex:
+    """
+    Time-windowed per-customer purchase history in CSR form.
+
+    offsets[c]:offsets[c + 1] delimits customer_id_int c's entries in
+    `items` (article_id_int) and `days` (last purchase day, days since
+    epoch). Each (customer, article) pair appears once, most recent first,
+    and entries older than `window_days` before `reference_day` are dropped.
+
+    Instances are immutable: `append` returns a new index, so the engine
+    can swap it in while requests keep reading the previous one.
+    """
+    def __init__(self, offsets, items, days, reference_day, window_days=28):
+        self.offsets = offsets
+        self.items = items
+        self.days = days
+        self.reference_day = int(reference_day)
+        self.window_days = window_days
+
+    @classmethod
+    def build(cls, customer_ids, article_ids, days, window_days=28, reference_day=None, n_customers=None):
+        """
+        Index from raw transactions (three aligned arrays). `reference_day`
+        defaults to the newest transaction (the window ends there).
+        """
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        article_ids = np.asarray(article_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        if reference_day is None:
+            reference_day = int(days.max()) if len(days) else 0
+        n_customers = max(n_customers or 0, int(customer_ids.max()) + 1 if len(customer_ids) else 0)
+
+        keep = days > reference_day - window_days
+        customer_ids, article_ids, days = customer_ids[keep], article_ids[keep], days[keep]
+
+        # Most recent first per customer; then one entry per (customer, article)
+        order = np.lexsort((article_ids, -days, customer_ids))
+        customer_ids, article_ids, days = customer_ids[order], article_ids[order], days[order]
+        pair = customer_ids * (int(article_ids.max()) + 1 if len(article_ids) else 1) + article_ids
+        _, first = np.unique(pair, return_index=True)
+        first.sort()
+        customer_ids, article_ids, days = customer_ids[first], article_ids[first], days[first]
+
+        offsets = np.zeros(n_customers + 1, dtype=np.int64)
+        np.cumsum(np.bincount(customer_ids, minlength=n_customers), out=offsets[1:])
+        return cls(offsets, article_ids.astype(np.int32), days.astype(np.int32), reference_day, window_days)
+
+    @classmethod
+    def from_transactions(cls, paths, window_days=28, reference_date=None, con=None):
+        """
+        Builds the index from transaction files (parquet or CSV with t_dat,
+        customer_id_int, article_id_int). Only the window is read: DuckDB
+        filters and deduplicates the rows before they reach NumPy.
+        """
+        import duckdb
+        from feature_db import sql_string
+        con = con or duckdb.connect(database=':memory:')
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        reader = "read_parquet" if all(p.endswith(".parquet") for p in paths) else "read_csv_auto"
+        source = f"{reader}([{', '.join(sql_string(p) for p in paths)}])"
+
+        if reference_date is None:
+            reference_date = str(con.execute(f"SELECT MAX(CAST(t_dat AS DATE)) FROM {source}").fetchone()[0])
+        reference_date = str(reference_date)
+        rows = con.execute(f"""
+            SELECT customer_id_int, article_id_int,
+                   DATE_DIFF('day', DATE '1970-01-01', MAX(CAST(t_dat AS DATE))) AS day
+            FROM {source}
+            WHERE CAST(t_dat AS DATE) > CAST(? AS DATE) - INTERVAL {int(window_days)} DAY
+              AND CAST(t_dat AS DATE) <= CAST(? AS DATE)
+            GROUP BY 1, 2
+        """, [reference_date, reference_date]).fetchnumpy()
+        reference_day = int(np.datetime64(reference_date, 'D').astype(np.int64))
+        return cls.build(rows['customer_id_int'], rows['article_id_int'], rows['day'],
+                         window_days=window_days, reference_day=reference_day)
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir):
+        """Returns None when the index is not shipped."""
+        path = os.path.join(artifact_dir, RECENT_PURCHASES_FILENAME)
+        if not os.path.exists(path):
+            print(f"Warning: {path} not found. Repurchase candidates are disabled.")
+            return None
+        return cls.load(path)
+
+    def save(self, path):
+        np.savez(path, offsets=self.offsets, items=self.items, days=self.days,
+                 reference_day=self.reference_day, window_days=self.window_days)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        index = cls(data['offsets'], data['items'], data['days'], int(data['reference_day']), int(data['window_days']))
+        print(f"   - Recent Purchases: {len(index.items)} (customer, article) pairs, "
+              f"{index.window_days}-day window up to {np.datetime64(index.reference_day, 'D')}.")
+        return index
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def n_customers(self):
+        return len(self.offsets) - 1
+
+    # --- Lookups ---
+
+    def lookup(self, customer_ids, within_days=None, max_items=None):
+        """
+        Recent purchases of a batch of customers as padded matrices
+        (article_ids, days), both (n, width), most recent first, -1 padding.
+        `within_days` narrows the window (e.g. 14 days for visual seeds).
+        """
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        known = (ids >= 0) & (ids < self.n_customers)
+        start = np.where(known, self.offsets[np.where(known, ids, 0)], 0)
+        lengths = np.where(known, self.offsets[np.where(known, ids, 0) + 1] - start, 0)
+
+        # Flat gather of every entry of every customer (CSR slices, vectorised)
+        owner = np.repeat(np.arange(len(ids)), lengths)
+        rank = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        flat = start[owner] + rank
+        if within_days is not None:
+            # Entries are most recent first: the kept ones are a prefix per customer
+            keep = self.days[flat] > self.reference_day - within_days
+            owner, rank, flat = owner[keep], rank[keep], flat[keep]
+        if max_items is not None:
+            keep = rank < max_items
+            owner, rank, flat = owner[keep], rank[keep], flat[keep]
+
+        width = int(rank.max()) + 1 if len(rank) else 0
+        article_ids = np.full((len(ids), width), -1, dtype=np.int64)
+        days = np.full((len(ids), width), -1, dtype=np.int64)
+        article_ids[owner, rank] = self.items[flat]
+        days[owner, rank] = self.days[flat]
+        return article_ids, days
+
+    # --- Incremental updates ---
+
+    def append(self, customer_ids, article_ids, days):
+        """
+        New index with a batch of transactions folded in. Only the touched
+        customers are re-sorted; untouched entries are merged in linear time
+        and entries that fell out of the (moved) window are dropped.
+        """
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        if len(customer_ids) == 0:
+            return self
+        article_ids = np.asarray(article_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        reference_day = max(self.reference_day, int(days.max()))
+        n_customers = max(self.n_customers, int(customer_ids.max()) + 1)
+
+        owner = np.repeat(np.arange(self.n_customers), np.diff(self.offsets))
+        touched = np.zeros(n_customers, dtype=bool)
+        touched[customer_ids] = True
+        mine = touched[owner]
+
+        # Touched customers: old entries + the batch, rebuilt (small sort)
+        merged = RecentPurchaseIndex.build(
+            np.concatenate([owner[mine], customer_ids]),
+            np.concatenate([self.items[mine], article_ids]),
+            np.concatenate([self.days[mine], days]),
+            window_days=self.window_days, reference_day=reference_day, n_customers=n_customers,
+        )
+        merged_owner = np.repeat(np.arange(n_customers), np.diff(merged.offsets))
+
+        # Untouched customers keep their (already ordered) entries
+        keep = ~mine & (self.days > reference_day - self.window_days)
+        all_owner = np.concatenate([owner[keep], merged_owner])
+        order = np.argsort(all_owner, kind='stable')
+        offsets = np.zeros(n_customers + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_owner, minlength=n_customers), out=offsets[1:])
+        return RecentPurchaseIndex(
+            offsets,
+            np.concatenate([self.items[keep], merged.items])[order],
+            np.concatenate([self.days[keep], merged.days])[order],
+            reference_day, self.window_days,
+        )
+
+
+def isin_rows(owner_ids, rows):
+    """
+    Row-wise set membership: mask[u, j] = owner_ids[u, j] is in rows[u]
+    (both padded with -1, which never matches). One sorted key array +
+    searchsorted, so the cost is O((n + m) log m) for the whole batch.
+    """
+    owner_ids = np.asarray(owner_ids)
+    rows = np.asarray(rows)
+    mask = np.zeros(owner_ids.shape, dtype=bool)
+    if rows.size == 0 or owner_ids.size == 0:
+        return mask
+    span = int(max(owner_ids.max(), rows.max())) + 1
+    keys = (np.arange(len(rows))[:, None] * span + rows)[rows >= 0]
+    keys.sort()
+    if len(keys) == 0:
+        return mask
+    query = np.arange(len(owner_ids))[:, None] * span + owner_ids
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return (keys[pos] == query) & (owner_ids >= 0)
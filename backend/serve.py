@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+# Multi-process serving: `python serve.py` (Docker CMD) instead of `uvicorn main:app`.
+#
+# The parent process prepares the read-only engine state once: it compiles
+# artifacts/engine.bundle if it is missing or stale and reads it into the OS
+# page cache (FEATURE_BACKEND=duckdb: it compiles artifacts/features.duckdb,
+# which the workers attach read-only). Each uvicorn worker then memory-maps the same file, so the
+# feature arrays, ID map, model and cold start lists are shared physical
+# pages (only per-process state such as the result cache is private).
+# Workers register in SERVE_STATE_DIR once their engine is loaded; /ready
+# answers 503 until all SERVE_WORKERS have attached.
+
+REGISTRY_PREFIX = "worker-"
+
+
+def detect_workers():
+    """Usable cores: CPU affinity, capped by a cgroup CPU quota (containers)."""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cores = min(cores, max(1, int(quota)))
+    return max(1, cores)
+
+
+def _cgroup_cpu_quota():
+    """CPUs allowed by the cgroup (v2 cpu.max or v1 cfs quota), or None when unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def process_memory_mb(pid):
+    """
+    RSS and PSS of a process in MB (Linux). RSS counts every mapped page the
+    process touched, shared bundle pages included; PSS splits shared pages
+    between the processes mapping them, so summed PSS is the real footprint.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.read().splitlines()[1:]  # first line is the address range header
+    except OSError:
+        return {}
+    fields = dict(line.split(":", 1) for line in lines if ":" in line)
+    memory = {}
+    for name, key in (("Rss", "rss_mb"), ("Pss", "pss_mb")):
+        if name in fields:
+            memory[key] = round(int(fields[name].split()[0]) / 1024, 1)
+    return memory
+
+
+def prepare_bundle(artifact_dir, preload=True):
+    """
+    Compiles engine.bundle in the parent when it is missing or older than
+    the raw artifacts, so workers only map it, then reads it once so the
+    workers' first requests hit the page cache. Returns the bundle path,
+    or None when there is nothing to compile (the workers then report it).
+    """
+    from bundle import BUNDLE_FILENAME, ArtifactBundle, compile_bundle, source_fingerprint
+
+    path = os.path.join(artifact_dir, BUNDLE_FILENAME)
+    fresh = False
+    if os.path.exists(path):
+        try:
+            fresh = ArtifactBundle.open(path).meta.get("source_fingerprint") == source_fingerprint(artifact_dir)
+        except ValueError:
+            fresh = False
+    if not fresh:
+        if not os.path.exists(os.path.join(artifact_dir, "lgbm_ranker.txt")):
+            return None
+        compile_bundle(artifact_dir)
+
+    if preload:
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            while f.read(1 << 24):
+                pass
+        print(f"Bundle {path} paged in ({os.path.getsize(path) / 1e6:.1f} MB, {time.perf_counter() - start:.2f}s)")
+    return path
+
+
+def prepare_feature_db(artifact_dir):
+    """
+    duckdb backend: compiles artifacts/features.duckdb in the parent when it
+    is missing or stale; every worker then attaches the same file read-only.
+    Returns the path, or None when the feature parquet files are missing.
+    """
+    from feature_db import FEATURE_DB_FILENAME, FEATURE_DB_SOURCES, compile_feature_db, feature_db_is_fresh
+
+    if not all(os.path.exists(os.path.join(artifact_dir, name)) for name in FEATURE_DB_SOURCES):
+        return None
+    if feature_db_is_fresh(artifact_dir):
+        return os.path.join(artifact_dir, FEATURE_DB_FILENAME)
+    return compile_feature_db(artifact_dir)
+
+
+class WorkerRegistry:
+    """
+    Which worker processes have loaded their engine, shared through files
+    in `state_dir` (one worker-<pid>.json per worker, written atomically).
+    Entries of processes that are gone are ignored, so a crashed worker
+    makes the server not ready until its replacement has attached.
+    """
+    def __init__(self, state_dir, expected):
+        self.state_dir = state_dir
+        self.expected = expected
+
+    def register(self, info):
+        path = os.path.join(self.state_dir, f"{REGISTRY_PREFIX}{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"pid": os.getpid(), "attached_at": time.time(), **info}, f)
+        os.replace(path + ".tmp", path)
+
+    def unregister(self):
+        try:
+            os.remove(os.path.join(self.state_dir, f"{REGISTRY_PREFIX}{os.getpid()}.json"))
+        except OSError:
+            pass
+
+    def attached(self):
+        workers = []
+        for name in sorted(os.listdir(self.state_dir)):
+            if not (name.startswith(REGISTRY_PREFIX) and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name)) as f:
+                    info = json.load(f)
+                os.kill(info["pid"], 0)
+            except (OSError, ValueError, KeyError):
+                continue  # half-written, or the process is gone
+            workers.append(info)
+        return workers
+
+    def ready(self):
+        return len(self.attached()) >= self.expected
+
+    def stats(self):
+        workers = [{**info, **process_memory_mb(info["pid"])} for info in self.attached()]
+        summary = {"expected": self.expected, "attached": len(workers), "workers": workers}
+        if workers and all("pss_mb" in w for w in workers):
+            summary["total_rss_mb"] = round(sum(w["rss_mb"] for w in workers), 1)
+            summary["total_pss_mb"] = round(sum(w["pss_mb"] for w in workers), 1)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API with N worker processes sharing the mapped engine bundle.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "0")),
+                        help="Worker processes (0 = one per usable core)")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", "artifacts"))
+    parser.add_argument("--no-compile", action="store_true", help="Do not compile/preload engine.bundle in the parent")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    cores = detect_workers()
+    workers = args.workers if args.workers > 0 else cores
+    use_bundle = os.getenv("USE_BUNDLE", "true").lower() in ("1", "true", "yes")
+    feature_backend = os.getenv("FEATURE_BACKEND", "memory")
+    if not args.no_compile and use_bundle and feature_backend == "memory":
+        prepare_bundle(args.artifact_dir)
+    elif not args.no_compile and use_bundle and feature_backend == "duckdb":
+        prepare_feature_db(args.artifact_dir)
+
+    # Split the cores between the processes (0 / unset = auto): each worker gets
+    # cores / workers inference threads running single-threaded predicts
+    if int(os.getenv("INFERENCE_WORKERS", "0")) <= 0:
+        os.environ["INFERENCE_WORKERS"] = str(max(1, cores // workers))
+    if int(os.getenv("INFERENCE_THREADS", "0")) <= 0:
+        os.environ["INFERENCE_THREADS"] = "1"
+    os.environ.setdefault("OMP_NUM_THREADS", os.environ["INFERENCE_THREADS"])
+
+    state_dir = tempfile.mkdtemp(prefix="recsys-serve-")
+    os.environ.update(ARTIFACT_DIR=args.artifact_dir, SERVE_WORKERS=str(workers), SERVE_STATE_DIR=state_dir)
+    print(f"Serving on {args.host}:{args.port} with {workers} worker process(es) "
+          f"({cores} usable cores, {os.environ['INFERENCE_WORKERS']} inference thread(s) each).")
+    sys.stdout.flush()
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=workers if workers > 1 else None)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,639 @@
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from feature_store import USER_FEATURES
+from feature_db import FEATURE_DB_FILENAME, compile_feature_db
+
+logger = logging.getLogger(__name__)
+
+# days_since_last_buy was computed against this date in the notebook
+TRAINING_REFERENCE_DATE = "2020-09-15"
+SNAPSHOT_FILENAME = "features_user.parquet"
+# The feed offset is stored in the snapshot's parquet key-value metadata under
+# this key, so features and offset are replaced together by one rename.
+STATE_METADATA_KEY = b"ingest_state"
+# Separate state file of older snapshots (read when the metadata is missing)
+STATE_FILENAME = "ingest_state.json"
+# Feed purchases still inside the repurchase window, written next to each
+# snapshot so following workers (and the next lease holder) can replay them
+PURCHASES_FILENAME = "feed_purchases.npz"
+# Lock file electing the one process that ingests the feed (see IngestLease)
+LEASE_FILENAME = "ingest.lock"
+
+# Transactions feed columns (same names as transactions_clean)
+FEED_COLUMNS = ['t_dat', 'customer_id_int', 'article_id_int', 'price']
+
+
+def _to_day(dates):
+    """Dates (strings / datetime64) -> int days since 1970-01-01."""
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class UserAggregates:
+    """
+    Running per-customer purchase aggregates, in compact dense arrays
+    indexed by customer_id_int:
+    - count, mean, m2 (Welford / Chan: the variance without keeping prices)
+    - first_day, last_day (int days since epoch)
+
+    This is exactly the state behind the notebook's user features
+    (AVG, STDDEV, COUNT, MIN/MAX t_dat), so it can be bootstrapped from
+    features_user.parquet and turned back into feature rows at any time.
+    """
+    def __init__(self, count, mean, m2, first_day, last_day, reference_day, track_reference=False):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.first_day = first_day
+        self.last_day = last_day
+        self.reference_day = reference_day
+        # "latest" mode: the reference date follows the newest transaction seen
+        self.track_reference = track_reference
+
+    @classmethod
+    def empty(cls, n_slots, reference_day, track_reference=False):
+        return cls(
+            np.zeros(n_slots, dtype=np.int64), np.zeros(n_slots, dtype=np.float64),
+            np.zeros(n_slots, dtype=np.float64), np.zeros(n_slots, dtype=np.int32),
+            np.zeros(n_slots, dtype=np.int32), reference_day, track_reference,
+        )
+
+    @classmethod
+    def from_features(cls, user_features, user_present, reference_date=TRAINING_REFERENCE_DATE):
+        """
+        Recovers the aggregate state from feature rows (USER_FEATURES order)
+        computed at `reference_date`: last = ref - days_since_last_buy,
+        first = last - tenure, m2 = std^2 * (count - 1).
+        reference_date="latest" keeps the training date until newer data arrives.
+        """
+        track = reference_date == "latest"
+        reference_day = int(_to_day([TRAINING_REFERENCE_DATE if track else reference_date])[0])
+        agg = cls.empty(len(user_present), reference_day, track)
+
+        ids = np.flatnonzero(user_present)
+        rows = np.asarray(user_features[ids], dtype=np.float64)
+        col = {name: i for i, name in enumerate(USER_FEATURES)}
+        count = np.nan_to_num(rows[:, col['user_total_purchases']]).astype(np.int64)
+        std = np.nan_to_num(rows[:, col['user_price_std']])
+
+        agg.count[ids] = count
+        agg.mean[ids] = np.nan_to_num(rows[:, col['user_avg_price']])
+        agg.m2[ids] = std * std * np.maximum(count - 1, 0)
+        agg.last_day[ids] = reference_day - np.nan_to_num(rows[:, col['days_since_last_buy']]).astype(np.int64)
+        agg.first_day[ids] = agg.last_day[ids] - np.nan_to_num(rows[:, col['user_tenure_days']]).astype(np.int64)
+        return agg
+
+    def __len__(self):
+        return len(self.count)
+
+    def update(self, customer_ids, days, prices):
+        """
+        Folds a batch of transactions into the aggregates (vectorised Chan
+        merge of the batch's per-customer stats). Returns the touched ids.
+        """
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(customer_ids) == 0:
+            return customer_ids
+        self._grow(int(customer_ids.max()) + 1)
+
+        ids, inv = np.unique(customer_ids, return_inverse=True)
+        n_b = np.bincount(inv).astype(np.float64)
+        mean_b = np.bincount(inv, weights=prices) / n_b
+        m2_b = np.bincount(inv, weights=(prices - mean_b[inv]) ** 2)
+        first_b = np.full(len(ids), np.iinfo(np.int64).max)
+        last_b = np.full(len(ids), np.iinfo(np.int64).min)
+        np.minimum.at(first_b, inv, days)
+        np.maximum.at(last_b, inv, days)
+
+        n_a = self.count[ids].astype(np.float64)
+        n = n_a + n_b
+        delta = mean_b - self.mean[ids]
+        self.mean[ids] += delta * n_b / n
+        self.m2[ids] += m2_b + delta * delta * n_a * n_b / n
+        new = n_a == 0
+        self.first_day[ids] = np.where(new, first_b, np.minimum(self.first_day[ids], first_b))
+        self.last_day[ids] = np.where(new, last_b, np.maximum(self.last_day[ids], last_b))
+        self.count[ids] += n_b.astype(np.int64)
+
+        if self.track_reference:
+            self.reference_day = max(self.reference_day, int(days.max()))
+        return ids
+
+    def feature_rows(self, customer_ids):
+        """(n, 5) feature rows in USER_FEATURES order, as the notebook computes them."""
+        ids = np.asarray(customer_ids, dtype=np.int64)
+        count = self.count[ids]
+        rows = np.empty((len(ids), len(USER_FEATURES)), dtype=np.float64)
+        rows[:, 0] = self.mean[ids]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # STDDEV (sample) is NULL for a single purchase
+            rows[:, 1] = np.where(count > 1, np.sqrt(self.m2[ids] / (count - 1)), np.nan)
+        rows[:, 2] = count
+        rows[:, 3] = self.last_day[ids] - self.first_day[ids]
+        rows[:, 4] = self.reference_day - self.last_day[ids]
+        return rows
+
+    def known_ids(self):
+        return np.flatnonzero(self.count > 0)
+
+    def to_frame(self):
+        """features_user.parquet-compatible frame for every known customer."""
+        ids = self.known_ids()
+        rows = self.feature_rows(ids)
+        frame = pd.DataFrame({'customer_id_int': ids})
+        for j, name in enumerate(USER_FEATURES):
+            frame[name] = rows[:, j]
+        for name in ('user_total_purchases', 'user_tenure_days', 'days_since_last_buy'):
+            frame[name] = frame[name].astype(np.int64)
+        return frame
+
+    def _grow(self, n_slots):
+        if n_slots <= len(self.count):
+            return
+        n_slots = max(n_slots, int(len(self.count) * 1.25))
+        for name in ('count', 'mean', 'm2', 'first_day', 'last_day'):
+            old = getattr(self, name)
+            grown = np.zeros(n_slots, dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+
+def read_snapshot_state(snapshot_dir):
+    """
+    Feed state (offset, reference_day, ...) of the snapshot in `snapshot_dir`,
+    from the parquet metadata (or the state file of an older snapshot).
+    None when there is no snapshot.
+    """
+    import pyarrow.parquet as pq
+
+    path = os.path.join(snapshot_dir, SNAPSHOT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if STATE_METADATA_KEY in metadata:
+        return json.loads(metadata[STATE_METADATA_KEY])
+    state_path = os.path.join(snapshot_dir, STATE_FILENAME)
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return None
+
+
+def _aggregates_from_snapshot(snapshot_dir, state, track_reference=False):
+    """UserAggregates (and the presence mask) of the snapshot in `snapshot_dir` with feed state `state`."""
+    frame = pd.read_parquet(os.path.join(snapshot_dir, SNAPSHOT_FILENAME))
+    ids = frame['customer_id_int'].to_numpy(dtype=np.int64)
+    n_slots = int(ids.max()) + 1 if len(ids) else 0
+    features = np.zeros((n_slots, len(USER_FEATURES)))
+    present = np.zeros(n_slots, dtype=bool)
+    features[ids] = frame[USER_FEATURES].to_numpy(dtype=np.float64)
+    present[ids] = True
+    reference = str(np.datetime64(state['reference_day'], 'D'))
+    aggregates = UserAggregates.from_features(features, present, reference)
+    aggregates.track_reference = track_reference
+    return aggregates, present
+
+
+def read_feed_purchases(snapshot_dir):
+    """(customer_ids, article_ids, days, seq) written with the latest snapshot, or None."""
+    path = os.path.join(snapshot_dir, PURCHASES_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return tuple(data[name] for name in ('customer_ids', 'article_ids', 'days', 'seq'))
+
+
+class IngestLease:
+    """
+    Exclusive lock on <directory>/ingest.lock electing the one process that
+    ingests the feed: with serve.py, one worker reads the feed and writes the
+    snapshots, the others follow the snapshots. flock is released by the OS
+    when the holder exits, so a follower takes over on its next poll.
+    Without fcntl (Windows, a single process anyway) the lease is always granted.
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LEASE_FILENAME)
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Takes the lease if it is free (never blocks). Returns whether it is held."""
+        if self._fd is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            self._fd = -1
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+class TransactionFileSource:
+    """
+    Tails an append-only CSV of transactions (header: t_dat,customer_id_int,
+    article_id_int,price). Reads whole lines from a byte offset, so a line
+    still being written is picked up on the next poll. `offset` is saved
+    with each snapshot to resume without re-reading the file.
+    """
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+
+    def read_batch(self, max_rows=100_000):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            lines = []
+            for line in f:
+                if not line.endswith(b"\n") or len(lines) >= max_rows:
+                    break
+                lines.append(line)
+        if not lines:
+            return None
+
+        consumed = sum(len(line) for line in lines)
+        if self.offset == 0 and lines[0].startswith(b"t_dat"):
+            lines = lines[1:]
+        self.offset += consumed
+        if not lines:
+            return None
+        return pd.read_csv(io.BytesIO(b"".join(lines)), names=FEED_COLUMNS, header=None)
+
+
+class QueueSource:
+    """Queue stand-in for a message broker: items are dicts or tuples in FEED_COLUMNS order."""
+    def __init__(self, q=None):
+        self.queue = q if q is not None else queue.Queue()
+        self.offset = 0
+
+    def read_batch(self, max_rows=100_000):
+        items = []
+        while len(items) < max_rows:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not items:
+            return None
+        self.offset += len(items)
+        if isinstance(items[0], dict):
+            return pd.DataFrame(items, columns=FEED_COLUMNS)
+        return pd.DataFrame(list(items), columns=FEED_COLUMNS)
+
+
+class FeatureIngestor:
+    """
+    Background consumer of the transactions feed.
+
+    1. reads a batch from the source
+    2. folds it into the UserAggregates
+    3. writes the touched customers' feature rows into the serving feature
+       store in place, adds the purchases to the engine's recent purchases
+       index (and calls `on_update`, e.g. to drop cached results)
+    4. every `snapshot_seconds`, writes features_user.parquet (with the
+       feed offset in its metadata) to `snapshot_dir`, from which a restart
+       resumes
+
+    When the reference day moves, every known customer's recency changes:
+    the rows are rewritten in one vectorised update and `on_reset` is called
+    once (e.g. to bump the result cache's epoch) instead of `on_update` with
+    every customer id.
+
+    With a `lease` (several processes sharing `snapshot_dir`), only the
+    holder does the above; the others follow: every `poll_seconds` they apply
+    the rows that changed in the latest snapshot and the purchases logged
+    with it, so they lag the feed by up to `snapshot_seconds`. A follower
+    takes the lease over (resuming from the latest snapshot) when it frees up.
+
+    `engine_provider` returns the current engine (hot reload safe): when a
+    new engine appears, every customer updated so far is pushed into it.
+    """
+    def __init__(self, engine_provider, source, aggregates, snapshot_dir=None, snapshot_seconds=300.0,
+                 poll_seconds=5.0, batch_rows=100_000, on_update=None, on_reset=None, lease=None):
+        self.engine_provider = engine_provider
+        self.source = source
+        self.aggregates = aggregates
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_seconds = snapshot_seconds
+        self.poll_seconds = poll_seconds
+        self.batch_rows = batch_rows
+        self.on_update = on_update
+        self.on_reset = on_reset
+        self.lease = lease
+
+        self._dirty = np.zeros(len(aggregates), dtype=bool)  # updated since startup
+        self._purchases = None  # (customer_ids, article_ids, days, seq) still inside the repurchase window
+        self._engine = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_snapshot = time.monotonic()
+        self._resumed_from = None  # written_at of the snapshot the aggregates come from
+        self._followed = None  # (written_at, reference_day) of the snapshot applied as a follower
+        self._applied_seq = 0  # feed purchases below this sequence number are in the engine
+
+        # Counters
+        self.transactions = 0
+        self.batches = 0
+        self.customers_updated = 0
+        self.snapshots = 0
+        self.last_batch_at = None
+        self.last_error = None
+
+    @classmethod
+    def resume(cls, engine_provider, source, snapshot_dir, reference_date=TRAINING_REFERENCE_DATE, **kwargs):
+        """
+        Starts from the latest snapshot in `snapshot_dir` when there is one
+        (restoring the feed offset), otherwise from the current engine's features.
+        """
+        state = read_snapshot_state(snapshot_dir) if snapshot_dir else None
+        if state is not None:
+            aggregates, present = _aggregates_from_snapshot(snapshot_dir, state, reference_date == "latest")
+            source.offset = state['offset']
+            ingestor = cls(engine_provider, source, aggregates, snapshot_dir, **kwargs)
+            # The engine was loaded from older artifacts: push the snapshot into it
+            ingestor._dirty = present.copy()
+            ingestor._resumed_from = state.get('written_at')
+            ingestor.transactions = state.get('transactions', 0)
+            logger.info(f"Feature ingestion resumed from snapshot ({int(present.sum())} users, "
+                        f"offset {state['offset']}).")
+            return ingestor
+
+        store = engine_provider().features
+        if not hasattr(store, 'user_features'):
+            raise ValueError("Feature ingestion needs the in-memory feature store.")
+        aggregates = UserAggregates.from_features(store.user_features, store.user_present, reference_date)
+        return cls(engine_provider, source, aggregates, snapshot_dir, **kwargs)
+
+    @property
+    def is_leader(self):
+        return self.lease is None or self.lease.held
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="feature-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_dir and self.is_leader:
+            self.snapshot()
+        if self.lease is not None:
+            self.lease.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.is_leader and self.lease.acquire():
+                    self._take_over()
+                if self.is_leader:
+                    processed = self.poll_once()
+                else:
+                    self.follow_once()
+                    processed = 0
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Feature ingestion error: {e}")
+                processed = 0
+            if (self.snapshot_dir and self.is_leader
+                    and time.monotonic() - self._last_snapshot >= self.snapshot_seconds):
+                self.snapshot()
+            if not processed:
+                self._stop.wait(self.poll_seconds)
+
+    def poll_once(self):
+        """Processes one batch from the source. Returns the number of transactions."""
+        engine = self.engine_provider()
+        if engine is not self._engine:
+            self._engine = engine
+            self._push(np.flatnonzero(self._dirty[:len(self.aggregates)]), reset=True)
+            if self._purchases is not None:
+                self._add_purchases(*self._purchases[:3])
+
+        batch = self.source.read_batch(self.batch_rows)
+        if batch is None or len(batch) == 0:
+            return 0
+
+        customer_ids = batch['customer_id_int'].to_numpy(dtype=np.int64)
+        days = _to_day(batch['t_dat'])
+        reference_before = self.aggregates.reference_day
+        touched = self.aggregates.update(customer_ids, days, batch['price'].to_numpy(dtype=np.float64))
+        seq = np.arange(self.transactions, self.transactions + len(batch), dtype=np.int64)
+        self._log_purchases(customer_ids, batch['article_id_int'].to_numpy(dtype=np.int64), days, seq)
+        if len(self._dirty) < len(self.aggregates):
+            grown = np.zeros(len(self.aggregates), dtype=bool)
+            grown[:len(self._dirty)] = self._dirty
+            self._dirty = grown
+        self._dirty[touched] = True
+
+        reset = self.aggregates.reference_day != reference_before
+        if reset:
+            # Recency moved for everyone, not only for this batch's customers
+            touched = self.aggregates.known_ids()
+        self._push(touched, reset=reset)
+
+        self.transactions += len(batch)
+        self.batches += 1
+        self.customers_updated += len(touched)
+        self.last_batch_at = time.time()
+        return len(batch)
+
+    def _log_purchases(self, customer_ids, article_ids, days, seq):
+        """
+        Feeds the engine's recent purchases index and keeps the batch (for
+        the engine's window) so a hot-reloaded engine or a following worker
+        can be caught up. `seq` numbers the feed's transactions.
+        """
+        self._add_purchases(customer_ids, article_ids, days)
+        self._applied_seq = int(seq[-1]) + 1
+        window = getattr(self._engine, 'repurchase_window_days', 0)
+        if window <= 0:
+            return
+        if self._purchases is not None:
+            customer_ids, article_ids, days, seq = (np.concatenate([old, new]) for old, new in
+                                                    zip(self._purchases, (customer_ids, article_ids, days, seq)))
+        keep = days > days.max() - window
+        self._purchases = (customer_ids[keep], article_ids[keep], days[keep], seq[keep])
+
+    def _add_purchases(self, customer_ids, article_ids, days):
+        if self._engine is not None and hasattr(self._engine, 'add_purchases'):
+            self._engine.add_purchases(customer_ids, article_ids, days)
+
+    def _push(self, customer_ids, rows=None, reset=False):
+        """
+        Writes feature rows (default: from the aggregates) into the engine's
+        store. `reset` (every customer changed) calls on_reset once instead
+        of on_update with each id.
+        """
+        if len(customer_ids) == 0 or self._engine is None:
+            return
+        store = self._engine.features
+        if hasattr(store, 'update_users'):
+            store.update_users(customer_ids, self.aggregates.feature_rows(customer_ids) if rows is None else rows)
+        if reset and self.on_reset is not None:
+            self.on_reset()
+        elif self.on_update is not None:
+            self.on_update(customer_ids)
+
+    def follow_once(self):
+        """
+        Follower side (another process holds the lease): applies the latest
+        snapshot, i.e. the rows that differ from the serving store and the
+        purchases logged since the last one. Returns the number of customers updated.
+        """
+        engine = self.engine_provider()
+        if engine is not self._engine:
+            # A new engine starts from its own artifacts: replay everything
+            self._engine = engine
+            self._followed = None
+            self._applied_seq = 0
+        state = read_snapshot_state(self.snapshot_dir) if self.snapshot_dir else None
+        if state is None or self._engine is None:
+            return 0
+        followed = (state.get('written_at'), state['reference_day'])
+        if followed == self._followed:
+            return 0
+
+        frame = pd.read_parquet(os.path.join(self.snapshot_dir, SNAPSHOT_FILENAME))
+        ids = frame['customer_id_int'].to_numpy(dtype=np.int64)
+        rows = frame[USER_FEATURES].to_numpy(dtype=np.float64)
+        store = self._engine.features
+        if hasattr(store, 'user_features'):
+            # Compare in the store's dtype: unchanged rows must compare equal
+            rows = rows.astype(store.user_features.dtype)
+            known = ids < len(store.user_present)
+            current = np.full(rows.shape, np.nan, dtype=rows.dtype)
+            current[known] = store.user_features[ids[known]]
+            same = (current == rows) | (np.isnan(current) & np.isnan(rows))
+            changed = ~same.all(axis=1)
+            changed[known] |= ~store.user_present[ids[known]]
+            ids, rows = ids[changed], rows[changed]
+        reset = self._followed is None or followed[1] != self._followed[1]
+        self._push(ids, rows, reset=reset)
+
+        purchases = read_feed_purchases(self.snapshot_dir)
+        if purchases is not None:
+            new = purchases[3] >= self._applied_seq
+            if new.any():
+                self._add_purchases(*(a[new] for a in purchases[:3]))
+                self._applied_seq = int(purchases[3][new].max()) + 1
+
+        self._followed = followed
+        self.aggregates.reference_day = state['reference_day']
+        self.source.offset = state['offset']
+        self.transactions = state.get('transactions', self.transactions)
+        self.customers_updated += len(ids)
+        self.last_batch_at = time.time()
+        return len(ids)
+
+    def _take_over(self):
+        """
+        The lease was just acquired: catch up with the latest snapshot, then
+        continue the feed from its offset with its aggregates.
+        """
+        self.follow_once()
+        state = read_snapshot_state(self.snapshot_dir) if self.snapshot_dir else None
+        if state is not None and state.get('written_at') != self._resumed_from:
+            self.aggregates, present = _aggregates_from_snapshot(self.snapshot_dir, state,
+                                                                 self.aggregates.track_reference)
+            self._dirty = present.copy()
+            self._resumed_from = state.get('written_at')
+            self.source.offset = state['offset']
+            self.transactions = state.get('transactions', 0)
+        purchases = read_feed_purchases(self.snapshot_dir) if self.snapshot_dir else None
+        if purchases is not None:
+            self._purchases = purchases
+            self._applied_seq = max(self._applied_seq, int(purchases[3].max()) + 1 if len(purchases[3]) else 0)
+        logger.info(f"Feed ingestion lease acquired (pid {os.getpid()}, offset {self.source.offset}).")
+
+    def snapshot(self):
+        """
+        Atomically writes features_user.parquet with the feed offset in its
+        key-value metadata: one file, one rename, so a crash can never pair
+        new aggregates with an old offset. The feed purchases go to
+        feed_purchases.npz first, so a follower reading a snapshot never
+        misses the purchases behind it. Temp names are per process, in case
+        a takeover overlaps the previous lease holder's last write.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        path = os.path.join(self.snapshot_dir, SNAPSHOT_FILENAME)
+        state = {"offset": self.source.offset, "reference_day": self.aggregates.reference_day,
+                 "transactions": self.transactions, "written_at": time.time()}
+        if self._purchases is not None:
+            purchases_path = os.path.join(self.snapshot_dir, PURCHASES_FILENAME)
+            with open(purchases_path + suffix, "wb") as f:
+                np.savez(f, **dict(zip(('customer_ids', 'article_ids', 'days', 'seq'), self._purchases)))
+            os.replace(purchases_path + suffix, purchases_path)
+        table = pa.Table.from_pandas(self.aggregates.to_frame(), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               STATE_METADATA_KEY: json.dumps(state).encode()})
+        pq.write_table(table, path + suffix)
+        os.replace(path + suffix, path)
+
+        # A state file of an older snapshot would no longer match the features
+        legacy_state = os.path.join(self.snapshot_dir, STATE_FILENAME)
+        if os.path.exists(legacy_state):
+            os.remove(legacy_state)
+        self.snapshots += 1
+        self._refresh_feature_db()
+        self._last_snapshot = time.monotonic()
+        logger.info(f"Feature snapshot written: {path} (offset {self.source.offset}).")
+
+    def _refresh_feature_db(self):
+        """
+        A features.duckdb next to the snapshot (snapshot_dir is an artifact
+        directory) is stale now: engines on FEATURE_BACKEND=duckdb would fall
+        back to the unindexed parquet views. Recompile it.
+        """
+        if not os.path.exists(os.path.join(self.snapshot_dir, FEATURE_DB_FILENAME)):
+            return
+        try:
+            compile_feature_db(self.snapshot_dir)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Could not recompile {FEATURE_DB_FILENAME} in {self.snapshot_dir} after the snapshot "
+                           f"({e}); FEATURE_BACKEND=duckdb engines use the parquet views until it is recompiled.")
+
+    def stats(self):
+        return {
+            "role": "leader" if self.is_leader else "follower",
+            "transactions": self.transactions,
+            "batches": self.batches,
+            "customers_updated": self.customers_updated,
+            "snapshots": self.snapshots,
+            "offset": self.source.offset,
+            "reference_date": str(np.datetime64(self.aggregates.reference_day, 'D')),
+            "last_batch_at": self.last_batch_at,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,299 @@
+import numpy as np
+import pandas as pd
+
+# LightGBM decision_type bit layout (see LightGBM/include/LightGBM/tree.h)
+CATEGORICAL_MASK = 1
+DEFAULT_LEFT_MASK = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+ZERO_THRESHOLD = 1e-35
+
+
+class TreeEnsemble:
+    """
+    Native NumPy evaluator for a LightGBM text model (lgbm_ranker.txt).
+
+    All trees are flattened into one set of node arrays:
+    - internal nodes keep their split (feature, threshold, children, missing rules)
+    - leaves become "pseudo-nodes" whose children point to themselves
+
+    Prediction walks every (row, tree) pair one level at a time, so a batch
+    is at most `max_depth` vectorised gathers instead of a per-row tree
+    traversal. Pairs that reach a leaf are dropped from the work set.
+    """
+    def __init__(self, feature_names, split_feature, threshold, left_child, right_child,
+                 default_left, missing_type, is_categorical, cat_start, cat_len, cat_words,
+                 leaf_value, roots, max_depth, average_output=False):
+        self.feature_names = feature_names
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left_child = left_child
+        self.right_child = right_child
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.is_categorical = is_categorical
+        self.cat_start = cat_start
+        self.cat_len = cat_len
+        self.cat_words = cat_words
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.average_output = average_output
+
+        # Fast path: numeric splits only and no NaN-as-missing rules.
+        # NaN then behaves exactly like 0.0, so it can be replaced up front.
+        self._has_categorical = bool(is_categorical.any())
+        self._has_missing_rules = bool((missing_type != MISSING_NONE).any())
+
+        # Traversal tables: children[2 * node + go_left] is the next node
+        self._children = np.stack([right_child, left_child], axis=1).ravel().astype(np.intp)
+        self._split_feature = split_feature.astype(np.intp)
+        self._roots = roots.astype(np.intp)
+        self._is_leaf = left_child == np.arange(len(left_child))
+        self.compact_after_level = 4
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    def num_feature(self):
+        return len(self.feature_names)
+
+    def feature_name(self):
+        return list(self.feature_names)
+
+    # --- Loading ---
+
+    @classmethod
+    def from_model_file(cls, path):
+        with open(path, "r") as f:
+            return cls.from_model_string(f.read())
+
+    @classmethod
+    def from_model_string(cls, model_str):
+        header, trees = _parse_model_text(model_str)
+        if int(header.get("num_class", 1)) != 1 or int(header.get("num_tree_per_iteration", 1)) != 1:
+            raise NotImplementedError("TreeEnsemble only supports single-output models.")
+
+        feature_names = header["feature_names"].split(" ")
+        n_internal = [int(t["num_leaves"]) - 1 for t in trees]
+        n_nodes = [ni + ni + 1 for ni in n_internal]
+        total = sum(n_nodes)
+
+        split_feature = np.zeros(total, dtype=np.int32)
+        threshold = np.full(total, np.inf, dtype=np.float64)
+        left_child = np.zeros(total, dtype=np.int32)
+        right_child = np.zeros(total, dtype=np.int32)
+        default_left = np.zeros(total, dtype=bool)
+        missing_type = np.zeros(total, dtype=np.int8)
+        is_categorical = np.zeros(total, dtype=bool)
+        cat_start = np.zeros(total, dtype=np.int64)
+        cat_len = np.zeros(total, dtype=np.int64)
+        leaf_value = np.zeros(total, dtype=np.float64)
+        roots = np.zeros(len(trees), dtype=np.int32)
+        cat_words = []
+        max_depth = 0
+
+        offset = 0
+        for t, tree in enumerate(trees):
+            if _as_int(tree.get("is_linear", "0")):
+                raise NotImplementedError("Linear trees are not supported.")
+
+            ni = n_internal[t]
+            leaves = offset + ni + np.arange(ni + 1, dtype=np.int32)
+            roots[t] = offset if ni > 0 else leaves[0]
+
+            # Leaves: self-loops carrying the (already shrunk) leaf value
+            leaf_value[leaves] = _floats(tree["leaf_value"])
+            left_child[leaves] = leaves
+            right_child[leaves] = leaves
+
+            if ni > 0:
+                nodes = slice(offset, offset + ni)
+                decision = _ints(tree["decision_type"])
+                split_feature[nodes] = _ints(tree["split_feature"])
+                threshold[nodes] = _floats(tree["threshold"])
+                default_left[nodes] = (decision & DEFAULT_LEFT_MASK) != 0
+                missing_type[nodes] = (decision >> 2) & 3
+                is_categorical[nodes] = (decision & CATEGORICAL_MASK) != 0
+
+                # Children: >= 0 is an internal node, < 0 is leaf ~child
+                for name, target in (("left_child", left_child), ("right_child", right_child)):
+                    child = _ints(tree[name])
+                    target[nodes] = np.where(child >= 0, offset + child, offset + ni + ~child)
+
+                # Categorical splits: threshold is an index into this tree's bitsets
+                if _as_int(tree.get("num_cat", "0")) > 0:
+                    boundaries = _ints(tree["cat_boundaries"])
+                    words = _ints(tree["cat_threshold"]).astype(np.uint32)
+                    base = sum(len(w) for w in cat_words)
+                    cat_words.append(words)
+                    cat_nodes = np.flatnonzero(is_categorical[nodes]) + offset
+                    cat_idx = threshold[cat_nodes].astype(np.int64)
+                    cat_start[cat_nodes] = base + boundaries[cat_idx]
+                    cat_len[cat_nodes] = boundaries[cat_idx + 1] - boundaries[cat_idx]
+
+                max_depth = max(max_depth, _tree_depth(_ints(tree["left_child"]), _ints(tree["right_child"])))
+
+            offset += n_nodes[t]
+
+        cat_words = np.concatenate(cat_words) if cat_words else np.zeros(0, dtype=np.uint32)
+        return cls(
+            feature_names, split_feature, threshold, left_child, right_child,
+            default_left, missing_type, is_categorical, cat_start, cat_len, cat_words,
+            leaf_value, roots, max_depth, average_output="average_output" in header,
+        )
+
+    # Node arrays, in the order expected by __init__ (used by the artifact bundle)
+    ARRAY_FIELDS = (
+        "split_feature", "threshold", "left_child", "right_child",
+        "default_left", "missing_type", "is_categorical", "cat_start", "cat_len", "cat_words",
+        "leaf_value", "roots",
+    )
+
+    def to_arrays(self):
+        """Flat node arrays + scalar metadata, e.g. for writing into a bundle."""
+        arrays = {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+        meta = {"feature_names": list(self.feature_names), "max_depth": int(self.max_depth),
+                "average_output": bool(self.average_output)}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuilds the evaluator from `to_arrays()` output (no text parsing)."""
+        return cls(meta["feature_names"], *[arrays[name] for name in cls.ARRAY_FIELDS],
+                   max_depth=meta["max_depth"], average_output=meta["average_output"])
+
+    # --- Prediction ---
+
+    def predict(self, X, block_size=1024):
+        """
+        Raw scores for X (n_rows, n_features), identical to Booster.predict.
+        Rows are processed in blocks to bound the (rows x trees) work arrays.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.to_numpy(dtype=np.float64)
+        # float32 matrices are read as-is (compared against float64 thresholds, as LightGBM does)
+        X = np.ascontiguousarray(X, dtype=np.float32 if getattr(X, "dtype", None) == np.float32 else np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected {len(self.feature_names)} features, got {X.shape[1]}")
+
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), block_size):
+            out[start:start + block_size] = self._predict_block(X[start:start + block_size])
+        if self.average_output:
+            out /= self.num_trees
+        return out
+
+    def _predict_block(self, X):
+        n_rows, n_features = X.shape
+        if not self._has_missing_rules and np.isnan(X).any():
+            # Without NaN/zero missing rules LightGBM treats NaN as 0.0 everywhere
+            X = np.where(np.isnan(X), 0.0, X)
+        flat = X.ravel()
+
+        # One entry per (row, tree) pair, row-major
+        n_trees = self.num_trees
+        row_base = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, n_trees)
+        node = np.tile(self._roots, n_rows)
+        leaf = np.empty(n_rows * n_trees, dtype=np.intp)
+        pair = None
+
+        for level in range(self.max_depth):
+            go_left = self._go_left(flat[row_base + self._split_feature[node]], node)
+            node = self._children[2 * node + go_left]
+
+            # Most pairs reach a leaf within a few levels: drop them from the work set
+            if level >= self.compact_after_level:
+                if pair is None:
+                    pair = np.arange(n_rows * n_trees, dtype=np.intp)
+                done = self._is_leaf[node]
+                leaf[pair[done]] = node[done]
+                active = ~done
+                pair, node, row_base = pair[active], node[active], row_base[active]
+                if len(node) == 0:
+                    break
+
+        if pair is None:
+            leaf = node
+        elif len(node):
+            leaf[pair] = node
+        return self.leaf_value[leaf].reshape(n_rows, n_trees).sum(axis=1)
+
+    def _go_left(self, fval, node):
+        """Vectorised LightGBM NumericalDecision / CategoricalDecision."""
+        if not self._has_missing_rules and not self._has_categorical:
+            return fval <= self.threshold[node]
+
+        missing = self.missing_type[node]
+        is_nan = np.isnan(fval)
+        fval = np.where(is_nan & (missing != MISSING_NAN), 0.0, fval)
+        go_left = fval <= self.threshold[node]
+
+        use_default = ((missing == MISSING_ZERO) & (np.abs(fval) <= ZERO_THRESHOLD)) | \
+                      ((missing == MISSING_NAN) & is_nan)
+        go_left = np.where(use_default, self.default_left[node], go_left)
+
+        if self._has_categorical:
+            cat = self.is_categorical[node]
+            if cat.any():
+                go_left[cat] = self._in_category(fval[cat], is_nan[cat], node[cat])
+        return go_left
+
+    def _in_category(self, fval, is_nan, node):
+        """Bitset membership test; NaN and negative categories go right."""
+        int_fval = np.where(is_nan, -1, fval).astype(np.int64)
+        word = int_fval // 32
+        valid = (~is_nan) & (int_fval >= 0) & (word < self.cat_len[node])
+        bits = np.zeros(len(fval), dtype=np.uint32)
+        bits[valid] = self.cat_words[self.cat_start[node][valid] + word[valid]]
+        return valid & (((bits >> (int_fval % 32).astype(np.uint32)) & 1) == 1)
+
+
+# --- Model text parsing helpers ---
+
+def _parse_model_text(model_str):
+    """Splits the LightGBM text format into (header dict, list of tree dicts)."""
+    header, trees, current = {}, [], None
+    for line in model_str.splitlines():
+        line = line.strip()
+        if line.startswith("end of trees"):
+            break
+        if line.startswith("Tree="):
+            current = {}
+            trees.append(current)
+            continue
+        if "=" not in line:
+            if line and current is None:
+                header[line] = ""
+            continue
+        key, value = line.split("=", 1)
+        (header if current is None else current)[key] = value
+    return header, trees
+
+
+def _ints(value):
+    return np.array(value.split(" "), dtype=np.int64) if value else np.zeros(0, dtype=np.int64)
+
+
+def _floats(value):
+    return np.array(value.split(" "), dtype=np.float64) if value else np.zeros(0, dtype=np.float64)
+
+
+def _as_int(value):
+    return int(value) if value else 0
+
+
+def _tree_depth(left, right):
+    """Longest root-to-leaf path (number of splits) of one tree."""
+    depth, frontier = 0, [0]
+    while frontier:
+        depth += 1
+        nxt = []
+        for n in frontier:
+            for child in (left[n], right[n]):
+                if child >= 0:
+                    nxt.append(child)
+        frontier = nxt
+    return depth
@@ -0,0 +1,221 @@
+import os
+import pickle
+import numpy as np
+
+# Embedding matrix aligned row-by-row with visual_index_map.pkl
+# (L2-normalised ResNet50 vectors, see the notebook; float32 or float16 .npy)
+EMBEDDINGS_FILENAME = "visual_embeddings.npy"
+# Optional coarse-quantised index built by scripts/build_visual_index.py
+IVF_FILENAME = "visual_ivf.npz"
+
+
+class VisualIndex:
+    """
+    Cosine-similarity search over the visual embeddings.
+
+    The embedding matrix is memory-mapped (never copied into RAM), and
+    search is an exact blocked matrix product: queries are multiplied with
+    `block_size` rows at a time and a running top-k is kept, so memory stays
+    bounded for any number of items. With an IVF index attached, only the
+    `nprobe` closest clusters are scanned (sub-linear, approximate).
+
+    Rows are addressed by article_id_int; items without an image have no row.
+    """
+    def __init__(self, embeddings, row_article_ids, n_articles, block_size=8192, ivf=None, nprobe=8):
+        self.embeddings = embeddings
+        self.row_article_ids = row_article_ids
+        self.block_size = block_size
+        self.ivf = ivf
+        self.nprobe = nprobe
+
+        # article_id_int -> embedding row (-1 = no image)
+        self.row_of = np.full(n_articles, -1, dtype=np.int64)
+        valid = (row_article_ids >= 0) & (row_article_ids < n_articles)
+        self.row_of[row_article_ids[valid]] = np.flatnonzero(valid)
+        # Rows whose article is not in article_map are never returned by search
+        self.mapped = valid if not valid.all() else None
+
+        print(f"   - Visual Index: {len(embeddings)} items x {embeddings.shape[1]} dims "
+              f"({embeddings.dtype}, {'ivf' if ivf is not None else 'exact'} search).")
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir, id_map, index_map=None, use_ivf=True, **kwargs):
+        """
+        Loads the memory-mapped embeddings and aligns them with article_id_int.
+        `index_map` (FAISS row -> raw article id) defaults to visual_index_map.pkl.
+        Returns None when the embeddings are not shipped.
+        """
+        path = os.path.join(artifact_dir, EMBEDDINGS_FILENAME)
+        if not os.path.exists(path):
+            print(f"Warning: {path} not found. Visual similarity is disabled.")
+            return None
+
+        if index_map is None:
+            with open(os.path.join(artifact_dir, "visual_index_map.pkl"), "rb") as f:
+                index_map = pickle.load(f)
+        embeddings = np.load(path, mmap_mode='r')
+        if len(embeddings) != len(index_map):
+            raise ValueError(f"{path} has {len(embeddings)} rows but the index map has {len(index_map)}.")
+
+        ivf = None
+        ivf_path = os.path.join(artifact_dir, IVF_FILENAME)
+        if use_ivf and os.path.exists(ivf_path):
+            ivf = IVFIndex.load(ivf_path)
+        return cls(embeddings, id_map.encode(index_map), len(id_map), ivf=ivf, **kwargs)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def rows_for(self, article_ids_int):
+        """Embedding rows for article_id_int values (-1 when there is no image)."""
+        ids = np.asarray(article_ids_int, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        in_range = (ids >= 0) & (ids < len(self.row_of))
+        rows[in_range] = self.row_of[ids[in_range]]
+        return rows
+
+    def vectors(self, rows):
+        return np.asarray(self.embeddings[np.asarray(rows)], dtype=np.float32)
+
+    # --- Search ---
+
+    def search(self, queries, k, exact=False):
+        """
+        Top-k rows by inner product for each query vector, over the rows
+        with an article id. Returns (scores, rows), both (n_queries, k),
+        best first; unfilled slots are (-inf, -1).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.embeddings))
+        if self.ivf is not None and not exact:
+            return self.ivf.search(self.embeddings, queries, k, self.nprobe, mapped=self.mapped)
+        return self._search_exact(queries, k)
+
+    def _search_exact(self, queries, k):
+        n_queries = len(queries)
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+
+        for start in range(0, len(self.embeddings), self.block_size):
+            block = np.asarray(self.embeddings[start:start + self.block_size], dtype=np.float32)
+            scores = queries @ block.T
+            if self.mapped is not None:
+                scores[:, ~self.mapped[start:start + len(block)]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block), dtype=np.int64), scores.shape)
+
+            # Merge the block into the running top-k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            best_scores, best_rows = top_k_rows(scores, rows, k)
+
+        return best_scores, np.where(np.isfinite(best_scores), best_rows, -1)
+
+    def similar_many(self, article_ids_int, k=12, exact=False):
+        """
+        "More like this" for several articles at once (one batched search).
+        Returns a list aligned with the input: [(article_id_int, score), ...]
+        best first, excluding the article itself, or None without an image.
+        """
+        rows = self.rows_for(article_ids_int)
+        results = [None] * len(rows)
+        has_image = np.flatnonzero(rows >= 0)
+        if len(has_image) == 0:
+            return results
+
+        # One extra neighbour: the query itself is normally its own best match
+        scores, neighbours = self.search(self.vectors(rows[has_image]), k + 1, exact=exact)
+        for i, query_row, row_scores, row_neighbours in zip(has_image, rows[has_image], scores, neighbours):
+            keep = (row_neighbours != query_row) & (row_neighbours >= 0)
+            article_ids = self.row_article_ids[row_neighbours[keep]][:k]
+            results[i] = list(zip(article_ids.tolist(), row_scores[keep][:k].tolist()))
+        return results
+
+    def similar(self, article_id_int, k=12, exact=False):
+        return self.similar_many([article_id_int], k=k, exact=exact)[0]
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the embeddings (coarse k-means quantiser).
+
+    Rows are grouped by nearest centroid and stored contiguously
+    (CSR: list_offsets + list_rows). A query scores the centroids, then
+    only the rows of its `nprobe` best lists.
+    """
+    def __init__(self, centroids, list_offsets, list_rows):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @classmethod
+    def build(cls, embeddings, n_lists=256, n_iter=10, sample_size=50_000, block_size=8192, seed=0):
+        """Spherical k-means on a sample, then assigns every row to its best centroid."""
+        rng = np.random.default_rng(seed)
+        n = len(embeddings)
+        n_lists = min(n_lists, n)
+        sample_idx = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+        sample = np.asarray(embeddings[sample_idx], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assign, kind='stable')
+            counts = np.bincount(assign, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            used = counts > 0
+            sums[used] = np.add.reduceat(sample[order], starts[used], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            nonempty = norms[:, 0] > 0
+            centroids[nonempty] = sums[nonempty] / norms[nonempty]
+
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        list_rows = np.argsort(assign, kind='stable')
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows)
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['centroids'], data['list_offsets'], data['list_rows'])
+
+    def search(self, embeddings, queries, k, nprobe, mapped=None):
+        """Top-k over the rows of each query's `nprobe` best lists (only rows where `mapped`, if given)."""
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        scores_out = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows_out = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, lists in enumerate(probe):
+            rows = np.concatenate([self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+            if mapped is not None:
+                rows = rows[mapped[rows]]
+            if len(rows) == 0:
+                continue
+            rows.sort()  # sequential reads from the memory map
+            scores = np.asarray(embeddings[rows], dtype=np.float32) @ queries[q]
+            top_scores, top_rows = top_k_rows(scores[None, :], rows[None, :], k)
+            scores_out[q, :top_scores.shape[1]] = top_scores[0]
+            rows_out[q, :top_rows.shape[1]] = top_rows[0]
+        return scores_out, rows_out
+
+
+def top_k_rows(scores, rows, k):
+    """Row-wise top-k of (scores, rows), best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return scores[:, :0], rows[:, :0]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else \
+        np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(np.take_along_axis(rows, top, axis=1), order, axis=1)
@@ -2,6 +2,8 @@ import streamlit as st
 import requests
 import os
 
+from images import LocalImageIndex, ProbeCache, ImageResolver
+
 # --- Configuration ---
 # Default to localhost for local testing if env var not set
 # In Docker, this should be set to "http://backend:8000"
@@ -78,54 +80,51 @@ st.markdown("""
 # Default to web, but can be overridden for local images
 # Example: "C:/path/to/images" or "/app/images"
 IMAGE_BASE_PATH = os.getenv("IMAGE_BASE_PATH", None)
+# Images shipped with the app (scripts/prepare_deployment_images.py)
+DEPLOYMENT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deployment_images")
+
+# Web image checks: cached on disk (hits for IMAGE_CACHE_TTL_HOURS, misses for
+# IMAGE_MISSING_TTL_HOURS), the rest checked IMAGE_PROBE_WORKERS at a time
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache.json"))
+IMAGE_CACHE_TTL_HOURS = float(os.getenv("IMAGE_CACHE_TTL_HOURS", "168"))
+IMAGE_MISSING_TTL_HOURS = float(os.getenv("IMAGE_MISSING_TTL_HOURS", "24"))
+IMAGE_PROBE_WORKERS = int(os.getenv("IMAGE_PROBE_WORKERS", "12"))
+IMAGE_PROBE_TIMEOUT = float(os.getenv("IMAGE_PROBE_TIMEOUT", "1.5"))
+
+# Recommendations per customer are reused across reruns for this long
+RECS_CACHE_TTL_SECONDS = int(os.getenv("RECS_CACHE_TTL_SECONDS", "300"))
 
-def get_image_url(article_id_str):
+
+@st.cache_resource
+def get_image_resolver():
     """
-    Constructs image path or URL.
-    1. If IMAGE_BASE_PATH is valid, try local file: {base}/{folder}/{id}.jpg
-    2. Fallback to H&M Web URL (often broken for old items)
+    One resolver per app process (survives reruns): the local image index
+    is built here, once, and the probe cache is loaded from disk.
     """
-    # Ensure ID is 10 chars (leading zeros)
-    if len(article_id_str) != 10:
-        article_id_str = "0" * (10 - len(article_id_str)) + article_id_str
-        
-    folder = article_id_str[:3]
-    
-    # 1. Local File Check
-    print(f"DEBUG: Checking ID {article_id_str}")
-    print(f"DEBUG: Env IMAGE_BASE_PATH: '{IMAGE_BASE_PATH}'")
-    
-    if IMAGE_BASE_PATH and os.path.exists(IMAGE_BASE_PATH):
-        local_path = os.path.join(IMAGE_BASE_PATH, folder, f"{article_id_str}.jpg")
-        print(f"DEBUG: Checking path: '{local_path}'")
-        if os.path.exists(local_path):
-            print(f"DEBUG: FOUND local file: {local_path}")
-            return local_path
-        else:
-            print(f"DEBUG: File NOT found at: {local_path}")
-    else:
-        print(f"DEBUG: IMAGE_BASE_PATH invalid or dir not found. Exists: {os.path.exists(IMAGE_BASE_PATH) if IMAGE_BASE_PATH else 'N/A'}")
-            
-    # 2. Fallback to Web (with validation)
-    # These items are from 2020, so many public URLs are dead. 
-    # We use a placeholder if the H&M link is broken to keep the UI clean.
-    url = f"https://lp2.hm.com/hmgoepprod?set=source[/{folder}/{article_id_str}.jpg],origin[dam],category[],type[LOOKBOOK],res[m],hmver[1]&call=url[file:/product/main]"
-    
-    return url
+    index = LocalImageIndex([IMAGE_BASE_PATH, DEPLOYMENT_IMAGES])
+    cache = ProbeCache(IMAGE_CACHE_PATH, ttl_seconds=IMAGE_CACHE_TTL_HOURS * 3600,
+                       missing_ttl_seconds=IMAGE_MISSING_TTL_HOURS * 3600)
+    return ImageResolver(index, cache, max_workers=IMAGE_PROBE_WORKERS, timeout=IMAGE_PROBE_TIMEOUT)
+
+
+@st.cache_data(ttl=RECS_CACHE_TTL_SECONDS, show_spinner=False)
+def fetch_recommendations(customer_id):
+    """Backend call, cached per customer. Raises on errors (errors are not cached)."""
+    response = requests.post(
+        f"{API_URL}/predict",
+        json={"customer_id": int(customer_id), "top_k": 12},
+        timeout=60
+    )
+    response.raise_for_status()
+    return response.json().get("recommendations", [])
 
 
 def get_recommendations(customer_id):
     try:
-        response = requests.post(
-            f"{API_URL}/predict",
-            json={"customer_id": int(customer_id), "top_k": 12},
-            timeout=60
-        )
-        if response.status_code == 200:
-            return response.json().get("recommendations", [])
-        else:
-            st.error(f"Backend Error: {response.status_code} - {response.text}")
-            return []
+        return fetch_recommendations(customer_id)
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Backend Error: {e.response.status_code} - {e.response.text}")
+        return []
     except requests.exceptions.ConnectionError:
         st.error("🚨 Could not connect to AI Engine. Is the Backend running?")
         return []
@@ -164,51 +163,21 @@ st.title("Top Picks For You")
 st.markdown("Based on your purchase history and visual style preferences.")
 
 
-def validate_image_url(url):
-    """
-    Checks if an image URL is alive or if a local file exists.
-    """
-    # 1. Local File Check
-    if not url.startswith("http"):
-        if os.path.exists(url):
-            return url
-        # If local file is missing, return placeholder
-        return "https://placehold.co/300x445/EEE/31343C?text=Image+Missing"
-
-    # 2. Web URL Check
-    try:
-        # H&M often returns 200 for broken images (soft 404). 
-        # We MUST check Content-Type to ensure it's a real image and not an error page/pixel.
-        r = requests.head(url, timeout=1.5)
-        content_type = r.headers.get("Content-Type", "").lower()
-        content_length = int(r.headers.get("Content-Length", "0"))
-        
-        # Check 1: Must be an image
-        # Check 2: Must be larger than 1kb (H&M returns a 123-byte transparent pixel for missing items)
-        if r.status_code == 200 and "image" in content_type and content_length > 1000:
-            return url
-    except:
-        pass
-    
-    # Reliable Placeholder
-    return "https://placehold.co/300x445/EEE/31343C?text=Image+Unavailable"
-
-
-
 if customer_id:
     # Fetch Recommendations
     with st.spinner("Curating your unique look..."):
         recs = get_recommendations(customer_id)
     
     if recs:
+        # Resolve every tile's image at once (local index, cached / concurrent web checks)
+        img_urls = get_image_resolver().resolve_many(recs)
+
         # Display Grid
         cols = st.columns(4) # 4 columns grid
-        for idx, article_id in enumerate(recs):
+        for idx, (article_id, img_url) in enumerate(zip(recs, img_urls)):
             col = cols[idx % 4]
             with col:
                 # Image
-                raw_url = get_image_url(article_id)
-                img_url = validate_image_url(raw_url)
                 st.image(img_url, use_container_width=True)
                 
                 # Caption / Details
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shown when an article has no usable image
+PLACEHOLDER_UNAVAILABLE = "https://placehold.co/300x445/EEE/31343C?text=Image+Unavailable"
+
+
+def normalize_article_id(article_id):
+    """Article IDs are 10 characters with leading zeros ('0108775015')."""
+    return str(article_id).zfill(10)
+
+
+def hm_image_url(article_id):
+    """H&M web URL of an article's product image (often dead for 2020 items)."""
+    folder = article_id[:3]
+    return (f"https://lp2.hm.com/hmgoepprod?set=source[/{folder}/{article_id}.jpg],origin[dam],category[],"
+            f"type[LOOKBOOK],res[m],hmver[1]&call=url[file:/product/main]")
+
+
+class LocalImageIndex:
+    """
+    Every local image under the image roots ({root}/{folder}/{article_id}.jpg),
+    indexed ONCE at startup. Lookups are then dict hits instead of
+    os.path.exists calls per tile and rerun. Earlier roots win.
+    A root with a manifest.json (scripts/prepare_deployment_images.py) is
+    read from the manifest instead of being listed.
+    """
+    def __init__(self, roots):
+        self.roots = [root for root in roots if root and os.path.isdir(root)]
+        self.paths = {}
+        for root in reversed(self.roots):
+            self.paths.update(self._from_manifest(root) or self._from_listing(root))
+
+    @staticmethod
+    def _from_manifest(root):
+        try:
+            with open(os.path.join(root, "manifest.json")) as f:
+                manifest = json.load(f)
+            primary = manifest["primary"]
+            return {article_id: os.path.join(root, entry["images"][primary]["path"])
+                    for article_id, entry in manifest["articles"].items() if primary in entry["images"]}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def _from_listing(root):
+        paths = {}
+        for folder in os.scandir(root):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".jpg"):
+                    paths[entry.name[:-4]] = entry.path
+        return paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self, article_id):
+        return self.paths.get(article_id)
+
+
+class ProbeCache:
+    """
+    Results of web image checks (url -> [ok, checked_at]) with a TTL for
+    hits and a shorter one for misses, kept in a JSON file so they survive
+    restarts. Writes go to a temp file renamed into place.
+    """
+    def __init__(self, path, ttl_seconds=7 * 86400, missing_ttl_seconds=86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.missing_ttl_seconds = missing_ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}  # unreadable cache: start over
+
+    def get(self, url):
+        """True / False when a fresh result is cached, None otherwise."""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        ok, checked_at = entry
+        ttl = self.ttl_seconds if ok else self.missing_ttl_seconds
+        return ok if time.time() - checked_at < ttl else None
+
+    def update(self, results):
+        """Stores {url: ok} and persists the cache."""
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            for url, ok in results.items():
+                self._entries[url] = [ok, now]
+            if self.path:
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                try:
+                    with open(tmp_path, "w") as f:
+                        json.dump(self._entries, f)
+                    os.replace(tmp_path, self.path)
+                except OSError:
+                    pass  # read-only filesystem: the cache stays in memory
+
+
+class ImageResolver:
+    """
+    Resolves the image of every tile in one call:
+    1. Local images from the startup index (no filesystem calls)
+    2. Web URLs whose check is cached (ProbeCache)
+    3. All remaining web URLs checked concurrently over one pooled session
+    Returns the image source to show (local path, URL or placeholder) per article.
+    """
+    def __init__(self, local_index, cache, max_workers=12, timeout=1.5):
+        self.local_index = local_index
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-probe")
+
+    def resolve_many(self, article_ids):
+        article_ids = [normalize_article_id(a) for a in article_ids]
+        sources, to_probe = {}, {}
+        for article_id in article_ids:
+            local_path = self.local_index.get(article_id)
+            if local_path is not None:
+                sources[article_id] = local_path
+                continue
+            url = hm_image_url(article_id)
+            ok = self.cache.get(url)
+            if ok is None:
+                to_probe[article_id] = url
+            else:
+                sources[article_id] = url if ok else PLACEHOLDER_UNAVAILABLE
+
+        if to_probe:
+            checks = dict(zip(to_probe.values(), self.executor.map(self._probe, to_probe.values())))
+            # Failed checks (timeouts, connection errors) are retried on the next render
+            self.cache.update({url: ok for url, ok in checks.items() if ok is not None})
+            for article_id, url in to_probe.items():
+                sources[article_id] = url if checks[url] else PLACEHOLDER_UNAVAILABLE
+        return [sources[a] for a in article_ids]
+
+    def _probe(self, url):
+        """
+        H&M often returns 200 for broken images (soft 404), so the response
+        must be an image larger than 1 KB (missing items are a 123-byte pixel).
+        Returns None when the check itself failed.
+        """
+        try:
+            r = self.session.head(url, timeout=self.timeout)
+            content_type = r.headers.get("Content-Type", "").lower()
+            content_length = int(r.headers.get("Content-Length", "0"))
+            return r.status_code == 200 and "image" in content_type and content_length > 1000
+        except (requests.RequestException, ValueError):
+            return None
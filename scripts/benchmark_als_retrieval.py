@@ -0,0 +1,68 @@
+import sys
+import os
+import time
+import tempfile
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from als import ALSRetriever
+
+CATALOGUE_SIZES = [10_000, 50_000, 105_542, 250_000, 500_000]
+USER_BATCHES = [1, 16, 64, 256]
+N_FACTORS = 64  # as trained in the notebook
+N_CANDIDATES = 50
+
+
+def time_call(fn, min_time=0.5, max_repeats=100):
+    """Median wall time of fn() over enough repeats to fill ~min_time seconds."""
+    fn()  # warm up (also pulls the memory map into the page cache)
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < 3 or (len(timings) < max_repeats and time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings))
+
+
+def naive_top_n(users, items, n):
+    """Reference: one full score matrix + argpartition (no blocking)."""
+    scores = users @ items.T
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    return np.take_along_axis(scores, top, axis=1), top
+
+
+def main():
+    rng = np.random.default_rng(42)
+    n_users = max(USER_BATCHES)
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.npy")
+        np.save(user_path, rng.normal(size=(n_users, N_FACTORS)).astype(np.float32))
+
+        print(f"ALS retrieval: {N_FACTORS} factors, top {N_CANDIDATES}, memory-mapped factors\n")
+        print(f"{'items':>8} | {'users':>5} | {'blocked ms':>10} | {'ms/user':>8} | {'naive ms':>9} | {'match':>5}")
+        print("-" * 62)
+        for n_items in CATALOGUE_SIZES:
+            item_path = os.path.join(tmp, f"items_{n_items}.npy")
+            np.save(item_path, rng.normal(size=(n_items, N_FACTORS)).astype(np.float32))
+            retriever = ALSRetriever(np.load(user_path, mmap_mode='r'), np.load(item_path, mmap_mode='r'),
+                                     n_candidates=N_CANDIDATES)
+            items_ram = np.load(item_path)
+            for batch in USER_BATCHES:
+                ids = np.arange(batch)
+                t_blocked = time_call(lambda: retriever.retrieve(ids))
+                users = np.load(user_path)[:batch]
+                t_naive = time_call(lambda: naive_top_n(users, items_ram, N_CANDIDATES))
+
+                # Same candidate sets as the unblocked reference
+                got, _ = retriever.retrieve(ids)
+                _, ref = naive_top_n(users, items_ram, N_CANDIDATES)
+                match = all(set(g) == set(r) for g, r in zip(got, ref))
+                print(f"{n_items:>8} | {batch:>5} | {t_blocked * 1000:>10.2f} | {t_blocked * 1000 / batch:>8.3f} | "
+                      f"{t_naive * 1000:>9.2f} | {str(match):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import sys
+import os
+import time
+import argparse
+import tempfile
+import io
+import contextlib
+import tracemalloc
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from benchmark_results import summarize, add_result_arguments, finish
+
+STAGES = ["feature_fetch", "candidates", "feature_matrix", "predict", "top_k", "decode"]
+
+
+def quiet():
+    """Drops the engine's per-request progress prints (still paid for, not shown)."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def stage_timings(engine, customer_ids, top_k):
+    """
+    One known-user batch through the same steps as recommend_many (as a
+    single chunk), timing each stage. Returns {stage: seconds}.
+    """
+    t = {}
+    t0 = time.perf_counter()
+    # A. User features
+    user_rows, found = engine.features.get_users(customer_ids)
+    t["feature_fetch"] = time.perf_counter() - t0
+
+    # B. Candidate retrieval: recent purchases, seeds, repurchase / ALS / co-purchase / visual
+    t0 = time.perf_counter()
+    history = engine._purchase_history(customer_ids)
+    seeds = engine._seed_articles([None] * len(customer_ids), history)
+    extra_ids, extra_columns = engine._extra_candidates(customer_ids, history, seeds)
+    t["candidates"] = time.perf_counter() - t0
+
+    # C. Candidate join + feature engineering (one stacked matrix)
+    t0 = time.perf_counter()
+    article_ids, X = engine.features.candidate_matrix_many(user_rows[found], extra_ids, extra_columns)
+    t["feature_matrix"] = time.perf_counter() - t0
+
+    # D. Ranker
+    t0 = time.perf_counter()
+    raw = engine.model.predict(X)
+    t["predict"] = time.perf_counter() - t0
+
+    # E. Purchase rules + grouped top-k
+    t0 = time.perf_counter()
+    scores = np.where(article_ids >= 0, raw.reshape(article_ids.shape), -np.inf)
+    scores = engine._apply_purchase_rules(article_ids, scores, history)
+    top_ids = engine._ranked_ids(article_ids, engine._top_k_indices_grouped(scores, top_k))
+    t["top_k"] = time.perf_counter() - t0
+
+    # F. int -> str article IDs
+    t0 = time.perf_counter()
+    for ids in top_ids:
+        engine.id_map.decode(ids[ids >= 0])
+    t["decode"] = time.perf_counter() - t0
+    return t, X.shape[0]
+
+
+def allocations(engine, customer_ids, top_k):
+    """
+    Peak bytes allocated (above what was live before) while building the
+    feature matrix and while serving the whole request, via tracemalloc
+    (NumPy reports its array buffers to it). Returns (matrix_kb, request_kb).
+    """
+    user_rows, found = engine.features.get_users(customer_ids)
+    history = engine._purchase_history(customer_ids)
+    seeds = engine._seed_articles([None] * len(customer_ids), history)
+    extra_ids, extra_columns = engine._extra_candidates(customer_ids, history, seeds)
+
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    engine.features.candidate_matrix_many(user_rows[found], extra_ids, extra_columns)
+    matrix = tracemalloc.get_traced_memory()[1] - before
+
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    with quiet():
+        if len(customer_ids) == 1:
+            engine.recommend(customer_ids[0], top_k=top_k)
+        else:
+            engine.recommend_many(customer_ids, top_k=top_k, chunk_size=len(customer_ids))
+    request = tracemalloc.get_traced_memory()[1] - before
+    return matrix / 1024, request / 1024
+
+
+def run(engine, customer_ids, batch_sizes, iterations, top_k, rng, memory=False):
+    """Per-stage and end-to-end latency for each batch size, on a fresh user sample per iteration."""
+    results = {}
+    for batch in batch_sizes:
+        stages = {name: [] for name in STAGES}
+        end_to_end, rows = [], []
+        for i in range(iterations + 1):
+            ids = rng.choice(customer_ids, size=batch, replace=False).tolist()
+            timings, n_rows = stage_timings(engine, ids, top_k)
+            with quiet():
+                t0 = time.perf_counter()
+                if batch == 1:
+                    engine.recommend(ids[0], top_k=top_k)
+                else:
+                    engine.recommend_many(ids, top_k=top_k, chunk_size=batch)
+                elapsed = time.perf_counter() - t0
+            if i == 0:
+                continue  # warm-up
+            for name in STAGES:
+                stages[name].append(timings[name])
+            end_to_end.append(elapsed)
+            rows.append(n_rows)
+
+        for name in STAGES:
+            results[f"{name}/batch={batch}"] = summarize(stages[name])
+        total = summarize(end_to_end)
+        total["users_per_second"] = round(batch * iterations / sum(end_to_end), 1)
+        total["rows_per_user"] = round(float(np.mean(rows)) / batch, 1)
+        results[f"end_to_end/batch={batch}"] = total
+
+        if memory:
+            # Separate pass: tracing allocations slows every call down
+            tracemalloc.start()
+            peaks = [allocations(engine, rng.choice(customer_ids, size=batch, replace=False).tolist(), top_k)
+                     for _ in range(min(iterations, 10) + 1)][1:]
+            tracemalloc.stop()
+            results[f"feature_matrix/batch={batch}"]["peak_alloc_kb"] = round(max(p[0] for p in peaks), 1)
+            total["peak_alloc_kb"] = round(max(p[1] for p in peaks), 1)
+        print(f"{batch:>5} | " + " | ".join(f"{results[f'{n}/batch={batch}']['p50_ms']:>9.2f}" for n in STAGES)
+              + f" | {total['p50_ms']:>9.2f} | {total['p99_ms']:>9.2f} | {total['users_per_second']:>9,.0f}")
+
+    # Cold start users (no features): ranked lists / co-purchase expansion only
+    cold = []
+    for _ in range(iterations):
+        with quiet():
+            t0 = time.perf_counter()
+            engine.recommend(-1, top_k=top_k)
+            cold.append(time.perf_counter() - t0)
+    results["cold_start/batch=1"] = summarize(cold)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stage-by-stage latency of RecSysEngine (feature fetch, candidates, feature matrix, "
+                    "predict, top-k, decode) on real or synthetic artifacts."
+    )
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Benchmark on generated artifacts (see generate_synthetic_artifacts.py) instead")
+    parser.add_argument("--users", type=int, default=50_000, help="Synthetic scale: users with features")
+    parser.add_argument("--items", type=int, default=105_542, help="Synthetic scale: articles")
+    parser.add_argument("--pool-size", type=int, default=5_000, help="Synthetic scale: candidate pool")
+    parser.add_argument("--extras", action="store_true", help="Synthetic: also ALS, visual, purchases, co-purchase")
+    parser.add_argument("--batch-sizes", default="1,16,64")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--feature-backend", default="memory", choices=["memory", "duckdb"])
+    parser.add_argument("--ranker-backend", default="lightgbm", choices=["lightgbm", "native"])
+    parser.add_argument("--no-bundle", action="store_true")
+    parser.add_argument("--memory", action="store_true",
+                        help="Also record peak bytes allocated per feature matrix / request (tracemalloc)")
+    parser.add_argument("--seed", type=int, default=42)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    from inference import RecSysEngine
+    tmp = None
+    meta = {"benchmark": "engine", "iterations": args.iterations, "top_k": args.top_k,
+            "feature_backend": args.feature_backend, "ranker_backend": args.ranker_backend}
+    if args.synthetic:
+        from generate_synthetic_artifacts import generate_artifacts
+        tmp = tempfile.TemporaryDirectory()
+        args.artifact_dir = tmp.name
+        meta["synthetic"] = generate_artifacts(tmp.name, n_users=args.users, n_items=args.items,
+                                               pool_size=args.pool_size, extras=args.extras, seed=args.seed)
+
+    engine = RecSysEngine(artifact_dir=args.artifact_dir, feature_backend=args.feature_backend,
+                          ranker_backend=args.ranker_backend, use_bundle=not args.no_bundle)
+    meta["artifact_version"] = engine.artifact_version
+    customer_ids = engine.features.sample_customer_ids(100_000, seed=args.seed)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    print(f"\nms (p50) per stage, {args.iterations} batches of distinct users each\n")
+    print(f"{'batch':>5} | " + " | ".join(f"{n[:9]:>9}" for n in STAGES)
+          + f" | {'total p50':>9} | {'total p99':>9} | {'users/sec':>9}")
+    print("-" * (20 + 12 * (len(STAGES) + 2)))
+    results = run(engine, customer_ids, batch_sizes, args.iterations, args.top_k, np.random.default_rng(args.seed),
+                  memory=args.memory)
+    if args.memory:
+        print(f"\npeak KB allocated: " + ", ".join(
+            f"batch={b}: matrix {results[f'feature_matrix/batch={b}']['peak_alloc_kb']:,.0f}, "
+            f"request {results[f'end_to_end/batch={b}']['peak_alloc_kb']:,.0f}" for b in batch_sizes))
+    engine.close()
+
+    finish(args, meta, results)
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
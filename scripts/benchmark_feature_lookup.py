@@ -0,0 +1,127 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from benchmark_results import add_result_arguments, finish, summarize
+from generate_synthetic_artifacts import generate_artifacts
+
+BACKENDS = ("parquet", "feature_db")
+
+
+def open_store(artifact_dir, backend):
+    """A DuckDBFeatureStore on the parquet views, or on the attached features.duckdb (as RecSysEngine does)."""
+    import duckdb
+    from feature_store import DuckDBFeatureStore
+    from feature_db import attach_feature_db, sql_string
+
+    con = duckdb.connect(database=':memory:')
+    for name, filename in (("users", "features_user.parquet"), ("items", "features_item.parquet")):
+        con.execute(f"CREATE OR REPLACE VIEW {name} AS "
+                    f"SELECT * FROM read_parquet({sql_string(os.path.join(artifact_dir, filename))})")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW candidates AS
+        SELECT * EXCLUDE (file_row_number), file_row_number AS pool_position
+        FROM read_parquet({sql_string(os.path.join(artifact_dir, "candidates_pool.parquet"))}, file_row_number = true)
+    """)
+    if backend == "feature_db" and not attach_feature_db(con, artifact_dir):
+        raise SystemExit(f"Could not attach the feature database of {artifact_dir}")
+    return con, DuckDBFeatureStore(con)
+
+
+def measure(store, single_ids, batches, warmup=20):
+    """Latency (s) of every get_user call and of every get_users batch."""
+    for customer_id in single_ids[:warmup]:
+        store.get_user(int(customer_id))
+    single = []
+    for customer_id in single_ids:
+        start = time.perf_counter()
+        store.get_user(int(customer_id))
+        single.append(time.perf_counter() - start)
+    batch = []
+    for ids in batches:
+        start = time.perf_counter()
+        store.get_users(ids)
+        batch.append(time.perf_counter() - start)
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Feature lookup latency of the low-memory duckdb backend against the number of customers: "
+                    "get_user / get_users on the parquet views vs the indexed feature database (features.duckdb)."
+    )
+    parser.add_argument("--users", default="100000,400000,1371980", help="Comma-separated customer counts")
+    parser.add_argument("--items", type=int, default=105_542)
+    parser.add_argument("--work-dir", default=os.path.join("backend", "build", "feature_lookup"),
+                        help="Synthetic artifact directories, one per customer count (reused if present)")
+    parser.add_argument("--lookups", type=int, default=2000, help="Timed get_user calls per run")
+    parser.add_argument("--batches", type=int, default=200, help="Timed get_users calls per run")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--cold-fraction", type=float, default=0.05, help="Share of unknown customers")
+    parser.add_argument("--seed", type=int, default=42)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    from feature_db import compile_feature_db, feature_db_is_fresh
+    import pyarrow.parquet as pq
+
+    counts = [int(n) for n in args.users.split(",") if n]
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    rows = []
+    for n_users in counts:
+        artifact_dir = os.path.join(args.work_dir, f"users={n_users}")
+        if not os.path.exists(os.path.join(artifact_dir, "features_user.parquet")):
+            print(f"Generating {n_users} customers -> {artifact_dir}")
+            generate_artifacts(artifact_dir, n_users=n_users, n_items=args.items, customer_id_space=max(n_users, 1_371_980),
+                               n_trees=5, seed=args.seed)
+        start = time.perf_counter()
+        if not feature_db_is_fresh(artifact_dir):
+            compile_feature_db(artifact_dir)
+        compile_seconds = time.perf_counter() - start
+
+        # Same requests for both backends: known customers plus a share of unknown ids
+        known = pq.read_table(os.path.join(artifact_dir, "features_user.parquet"),
+                              columns=["customer_id_int"]).column(0).to_numpy()
+        total = args.lookups + args.batches * args.batch_size
+        ids = rng.choice(known, size=total)
+        cold = rng.random(total) < args.cold_fraction
+        ids[cold] = -1 - rng.integers(0, 1_000_000, int(cold.sum()))
+        single_ids = ids[:args.lookups]
+        batches = ids[args.lookups:].reshape(args.batches, args.batch_size)
+
+        for backend in BACKENDS:
+            con, store = open_store(artifact_dir, backend)
+            try:
+                single, batch = measure(store, single_ids, batches)
+            finally:
+                store.close()
+                con.close()
+            name = f"lookup/users={n_users}/{backend}"
+            results[f"{name}/single"] = summarize(single)
+            results[f"{name}/batch={args.batch_size}"] = summarize(batch)
+            rows.append((n_users, backend, results[f"{name}/single"], results[f"{name}/batch={args.batch_size}"]))
+        results[f"lookup/users={n_users}/feature_db"] = {
+            "compile_seconds": round(compile_seconds, 2),
+            "size_mb": round(os.path.getsize(os.path.join(artifact_dir, "features.duckdb")) / 1e6, 1),
+        }
+
+    print(f"\n{'users':>9} | {'backend':<10} | {'get_user p50':>12} | {'p99':>8} | "
+          f"{f'batch={args.batch_size} p50':>13} | {'p99':>8}")
+    print("-" * 75)
+    for n_users, backend, single, batch in rows:
+        print(f"{n_users:>9} | {backend:<10} | {single['p50_ms']:>9.3f} ms | {single['p99_ms']:>8.3f} | "
+              f"{batch['p50_ms']:>10.3f} ms | {batch['p99_ms']:>8.3f}")
+
+    meta = {"benchmark": "feature_lookup", "users": counts, "items": args.items, "lookups": args.lookups,
+            "batches": args.batches, "batch_size": args.batch_size, "cold_fraction": args.cold_fraction}
+    finish(args, meta, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import platform
+import numpy as np
+
+# Shared by benchmark_engine.py, load_test.py and benchmark_scaling.py: one JSON layout, so any two
+# runs (or a run and a committed baseline) can be compared key by key.
+
+
+def summarize(latencies):
+    """Latency percentiles (ms) of a list of seconds."""
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    if len(ms) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def environment():
+    """Machine / library versions recorded next to the results."""
+    import pandas as pd
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__}
+    for name in ("lightgbm", "duckdb", "fastapi"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return {"platform": platform.platform(), "cpu_count": os.cpu_count(), "versions": versions,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def write_results(path, meta, results):
+    """
+    Writes {"meta": ..., "results": {name: {metric: value}}}. Result names
+    are flat strings (e.g. "predict/batch=64") so baselines diff cleanly.
+    """
+    payload = {"meta": {**environment(), **meta}, "results": results}
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    print(f"Results -> {path}")
+    return payload
+
+
+# Metrics where higher is better (throughput, evaluation quality incl. every recall_at_<k>);
+# every other metric (*_ms, *_kb) is lower-is-better
+HIGHER_IS_BETTER = ("users_per_second", "requests_per_second", "map", "candidate_recall")
+
+
+def higher_is_better(metric):
+    return metric in HIGHER_IS_BETTER or metric.startswith("recall_at_")
+
+
+def compare(results, baseline_path, tolerance=0.2,
+            metrics=("p50_ms", "p99_ms", "peak_alloc_kb") + HIGHER_IS_BETTER):
+    """
+    Prints each metric against the baseline file's value and returns the
+    regressions: results more than `tolerance` (relative) worse than the
+    baseline. Names missing on either side are skipped.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    if not set(results) & set(baseline):
+        print(f"\nNo results in common with {baseline_path}")
+        return regressions
+    print(f"\n{'result':<40} | {'metric':<19} | {'baseline':>10} | {'current':>10} | {'ratio':>6}")
+    print("-" * 97)
+    for name in sorted(set(results) & set(baseline)):
+        for metric in metrics:
+            old, new = baseline[name].get(metric), results[name].get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            worse = ratio < 1 - tolerance if higher_is_better(metric) else ratio > 1 + tolerance
+            flag = "  <-- regression" if worse else ""
+            print(f"{name:<40} | {metric:<19} | {old:>10.3f} | {new:>10.3f} | {ratio:>5.2f}x{flag}")
+            if worse:
+                regressions.append((name, metric, old, new))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {tolerance:.0%} of {baseline_path}")
+    return regressions
+
+
+def finish(args, meta, results, metrics=None):
+    """Common tail of the benchmark CLIs: write, compare, exit 1 on regressions if asked."""
+    if args.output:
+        write_results(args.output, meta, results)
+    if args.baseline:
+        kwargs = {"metrics": metrics} if metrics else {}
+        regressions = compare(results, args.baseline, tolerance=args.tolerance, **kwargs)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+def add_result_arguments(parser):
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 when a regression is found")
@@ -0,0 +1,118 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+
+from benchmark_results import add_result_arguments, finish
+from load_test import BACKEND_DIR, LoadGenerator, load_customers
+
+
+def start_serving(artifact_dir, port, workers, env_overrides, log_path=None):
+    """Runs backend/serve.py with `workers` processes and waits until /ready (every worker attached)."""
+    import httpx
+    env = {**os.environ, "ARTIFACT_DIR": os.path.abspath(artifact_dir), **env_overrides}
+    log = open(log_path, "a") if log_path else subprocess.DEVNULL
+    server = subprocess.Popen([sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+                               "--workers", str(workers)],
+                              cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    start = time.perf_counter()
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"serve.py exited with code {server.returncode}")
+        try:
+            response = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=2)
+            if response.status_code == 200:
+                return server, time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise SystemExit(f"{workers} worker(s) did not become ready within 300s")
+
+
+async def measure(args, customers, workers):
+    """Closed loop with `concurrency_per_worker` connections per worker; memory read after the load."""
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout, limits=limits) as client:
+        generator = LoadGenerator(client, customers, top_k=args.top_k, batch_size=args.batch_size)
+        result = await generator.run(args.duration, args.warmup, concurrency=args.concurrency_per_worker * workers)
+        # Every worker's /ready reports all of them: one call gives the RSS / PSS of the group
+        serving = (await client.get("/ready")).json()
+    for key in ("total_rss_mb", "total_pss_mb"):
+        if key in serving:
+            result[key.replace("total_", "")] = serving[key]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput scaling of multi-process serving (backend/serve.py) from 1 to N worker processes: "
+                    "req/s, latency percentiles, scaling efficiency and the workers' combined RSS / PSS."
+    )
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--workers", default=None,
+                        help="Comma-separated worker counts (default: 1, 2, 4, ... up to the usable cores)")
+    parser.add_argument("--concurrency-per-worker", type=int, default=4, help="Closed loop connections per worker")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=3, help="Unrecorded seconds before each measurement")
+    parser.add_argument("--batch-size", type=int, default=0, help="Use /predict/batch with this many customers")
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--cold-fraction", type=float, default=0.05, help="Share of unknown customers")
+    parser.add_argument("--customers", type=int, default=200_000, help="Distinct request customers sampled")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--server-log", default=None, help="File for the servers' output (default: discarded)")
+    parser.add_argument("--server-env", action="append", default=["RESULT_CACHE=false"],
+                        help="KEY=VALUE for the servers (repeatable; the result cache is off by default)")
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    sys.path.append(BACKEND_DIR)
+    from serve import detect_workers
+
+    cores = detect_workers()
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    customers = load_customers(args.artifact_dir, args.customers, args.cold_fraction, np.random.default_rng(args.seed))
+    env = dict(kv.split("=", 1) for kv in args.server_env)
+
+    results = {}
+    baseline_rps = None
+    print(f"\n{'workers':>7} | {'ready s':>7} | {'req/s':>8} | {'speedup':>7} | {'eff.':>5} | {'p50 ms':>8} | "
+          f"{'p99 ms':>8} | {'RSS MB':>8} | {'PSS MB':>8} | {'errors':>6}")
+    print("-" * 101)
+    for workers in counts:
+        server, ready_seconds = start_serving(args.artifact_dir, args.port, workers, env, args.server_log)
+        try:
+            result = asyncio.run(measure(args, customers, workers))
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+        rps = result["requests_per_second"]
+        baseline_rps = baseline_rps or rps
+        result["ready_seconds"] = round(ready_seconds, 2)
+        result["speedup"] = round(rps / baseline_rps, 2) if baseline_rps else 0.0
+        result["scaling_efficiency"] = round(result["speedup"] / workers * counts[0], 2)
+        results[f"scaling/workers={workers}"] = result
+        print(f"{workers:>7} | {ready_seconds:>7.1f} | {rps:>8,.1f} | {result['speedup']:>6.2f}x | "
+              f"{result['scaling_efficiency']:>5.2f} | {result.get('p50_ms', 0):>8.2f} | {result.get('p99_ms', 0):>8.2f} | "
+              f"{result.get('rss_mb', 0):>8.1f} | {result.get('pss_mb', 0):>8.1f} | {result['errors']:>6}")
+
+    meta = {"benchmark": "scaling", "usable_cores": cores, "workers": counts, "duration": args.duration,
+            "warmup": args.warmup, "concurrency_per_worker": args.concurrency_per_worker,
+            "batch_size": args.batch_size, "cold_fraction": args.cold_fraction, "server_env": args.server_env}
+    finish(args, meta, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import lightgbm as lgb
+from tree_model import TreeEnsemble
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts"))
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000]
+
+
+def time_call(fn, X, min_time=0.5, max_repeats=200):
+    """Median wall time of fn(X) over enough repeats to fill ~min_time seconds."""
+    fn(X)  # warm up
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < 3 or (len(timings) < max_repeats and time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings))
+
+
+def main():
+    model_path = os.path.join(ARTIFACT_DIR, "lgbm_ranker.txt")
+    booster = lgb.Booster(model_file=model_path)
+    native = TreeEnsemble.from_model_file(model_path)
+    feature_names = booster.feature_name()
+    print(f"Model: {native.num_trees} trees, max depth {native.max_depth}, {len(feature_names)} features")
+
+    rng = np.random.default_rng(42)
+    X_all = rng.random((max(BATCH_SIZES), len(feature_names)))
+
+    print(f"\n{'rows':>8} | {'booster(df) ms':>14} | {'booster(np) ms':>14} | {'native ms':>10} | {'vs df':>6} | {'vs np':>6}")
+    print("-" * 74)
+    for n in BATCH_SIZES:
+        X = X_all[:n]
+        df = pd.DataFrame(X, columns=feature_names)
+        t_df = time_call(booster.predict, df)
+        t_np = time_call(booster.predict, X)
+        t_native = time_call(native.predict, X)
+        print(f"{n:>8} | {t_df * 1000:>14.3f} | {t_np * 1000:>14.3f} | {t_native * 1000:>10.3f} | "
+              f"{t_df / t_native:>5.2f}x | {t_np / t_native:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
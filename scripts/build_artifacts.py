@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Builds the serving artifacts from the raw H&M CSVs (articles.csv, customers.csv,
+# transactions_train.csv), replacing the notebook's in-memory pandas steps:
+#   article_map      <- articles.csv                        (artifact)
+#   customer_map     <- customers.csv                       (work dir)
+#   transactions     <- transactions_train.csv + both maps  (work dir, transactions_clean)
+#   features_user    <- transactions                        (artifact)
+#   features_item    <- transactions + article_map + articles.csv (artifact)
+#   candidates_pool  <- features_item                       (artifact)
+# Every aggregation / join runs in DuckDB with a memory limit and a spill
+# directory; results are streamed out as Arrow record batches into parquet,
+# sorted by their lookup key. build_manifest.json records each stage's input
+# fingerprint, so a rerun only recomputes stages whose inputs or settings changed,
+# and an interrupted build resumes at the stage that did not finish.
+
+MANIFEST_FILENAME = "build_manifest.json"
+MANIFEST_VERSION = 1
+
+# Rows per Arrow batch pulled from DuckDB (bounds the Python-side memory)
+BATCH_ROWS = 1 << 20
+
+# Output schemas: the dtypes of the notebook's artifacts
+SCHEMAS = {
+    "article_map": pa.schema([('article_id_str', pa.string()), ('article_id_int', pa.int64())]),
+    "customer_map": pa.schema([('customer_id_str', pa.string()), ('customer_id_int', pa.int64())]),
+    "transactions": pa.schema([('t_dat', pa.date32()), ('customer_id_int', pa.int64()), ('article_id_int', pa.int64()),
+                               ('price', pa.float64()), ('sales_channel_id', pa.int64())]),
+    "features_user": pa.schema([('customer_id_int', pa.int64()), ('user_avg_price', pa.float64()),
+                                ('user_price_std', pa.float64()), ('user_total_purchases', pa.int64()),
+                                ('user_tenure_days', pa.int64()), ('days_since_last_buy', pa.int64())]),
+    "features_item": pa.schema([('article_id_int', pa.int64()), ('item_avg_price', pa.float64()),
+                                ('item_total_sales', pa.int64()), ('product_group', pa.int8()),
+                                ('index_group', pa.int8()), ('garment_group', pa.int8())]),
+    "candidates_pool": pa.schema([('article_id_int', pa.int64())]),
+}
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class PeakMemory:
+    """
+    Peak RSS of this process (DuckDB runs in-process) while a stage runs,
+    sampled from /proc/self/statm by a background thread (Linux; 0 elsewhere).
+    """
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._rss())
+
+
+class ArtifactBuild:
+    """
+    Staged, restartable artifact build:
+    1. Each stage declares its input files and settings; their fingerprint
+       (path, size, mtime + settings) is compared with build_manifest.json
+    2. Stages with a changed fingerprint (or a missing output) run their
+       DuckDB query; the result is streamed as Arrow batches into a temp
+       parquet file renamed into place, so outputs are never half-written
+    3. The manifest is rewritten after every stage with its fingerprint,
+       row count, seconds and peak RSS; rebuilt outputs change the
+       fingerprint of the stages that read them
+    """
+    def __init__(self, data_dir, output_dir, work_dir, memory_limit="4GB", threads=0,
+                 reference_date="2020-09-15", pool_size=5000, row_group_size=122_880, force=False):
+        import duckdb
+
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.work_dir = work_dir
+        self.reference_date = reference_date
+        self.pool_size = pool_size
+        self.row_group_size = row_group_size
+        self.force = force
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(work_dir, exist_ok=True)
+
+        self.con = duckdb.connect(database=':memory:')
+        # Larger-than-memory aggregations, joins and sorts spill to the work dir
+        self.con.execute(f"SET memory_limit = '{memory_limit}'")
+        self.con.execute(f"SET temp_directory = '{os.path.join(work_dir, 'duckdb_tmp')}'")
+        self.con.execute("SET preserve_insertion_order = false")
+        if threads > 0:
+            self.con.execute(f"SET threads = {int(threads)}")
+
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.manifest = self._load_manifest()
+
+    def path(self, name):
+        """Output file of a stage: artifacts in output_dir, intermediates in work_dir."""
+        folder = self.work_dir if name in ("customer_map", "transactions") else self.output_dir
+        filename = "transactions_clean.parquet" if name == "transactions" else f"{name}.parquet"
+        return os.path.join(folder, filename)
+
+    def raw(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def stages(self):
+        """(name, input files, settings, query) in dependency order."""
+        articles = f"read_csv_auto('{self.raw('articles.csv')}', types={{'article_id': 'VARCHAR'}})"
+        customers = f"read_csv_auto('{self.raw('customers.csv')}', types={{'customer_id': 'VARCHAR'}})"
+        transactions_raw = (f"read_csv_auto('{self.raw('transactions_train.csv')}', "
+                            f"types={{'article_id': 'VARCHAR', 'customer_id': 'VARCHAR'}})")
+        clean = f"read_parquet('{self.path('transactions')}')"
+        return [
+            # Dense integer IDs, deterministic by sorting the string IDs (as the notebook)
+            ("article_map", [self.raw("articles.csv")], {}, f"""
+                SELECT article_id AS article_id_str,
+                       ROW_NUMBER() OVER (ORDER BY article_id) - 1 AS article_id_int
+                FROM {articles}
+                ORDER BY article_id_int
+            """),
+            ("customer_map", [self.raw("customers.csv")], {}, f"""
+                SELECT customer_id AS customer_id_str,
+                       ROW_NUMBER() OVER (ORDER BY customer_id) - 1 AS customer_id_int
+                FROM {customers}
+                ORDER BY customer_id_int
+            """),
+            # transactions_clean, clustered by day then customer (date-window scans skip row groups)
+            ("transactions", [self.raw("transactions_train.csv"), self.path("article_map"), self.path("customer_map")], {},
+             f"""
+                SELECT CAST(t.t_dat AS DATE) AS t_dat, c.customer_id_int, a.article_id_int,
+                       t.price, t.sales_channel_id
+                FROM {transactions_raw} t
+                JOIN read_parquet('{self.path('customer_map')}') c ON t.customer_id = c.customer_id_str
+                JOIN read_parquet('{self.path('article_map')}') a ON t.article_id = a.article_id_str
+                ORDER BY t_dat, customer_id_int
+            """),
+            # Recency is relative to the reference date (the notebook's last training day)
+            ("features_user", [self.path("transactions")], {"reference_date": self.reference_date}, f"""
+                SELECT customer_id_int,
+                       AVG(price) AS user_avg_price,
+                       STDDEV(price) AS user_price_std,
+                       COUNT(*) AS user_total_purchases,
+                       DATE_DIFF('day', MIN(t_dat), MAX(t_dat)) AS user_tenure_days,
+                       DATE_DIFF('day', MAX(t_dat), DATE '{self.reference_date}') AS days_since_last_buy
+                FROM {clean}
+                GROUP BY customer_id_int
+                ORDER BY customer_id_int
+            """),
+            # Group names -> codes of the sorted distinct names (pandas cat.codes; NULL -> -1)
+            ("features_item", [self.path("transactions"), self.path("article_map"), self.raw("articles.csv")], {}, f"""
+                WITH items AS (
+                    SELECT t.article_id_int,
+                           AVG(t.price) AS item_avg_price,
+                           COUNT(*) AS item_total_sales,
+                           MAX(a.product_group_name) AS product_group,
+                           MAX(a.index_group_name) AS index_group,
+                           MAX(a.garment_group_name) AS garment_group
+                    FROM {clean} t
+                    JOIN read_parquet('{self.path('article_map')}') m ON t.article_id_int = m.article_id_int
+                    JOIN {articles} a ON m.article_id_str = a.article_id
+                    GROUP BY t.article_id_int
+                )
+                SELECT article_id_int, item_avg_price, item_total_sales,
+                       {self._category_code('product_group')} AS product_group,
+                       {self._category_code('index_group')} AS index_group,
+                       {self._category_code('garment_group')} AS garment_group
+                FROM items
+                ORDER BY article_id_int
+            """),
+            # The candidate pool: best sellers (ties broken by article_id_int, so reruns are identical)
+            ("candidates_pool", [self.path("features_item")], {"pool_size": self.pool_size}, f"""
+                SELECT article_id_int FROM read_parquet('{self.path('features_item')}')
+                ORDER BY item_total_sales DESC, article_id_int
+                LIMIT {int(self.pool_size)}
+            """),
+        ]
+
+    @staticmethod
+    def _category_code(column):
+        return (f"CASE WHEN {column} IS NULL THEN -1 "
+                f"ELSE DENSE_RANK() OVER (PARTITION BY {column} IS NULL ORDER BY {column}) - 1 END")
+
+    def _load_manifest(self):
+        empty = {"version": MANIFEST_VERSION, "stages": {}}
+        if not os.path.exists(self.manifest_path):
+            return empty
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        return manifest if manifest.get("version") == MANIFEST_VERSION else empty
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = time.time()
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _fingerprint(self, inputs, settings, query):
+        payload = {"inputs": [file_fingerprint(p) for p in inputs], "settings": settings,
+                   "query": " ".join(query.split()), "row_group_size": self.row_group_size}
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _write_query(self, query, path, schema):
+        """Streams the query result as Arrow batches into `path` (atomic). Returns the row count."""
+        reader = self.con.execute(query).fetch_record_batch(BATCH_ROWS)
+        tmp_path = path + ".tmp"
+        rows = 0
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for batch in reader:
+                writer.write_table(pa.Table.from_batches([batch]).cast(schema), row_group_size=self.row_group_size)
+                rows += batch.num_rows
+        os.replace(tmp_path, path)
+        return rows
+
+    def run(self, only=None):
+        """Runs the out-of-date stages (or only the named ones, if still out of date). Returns the report."""
+        report = {}
+        for name, inputs, settings, query in self.stages():
+            if only and name not in only:
+                continue
+            missing = [p for p in inputs if not os.path.exists(p)]
+            if missing:
+                raise SystemExit(f"Stage {name}: missing input(s) {missing}")
+            fingerprint = self._fingerprint(inputs, settings, query)
+            previous = self.manifest["stages"].get(name, {})
+            if not self.force and previous.get("fingerprint") == fingerprint and os.path.exists(self.path(name)):
+                report[name] = {"status": "up to date", **{k: previous[k] for k in ("rows", "seconds", "peak_rss_mb")}}
+                print(f"   {name:<16} up to date ({previous['rows']:,} rows)")
+                continue
+
+            print(f"   {name:<16} building...", flush=True)
+            start = time.perf_counter()
+            with PeakMemory() as memory:
+                rows = self._write_query(query, self.path(name), SCHEMAS[name])
+            entry = {
+                "fingerprint": fingerprint,
+                "output": os.path.abspath(self.path(name)),
+                "rows": rows,
+                "seconds": round(time.perf_counter() - start, 2),
+                "peak_rss_mb": round(memory.peak_bytes / 1e6, 1),
+                "built_at": time.time(),
+            }
+            self.manifest["stages"][name] = entry
+            self._write_manifest()
+            report[name] = {"status": "built", **{k: entry[k] for k in ("rows", "seconds", "peak_rss_mb")}}
+            print(f"   {name:<16} built: {rows:,} rows in {entry['seconds']}s (peak RSS {entry['peak_rss_mb']:,.0f} MB)")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build article_map, features_user, features_item and candidates_pool parquet artifacts from the "
+                    "raw H&M CSVs with DuckDB (spilling to disk), incrementally via build_manifest.json."
+    )
+    parser.add_argument("--data-dir", default="data", help="Folder with articles.csv, customers.csv, transactions_train.csv")
+    parser.add_argument("--output-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--work-dir", default=None,
+                        help="Intermediates (customer map, transactions_clean) and DuckDB spill files "
+                             "(default: <output-dir>/../build)")
+    parser.add_argument("--memory-limit", default="4GB", help="DuckDB memory limit; larger work spills to the work dir")
+    parser.add_argument("--threads", type=int, default=0, help="DuckDB threads (0 = all cores)")
+    parser.add_argument("--reference-date", default="2020-09-15", help="Day days_since_last_buy is counted from")
+    parser.add_argument("--pool-size", type=int, default=5000, help="Best sellers in the candidate pool")
+    parser.add_argument("--row-group-size", type=int, default=122_880, help="Parquet rows per row group")
+    parser.add_argument("--stages", default=None, help="Comma-separated stages to consider (default: all)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even up-to-date stages")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or os.path.join(os.path.dirname(os.path.abspath(args.output_dir)), "build")
+    print(f"--- Building artifacts: {args.data_dir} -> {args.output_dir} (work dir {work_dir}, "
+          f"memory limit {args.memory_limit}) ---")
+    build = ArtifactBuild(args.data_dir, args.output_dir, work_dir, memory_limit=args.memory_limit,
+                          threads=args.threads, reference_date=args.reference_date, pool_size=args.pool_size,
+                          row_group_size=args.row_group_size, force=args.force)
+    only = set(args.stages.split(",")) if args.stages else None
+    start = time.perf_counter()
+    report = build.run(only)
+
+    built = [name for name, stage in report.items() if stage["status"] == "built"]
+    print(f"\nDone in {time.perf_counter() - start:.1f}s: {len(built)} stage(s) built, "
+          f"{len(report) - len(built)} up to date. Manifest: {build.manifest_path}")
+    if built:
+        print("Recompile engine.bundle (scripts/compile_artifacts.py) before serving the new artifacts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import sys
+import os
+import argparse
+import time
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from copurchase import NEIGHBOURS_FILENAME, WEIGHTS_FILENAME, CoPurchaseIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the item-to-item co-purchase neighbours (top-K per article_id_int) "
+                    "from transaction files with t_dat, customer_id_int, article_id_int."
+    )
+    parser.add_argument("transactions", nargs="+", help="Parquet or CSV transaction files")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--k", type=int, default=20, help="Neighbours kept per article")
+    parser.add_argument("--weeks", type=int, default=12, help="History used (weeks before the newest transaction)")
+    parser.add_argument("--basket", default="customer", choices=["customer", "day"],
+                        help="Co-purchase unit: same customer in the window, or same customer and day")
+    parser.add_argument("--min-count", type=int, default=2, help="Minimum shared baskets for a neighbour")
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Articles per sparse product")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n_articles = len(pd.read_parquet(os.path.join(args.artifact_dir, "article_map.parquet"), columns=['article_id_int']))
+
+    # DuckDB reads only the window and deduplicates the (basket, article) pairs
+    paths = ", ".join(repr(p) for p in args.transactions)
+    reader = "read_parquet" if all(p.endswith(".parquet") for p in args.transactions) else "read_csv_auto"
+    basket = "customer_id_int" if args.basket == "customer" else \
+        "customer_id_int * 100000 + DATE_DIFF('day', DATE '1970-01-01', CAST(t_dat AS DATE))"
+    con = duckdb.connect(database=':memory:')
+    pairs = con.execute(f"""
+        WITH tx AS (SELECT * FROM {reader}([{paths}]))
+        SELECT DISTINCT {basket} AS basket_id, article_id_int
+        FROM tx
+        WHERE CAST(t_dat AS DATE) > (SELECT MAX(CAST(t_dat AS DATE)) FROM tx) - INTERVAL {args.weeks * 7} DAY
+    """).fetchnumpy()
+    print(f"{len(pairs['basket_id'])} (basket, article) pairs loaded ({time.perf_counter() - start:.1f}s)")
+
+    neighbours, weights = CoPurchaseIndex.build(pairs['basket_id'], pairs['article_id_int'], n_articles,
+                                                k=args.k, min_count=args.min_count, chunk_size=args.chunk_size)
+    np.save(os.path.join(args.artifact_dir, NEIGHBOURS_FILENAME), neighbours)
+    np.save(os.path.join(args.artifact_dir, WEIGHTS_FILENAME), weights)
+
+    covered = int((neighbours[:, 0] >= 0).sum())
+    print(f"{covered}/{n_articles} articles have co-purchase neighbours (k={args.k}) -> {args.artifact_dir} "
+          f"({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import sys
+import os
+import argparse
+import time
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from recent_purchases import RECENT_PURCHASES_FILENAME, RecentPurchaseIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the per-customer recent purchases index (repurchase candidates, "
+                    "already-bought rules) from transaction files with t_dat, customer_id_int, "
+                    "article_id_int, e.g. the notebook's transactions_clean exported to parquet."
+    )
+    parser.add_argument("transactions", nargs="+", help="Parquet or CSV transaction files")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--window-days", type=int, default=28)
+    parser.add_argument("--reference-date", default=None,
+                        help="Last day of the window (default: the newest transaction)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = RecentPurchaseIndex.from_transactions(args.transactions, window_days=args.window_days,
+                                                  reference_date=args.reference_date)
+    path = os.path.join(args.artifact_dir, RECENT_PURCHASES_FILENAME)
+    index.save(path)
+
+    customers = int((index.offsets[1:] > index.offsets[:-1]).sum())
+    print(f"{len(index)} (customer, article) pairs for {customers} customers -> {path} "
+          f"({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from visual import EMBEDDINGS_FILENAME, IVF_FILENAME, IVFIndex
+
+
+def export_faiss_index(index_path, output_path, dtype):
+    """Dumps the vectors of the notebook's hm_visual.index (IndexFlatIP) as a .npy matrix."""
+    import faiss  # only needed for this one-off export
+
+    index = faiss.read_index(index_path)
+    print(f"Exporting {index.ntotal} x {index.d} vectors from {index_path}...")
+    out = np.lib.format.open_memmap(output_path, mode='w+', dtype=dtype, shape=(index.ntotal, index.d))
+    step = 8192
+    for start in range(0, index.ntotal, step):
+        n = min(step, index.ntotal - start)
+        block = index.reconstruct_n(start, n)
+        # The notebook normalised before indexing; normalise again to be safe
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        out[start:start + n] = block.astype(dtype)
+    out.flush()
+    del out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the visual similarity artifacts.")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--faiss-index", default=None, help="hm_visual.index to export to visual_embeddings.npy")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--n-lists", type=int, default=256, help="IVF clusters (0 = exact search only)")
+    parser.add_argument("--n-iter", type=int, default=10)
+    args = parser.parse_args()
+
+    embeddings_path = os.path.join(args.artifact_dir, EMBEDDINGS_FILENAME)
+    if args.faiss_index:
+        export_faiss_index(args.faiss_index, embeddings_path, args.dtype)
+
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    print(f"Embeddings: {embeddings.shape} {embeddings.dtype}")
+
+    if args.n_lists > 0:
+        start = time.perf_counter()
+        ivf = IVFIndex.build(embeddings, n_lists=args.n_lists, n_iter=args.n_iter)
+        ivf_path = os.path.join(args.artifact_dir, IVF_FILENAME)
+        ivf.save(ivf_path)
+        sizes = np.diff(ivf.list_offsets)
+        print(f"IVF index: {args.n_lists} lists (sizes {sizes.min()}-{sizes.max()}, "
+              f"median {int(np.median(sizes))}) built in {time.perf_counter() - start:.1f}s -> {ivf_path}")
+
+
+if __name__ == "__main__":
+    main()
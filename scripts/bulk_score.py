@@ -0,0 +1,180 @@
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+MANIFEST_FILENAME = "_manifest.json"
+SUCCESS_FILENAME = "_SUCCESS"
+
+# One engine per worker process, built once by the pool initializer
+_engine = None
+
+
+def _init_worker(artifact_dir, engine_kwargs):
+    global _engine
+    from inference import RecSysEngine
+    _engine = RecSysEngine(artifact_dir=artifact_dir, **engine_kwargs)
+
+
+def _part_path(output_dir, index):
+    return os.path.join(output_dir, f"part-{index:06d}.parquet")
+
+
+def _score_chunk(index, customer_ids, top_k, output_dir):
+    """
+    Scores one chunk of customers (recommend_many: stacked predict + grouped
+    argpartition top-k) and writes it as one parquet part. The part is
+    renamed into place only when complete: it is the chunk's checkpoint.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start = time.perf_counter()
+    recs = _engine.recommend_many(customer_ids.tolist(), top_k=top_k)
+    table = pa.table({
+        "customer_id_int": pa.array(customer_ids, type=pa.int64()),
+        # H&M submission format: space-separated article IDs, best first
+        "prediction": pa.array([" ".join(r) for r in recs], type=pa.string()),
+    })
+    path = _part_path(output_dir, index)
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return index, len(customer_ids), time.perf_counter() - start
+
+
+def _customer_batches(con, source, chunk_size):
+    """
+    Customer ids in a stable order, streamed as Arrow record batches of
+    `chunk_size` rows (chunk i is the same customers on every run).
+    """
+    reader = con.execute(f"""
+        SELECT DISTINCT customer_id_int FROM {source}
+        WHERE customer_id_int >= 0
+        ORDER BY customer_id_int
+    """).fetch_record_batch(chunk_size)
+    for batch in reader:
+        yield batch.column(0).to_numpy().astype("int64")
+
+
+def _check_manifest(output_dir, manifest, overwrite):
+    """Creates the output directory, or checks that a resumed run has the same settings."""
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    if overwrite and os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        changed = {k: (previous.get(k), v) for k, v in manifest.items() if previous.get(k) != v}
+        if changed:
+            raise SystemExit(f"{output_dir} was written with different settings {changed}; "
+                             f"use --overwrite to start again.")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute top-k recommendations for every customer into a partitioned parquet "
+                    "dataset (one part per chunk; rerun to resume after an interruption)."
+    )
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--output-dir", default="bulk_recommendations")
+    parser.add_argument("--customers", default=None,
+                        help="Parquet/CSV with a customer_id_int column (default: features_user.parquet)")
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--chunk-size", type=int, default=20_000, help="Customers per part / task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--ranker-backend", default="lightgbm", choices=["lightgbm", "native"])
+    parser.add_argument("--no-bundle", action="store_true", help="Load the raw artifacts instead of engine.bundle")
+    parser.add_argument("--overwrite", action="store_true", help="Discard a previous run in --output-dir")
+    args = parser.parse_args()
+
+    # Split the cores between the processes (LightGBM/OpenMP threads per worker);
+    # must be set before any worker loads the native libraries
+    if args.workers > 1:
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    import duckdb
+    from inference import compute_artifact_version
+
+    customers = args.customers or os.path.join(args.artifact_dir, "features_user.parquet")
+    reader = "read_parquet" if customers.endswith(".parquet") else "read_csv_auto"
+    source = f"{reader}('{customers}')"
+    manifest = {
+        "artifact_version": compute_artifact_version(args.artifact_dir),
+        "customers": os.path.abspath(customers),
+        "top_k": args.top_k,
+        "chunk_size": args.chunk_size,
+    }
+    _check_manifest(args.output_dir, manifest, args.overwrite)
+
+    con = duckdb.connect(database=':memory:')
+    total = con.execute(f"SELECT COUNT(DISTINCT customer_id_int) FROM {source} WHERE customer_id_int >= 0").fetchone()[0]
+    n_chunks = -(-total // args.chunk_size)
+    done = {i for i in range(n_chunks) if os.path.exists(_part_path(args.output_dir, i))}
+    print(f"{total} customers in {n_chunks} chunks of {args.chunk_size}; "
+          f"{len(done)} already written, {args.workers} worker(s).")
+
+    engine_kwargs = {"ranker_backend": args.ranker_backend, "use_bundle": not args.no_bundle}
+    start = time.perf_counter()
+    scored = 0
+    compute_seconds = 0.0
+
+    def report(index, n, seconds):
+        nonlocal scored, compute_seconds
+        scored += n
+        compute_seconds += seconds
+        elapsed = time.perf_counter() - start
+        rate = scored / elapsed if elapsed else 0.0
+        remaining = total - scored - len(done) * args.chunk_size
+        eta = max(remaining, 0) / rate if rate else 0.0
+        print(f"   part {index:06d}: {n} users in {seconds:.1f}s | {scored} users, "
+              f"{rate:,.0f} users/sec, ETA {eta / 60:.1f} min")
+
+    chunks = ((i, ids) for i, ids in enumerate(_customer_batches(con, source, args.chunk_size)) if i not in done)
+    if args.workers <= 1:
+        _init_worker(args.artifact_dir, engine_kwargs)
+        start = time.perf_counter()
+        for index, ids in chunks:
+            report(*_score_chunk(index, ids, args.top_k, args.output_dir))
+    else:
+        # At most 2 chunks in flight per worker: bounded memory in the parent
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(args.artifact_dir, engine_kwargs)) as pool:
+            pending = set()
+            for index, ids in chunks:
+                pending.add(pool.submit(_score_chunk, index, ids, args.top_k, args.output_dir))
+                if len(pending) >= 2 * args.workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        report(*future.result())
+            for future in pending:
+                report(*future.result())
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "customers": total,
+        "scored_this_run": scored,
+        "seconds": round(elapsed, 2),
+        "users_per_second": round(scored / elapsed, 1) if elapsed and scored else None,
+        "compute_seconds": round(compute_seconds, 2),
+        "workers": args.workers,
+    }
+    with open(os.path.join(args.output_dir, SUCCESS_FILENAME), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Done: {scored} users scored in {elapsed:.1f}s "
+          f"({summary['users_per_second']} users/sec) -> {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
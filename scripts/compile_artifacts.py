@@ -0,0 +1,37 @@
+import sys
+import os
+import time
+import argparse
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from bundle import ArtifactBundle, compile_bundle
+from feature_db import compile_feature_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the raw artifacts into a memory-mappable engine bundle.")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--output", default=None, help="Bundle path (default: <artifact-dir>/engine.bundle)")
+    parser.add_argument("--feature-db", action="store_true",
+                        help="Also compile the indexed feature database (features.duckdb) of FEATURE_BACKEND=duckdb")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path = compile_bundle(args.artifact_dir, args.output)
+    print(f"Compiled in {time.perf_counter() - start:.2f}s")
+
+    # Re-open and verify every checksum before anyone deploys it
+    start = time.perf_counter()
+    bundle = ArtifactBundle.open(path, verify=True)
+    print(f"Verified {len(bundle.header['arrays'])} arrays in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.feature_db:
+        start = time.perf_counter()
+        compile_feature_db(args.artifact_dir)
+        print(f"Feature DB compiled in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
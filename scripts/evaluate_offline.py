@@ -0,0 +1,87 @@
+import sys
+import os
+import argparse
+
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from benchmark_results import add_result_arguments, finish
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline evaluation: replays a holdout window of transactions (t_dat, customer_id_int, "
+                    "article_id_int) through the serving engine and reports MAP@12, recall@k, candidate recall, "
+                    "hits per candidate source and the evaluation throughput (users/sec)."
+    )
+    parser.add_argument("transactions", nargs="+", help="Parquet or CSV transaction files containing the holdout")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--start-date", default=None, help="First holdout day (default: the last --days of the files)")
+    parser.add_argument("--days", type=int, default=7, help="Holdout window length")
+    parser.add_argument("--k", type=int, default=12, help="Cutoff of MAP@k")
+    parser.add_argument("--recall-k", default="12,50", help="Comma-separated cutoffs of recall@k")
+    parser.add_argument("--sample", type=float, default=1.0, help="Share of the holdout customers (deterministic)")
+    parser.add_argument("--read-chunk", type=int, default=20_000, help="Holdout customers read at a time")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Users per stacked predict call")
+    parser.add_argument("--feature-backend", default="memory", choices=["memory", "duckdb"])
+    parser.add_argument("--ranker-backend", default="lightgbm", choices=["lightgbm", "native"])
+    parser.add_argument("--no-bundle", action="store_true", help="Load the raw artifacts instead of engine.bundle")
+    parser.add_argument("--exclude-purchased-days", type=int, default=int(os.getenv("EXCLUDE_PURCHASED_DAYS", "0")))
+    parser.add_argument("--repurchase-boost", type=float, default=float(os.getenv("REPURCHASE_BOOST", "0")))
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    from inference import RecSysEngine
+    from evaluation import OfflineEvaluator, holdout_batches, last_window_start
+
+    start_date = args.start_date or last_window_start(args.transactions, args.days)
+    engine = RecSysEngine(artifact_dir=args.artifact_dir, feature_backend=args.feature_backend,
+                          ranker_backend=args.ranker_backend, use_bundle=not args.no_bundle,
+                          batch_chunk_size=args.chunk_size, exclude_purchased_days=args.exclude_purchased_days,
+                          repurchase_boost=args.repurchase_boost)
+    # Purchases from the holdout in the engine's history would leak the answers
+    if engine.purchases is not None and engine.purchases.reference_day >= np.datetime64(start_date, 'D').astype(np.int64):
+        print(f"Warning: the recent purchases index runs until {np.datetime64(engine.purchases.reference_day, 'D')}, "
+              f"inside the holdout starting {start_date}: repurchase candidates and rules see the answers.")
+
+    recall_ks = [int(k) for k in args.recall_k.split(",") if k]
+    evaluator = OfflineEvaluator(engine, k=args.k, recall_ks=recall_ks, chunk_size=args.chunk_size)
+    print(f"Evaluating {args.days} day(s) from {start_date} (MAP@{args.k}, recall@{evaluator.recall_ks})...")
+
+    def progress(users, seconds):
+        print(f"   {users} users, {users / seconds:,.0f} users/sec", end="\r", flush=True)
+
+    batches = holdout_batches(args.transactions, start_date, days=args.days, chunk_size=args.read_chunk,
+                              sample=args.sample)
+    report = evaluator.evaluate(batches, progress=progress)
+    print()
+
+    overall = report["all"]
+    print(f"\n{'users':<7} | {'count':>8} | {f'MAP@{args.k}':>8} | "
+          + " | ".join(f"{f'R@{k}':>7}" for k in evaluator.recall_ks) + f" | {'cand. R':>7} | {'cand/user':>9}")
+    print("-" * (62 + 10 * len(evaluator.recall_ks)))
+    for path in ("all", "known", "cold"):
+        r = report[path]
+        print(f"{path:<7} | {r['users']:>8} | {r['map']:>8.4f} | "
+              + " | ".join(f"{r[f'recall_at_{k}']:>7.4f}" for k in evaluator.recall_ks)
+              + f" | {r['candidate_recall']:>7.4f} | {r['candidates_per_user']:>9.1f}")
+
+    print(f"\nHits @{args.k} by source:       " + ", ".join(f"{s}={n}" for s, n in overall["hits_by_source"].items()))
+    print("Hits among candidates by source: "
+          + ", ".join(f"{s}={n}" for s, n in overall["candidate_hits_by_source"].items()))
+    print(f"\nThroughput: {overall['users_per_second']:,.1f} users/sec ({overall['seconds']}s; scoring "
+          f"{overall['scoring_seconds']}s, metrics {overall['metric_seconds']}s)")
+
+    meta = {"benchmark": "evaluation", "start_date": start_date, "days": args.days, "k": args.k,
+            "recall_ks": evaluator.recall_ks, "sample": args.sample, "chunk_size": args.chunk_size,
+            "feature_backend": args.feature_backend, "ranker_backend": args.ranker_backend,
+            "artifact_version": engine.artifact_version}
+    results = {f"evaluation/{path}": report[path] for path in ("all", "known", "cold")}
+    quality = ("map", "candidate_recall") + tuple(f"recall_at_{k}" for k in evaluator.recall_ks)
+    finish(args, meta, results, metrics=quality + ("users_per_second",))
+
+
+if __name__ == "__main__":
+    main()
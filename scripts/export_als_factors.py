@@ -0,0 +1,33 @@
+import sys
+import os
+import argparse
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from als import USER_FACTORS_FILENAME, ITEM_FACTORS_FILENAME
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the notebook's implicit ALS factors for online retrieval. "
+                    "In the notebook, save the trained model first: model.save('als_model.npz') "
+                    "(call model.to_cpu() first for GPU models)."
+    )
+    parser.add_argument("model_path", help="als_model.npz written by implicit's model.save()")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")))
+    parser.add_argument("--dtype", default="float32", choices=["float16", "float32"])
+    args = parser.parse_args()
+
+    # implicit's save() is a plain npz: no need to import implicit here
+    model = np.load(args.model_path)
+    for key, filename in (("user_factors", USER_FACTORS_FILENAME), ("item_factors", ITEM_FACTORS_FILENAME)):
+        factors = model[key].astype(args.dtype)
+        path = os.path.join(args.artifact_dir, filename)
+        np.save(path, factors)
+        print(f"{key}: {factors.shape} {factors.dtype} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
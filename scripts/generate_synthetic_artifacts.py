@@ -0,0 +1,162 @@
+import sys
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from feature_store import FEATURE_ORDER
+from als import USER_FACTORS_FILENAME, ITEM_FACTORS_FILENAME
+from visual import EMBEDDINGS_FILENAME
+from recent_purchases import RECENT_PURCHASES_FILENAME, RecentPurchaseIndex
+from copurchase import NEIGHBOURS_FILENAME, WEIGHTS_FILENAME, CoPurchaseIndex
+
+# Same reference date as the notebook's days_since_last_buy
+REFERENCE_DAY = int(np.datetime64("2020-09-15", "D").astype(np.int64))
+
+
+def generate_artifacts(output_dir, n_users=50_000, n_items=105_542, pool_size=5_000, customer_id_space=1_371_980,
+                       n_trees=86, extras=False, n_transactions=500_000, seed=42):
+    """
+    Writes a synthetic artifact directory with the same files, columns and
+    dtypes as backend/artifacts (plus features_user.parquet), at any scale.
+    With `extras`, the optional serving artifacts are generated too: ALS
+    factors, visual embeddings, recent purchases and co-purchase neighbours.
+    Returns the summary dict of what was written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    # 1. Article map: dense article_id_int, 10-character article IDs
+    raw_ids = np.sort(108_775_015 + rng.choice(850_685_986, size=n_items, replace=False))
+    pd.DataFrame({
+        'article_id_str': pd.array([f"{a:010d}" for a in raw_ids], dtype="string"),
+        'article_id_int': np.arange(n_items, dtype=np.int64),
+    }).to_parquet(os.path.join(output_dir, "article_map.parquet"), index=False)
+
+    # 2. Item features (a few articles have none, as in the real file)
+    item_ids = np.sort(rng.choice(n_items, size=int(n_items * 0.99), replace=False))
+    sales = np.maximum(rng.zipf(1.6, len(item_ids)), 1).clip(max=60_000).astype(np.int64)
+    items = pd.DataFrame({
+        'article_id_int': item_ids,
+        'item_avg_price': rng.lognormal(np.log(0.025), 0.5, len(item_ids)),
+        'item_total_sales': sales,
+        'product_group': rng.integers(0, 19, len(item_ids)).astype(np.int8),
+        'index_group': rng.integers(0, 5, len(item_ids)).astype(np.int8),
+        'garment_group': rng.integers(0, 21, len(item_ids)).astype(np.int8),
+    })
+    items.to_parquet(os.path.join(output_dir, "features_item.parquet"), index=False)
+
+    # 3. Candidate pool: the best sellers
+    pool = items.sort_values('item_total_sales', ascending=False, kind='stable')['article_id_int'][:pool_size]
+    pd.DataFrame({'article_id_int': pool.to_numpy(dtype=np.int64)}).to_parquet(
+        os.path.join(output_dir, "candidates_pool.parquet"), index=False)
+
+    # 4. User features (sparse customer ids, as in the real customer_id_int space)
+    customer_ids = np.sort(rng.choice(customer_id_space, size=n_users, replace=False)).astype(np.int64)
+    purchases = rng.integers(1, 300, n_users)
+    tenure = np.where(purchases > 1, rng.integers(0, 733, n_users), 0)
+    users = pd.DataFrame({
+        'customer_id_int': customer_ids,
+        'user_avg_price': rng.lognormal(np.log(0.028), 0.4, n_users),
+        'user_price_std': np.where(purchases > 1, rng.random(n_users) * 0.03, np.nan),
+        'user_total_purchases': purchases.astype(np.int64),
+        'user_tenure_days': tenure.astype(np.int64),
+        'days_since_last_buy': rng.integers(1, 400, n_users).astype(np.int64),
+    })
+    users.to_parquet(os.path.join(output_dir, "features_user.parquet"), index=False)
+
+    # 5. Ranker: a small lambdarank model on synthetic rows with the real feature names
+    _train_ranker(os.path.join(output_dir, "lgbm_ranker.txt"), items, users, n_trees, rng)
+
+    # 6. Visual index map: ~58% of the articles have an image
+    with_image = np.sort(rng.choice(n_items, size=int(n_items * 0.58), replace=False))
+    with open(os.path.join(output_dir, "visual_index_map.pkl"), "wb") as f:
+        pickle.dump(raw_ids[with_image].astype(np.int64), f)
+
+    summary = {"users": n_users, "items": n_items, "pool_size": pool_size, "trees": n_trees, "extras": extras}
+    if extras:
+        summary["transactions"] = _generate_extras(output_dir, rng, customer_ids, customer_id_space, n_items,
+                                                   len(with_image), n_transactions, pool.to_numpy())
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def _train_ranker(path, items, users, n_trees, rng, n_groups=400, group_size=50):
+    import lightgbm as lgb
+
+    n = n_groups * group_size
+    item_rows = items.iloc[rng.integers(0, len(items), n)]
+    user_rows = users.iloc[np.repeat(rng.integers(0, len(users), n_groups), group_size)]
+    X = pd.DataFrame({
+        'source': rng.integers(0, 4, n),
+        'als_score': np.where(rng.random(n) < 0.3, rng.random(n), -1),
+        'visual_score': np.where(rng.random(n) < 0.1, rng.random(n), -1),
+        **{c: user_rows[c].to_numpy() for c in FEATURE_ORDER[3:8]},
+        **{c: item_rows[c].to_numpy() for c in FEATURE_ORDER[8:13]},
+    })
+    X['user_price_std'] = X['user_price_std'].fillna(0)
+    X['price_diff'] = X['item_avg_price'] - X['user_avg_price']
+    X = X[FEATURE_ORDER]
+    # Label: popular, well-priced items are "bought" more often
+    logit = np.log1p(X['item_total_sales']) / 4 - np.abs(X['price_diff']) * 20 + rng.normal(0, 1, n)
+    y = (logit > np.quantile(logit, 0.9)).astype(int)
+
+    params = {"objective": "lambdarank", "learning_rate": 0.05, "min_child_samples": 5, "seed": 42, "verbose": -1}
+    booster = lgb.train(params, lgb.Dataset(X, y, group=[group_size] * n_groups), num_boost_round=n_trees)
+    booster.save_model(path)
+
+
+def _generate_extras(output_dir, rng, customer_ids, customer_id_space, n_items, n_images, n_transactions, pool):
+    n_factors = 32
+    np.save(os.path.join(output_dir, USER_FACTORS_FILENAME),
+            (rng.standard_normal((customer_id_space, n_factors)) * 0.1).astype(np.float32))
+    np.save(os.path.join(output_dir, ITEM_FACTORS_FILENAME),
+            (rng.standard_normal((n_items, n_factors)) * 0.1).astype(np.float32))
+
+    embeddings = rng.standard_normal((n_images, 64)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(os.path.join(output_dir, EMBEDDINGS_FILENAME), embeddings.astype(np.float16))
+
+    # Transactions over the last 12 weeks: popular items + per-customer taste clusters
+    buyers = rng.choice(customer_ids, n_transactions)
+    popular = rng.random(n_transactions) < 0.5
+    articles = np.where(popular, rng.choice(pool, n_transactions),
+                        (buyers * 7919 + rng.integers(0, 40, n_transactions)) % n_items)
+    days = REFERENCE_DAY - rng.integers(0, 84, n_transactions)
+
+    RecentPurchaseIndex.build(buyers, articles, days, window_days=28, reference_day=REFERENCE_DAY).save(
+        os.path.join(output_dir, RECENT_PURCHASES_FILENAME))
+    neighbours, weights = CoPurchaseIndex.build(buyers, articles, n_items, k=20)
+    np.save(os.path.join(output_dir, NEIGHBOURS_FILENAME), neighbours)
+    np.save(os.path.join(output_dir, WEIGHTS_FILENAME), weights)
+    return n_transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic artifacts in the backend/artifacts schema.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--items", type=int, default=105_542)
+    parser.add_argument("--pool-size", type=int, default=5_000)
+    parser.add_argument("--customer-id-space", type=int, default=1_371_980)
+    parser.add_argument("--trees", type=int, default=86)
+    parser.add_argument("--extras", action="store_true",
+                        help="Also generate ALS factors, visual embeddings, recent purchases and co-purchase neighbours")
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    summary = generate_artifacts(args.output_dir, n_users=args.users, n_items=args.items, pool_size=args.pool_size,
+                                 customer_id_space=args.customer_id_space, n_trees=args.trees, extras=args.extras,
+                                 n_transactions=args.transactions, seed=args.seed)
+    print(f"Synthetic artifacts -> {args.output_dir}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
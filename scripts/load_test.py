@@ -0,0 +1,210 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+from benchmark_results import summarize, add_result_arguments, finish
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def load_customers(artifact_dir, n, cold_fraction, rng):
+    """Request customer ids: known customers from features_user.parquet, plus unknown (cold start) ids."""
+    known = pd.read_parquet(os.path.join(artifact_dir, "features_user.parquet"),
+                            columns=['customer_id_int'])['customer_id_int'].to_numpy()
+    ids = rng.choice(known, size=n)
+    cold = rng.random(n) < cold_fraction
+    ids[cold] = -1 - np.arange(cold.sum())  # never in the feature store
+    return ids.tolist()
+
+
+def start_server(artifact_dir, port, env_overrides, log_path=None):
+    """Runs the API under uvicorn (backend/ as cwd) and waits until the model is loaded."""
+    import httpx
+    env = {**os.environ, "ARTIFACT_DIR": os.path.abspath(artifact_dir), **env_overrides}
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=2).json().get("model_loaded"):
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise SystemExit("Server did not load the model within 300s")
+
+
+class LoadGenerator:
+    """
+    Sends /predict (or /predict/batch) requests and records latencies.
+
+    Closed loop (`concurrency` workers, each sending its next request when
+    the previous one returns) measures capacity. Open loop (`rate` requests
+    per second, constant or Poisson arrivals) measures latency at a given
+    load: latency is counted from each request's scheduled send time, so a
+    saturated server is not hidden by the client slowing down (coordinated
+    omission).
+    """
+    def __init__(self, client, customers, top_k=12, batch_size=0):
+        self.client = client
+        self.customers = customers
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.latencies = []
+        self.errors = {}
+        self.sent = 0
+        self.recording = False
+
+    def _payload(self):
+        i = self.sent
+        self.sent += max(self.batch_size, 1)
+        n = len(self.customers)
+        if self.batch_size:
+            ids = [self.customers[(i + j) % n] for j in range(self.batch_size)]
+            return "/predict/batch", {"customer_ids": ids, "top_k": self.top_k}
+        return "/predict", {"customer_id": self.customers[i % n], "top_k": self.top_k}
+
+    async def _send(self, scheduled):
+        path, payload = self._payload()
+        try:
+            response = await self.client.post(path, json=payload)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        if not self.recording:
+            return
+        if status == 200:
+            self.latencies.append(time.perf_counter() - scheduled)
+        else:
+            self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+
+    async def closed_loop(self, concurrency, seconds):
+        async def worker(stop_at):
+            while time.perf_counter() < stop_at:
+                await self._send(time.perf_counter())
+        stop_at = time.perf_counter() + seconds
+        await asyncio.gather(*(worker(stop_at) for _ in range(concurrency)))
+
+    async def open_loop(self, rate, seconds, poisson, rng):
+        gaps = rng.exponential(1 / rate, int(rate * seconds) + 1) if poisson else \
+            np.full(int(rate * seconds) + 1, 1 / rate)
+        start = time.perf_counter()
+        tasks = []
+        for scheduled in start + np.cumsum(gaps):
+            if scheduled - start > seconds:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._send(scheduled)))
+        await asyncio.gather(*tasks)
+
+    async def run(self, seconds, warmup, concurrency=None, rate=None, poisson=False, rng=None):
+        """Warm-up (not recorded), then the measured phase. Returns the result dict."""
+        elapsed = 0.0
+        for phase, duration in (("warmup", warmup), ("measure", seconds)):
+            if duration <= 0:
+                continue
+            self.recording = phase == "measure"
+            start = time.perf_counter()
+            if rate:
+                await self.open_loop(rate, duration, poisson, rng)
+            else:
+                await self.closed_loop(concurrency, duration)
+            elapsed = time.perf_counter() - start
+
+        result = summarize(self.latencies)
+        result["requests_per_second"] = round(len(self.latencies) / elapsed, 1) if elapsed else 0.0
+        result["users_per_second"] = round(result["requests_per_second"] * max(self.batch_size, 1), 1)
+        result["errors"] = sum(self.errors.values())
+        result["error_codes"] = self.errors
+        return result
+
+
+async def run_scenarios(args, customers):
+    import httpx
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    endpoint = f"batch={args.batch_size}" if args.batch_size else "predict"
+    scenarios = [("rate", r) for r in args.rate] if args.rate else [("concurrency", c) for c in args.concurrency]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for kind, value in scenarios:
+            generator = LoadGenerator(client, customers, top_k=args.top_k, batch_size=args.batch_size)
+            if kind == "rate":
+                result = await generator.run(args.duration, args.warmup, rate=value, poisson=args.poisson, rng=rng)
+            else:
+                result = await generator.run(args.duration, args.warmup, concurrency=value)
+            name = f"http/{endpoint}/{kind}={value:g}"
+            results[name] = result
+            print(f"{name:<36} | {result['requests_per_second']:>8,.1f} | {result.get('p50_ms', 0):>8.2f} | "
+                  f"{result.get('p90_ms', 0):>8.2f} | {result.get('p99_ms', 0):>8.2f} | {result['errors']:>6}")
+            # Customers are consumed in order: the next scenario starts on unseen (uncached) ones
+            customers = customers[generator.sent % len(customers):] + customers[:generator.sent % len(customers)]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Async HTTP load generator for the recommendation API: fixed concurrency (closed loop) "
+                    "or fixed arrival rates (open loop), latency percentiles and throughput as JSON."
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--artifact-dir", default=os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts")),
+                        help="Where features_user.parquet (request customers) is read from")
+    parser.add_argument("--concurrency", default="1,4,16", help="Closed loop: comma-separated concurrency levels")
+    parser.add_argument("--rate", default=None, help="Open loop: comma-separated requests/sec (overrides --concurrency)")
+    parser.add_argument("--poisson", action="store_true", help="Open loop: exponential inter-arrival times")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="Unrecorded seconds before each scenario")
+    parser.add_argument("--batch-size", type=int, default=0, help="Use /predict/batch with this many customers")
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--cold-fraction", type=float, default=0.05, help="Share of unknown customers")
+    parser.add_argument("--customers", type=int, default=200_000, help="Distinct request customers sampled")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-server", action="store_true",
+                        help="Start uvicorn on --port with --artifact-dir (stopped at the end)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--server-log", default=None, help="File for the started server's output (default: discarded)")
+    parser.add_argument("--server-env", action="append", default=[],
+                        help="KEY=VALUE for the started server, e.g. RESULT_CACHE=false (repeatable)")
+    add_result_arguments(parser)
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.rate = [float(r) for r in args.rate.split(",")] if args.rate else None
+
+    customers = load_customers(args.artifact_dir, args.customers, args.cold_fraction, np.random.default_rng(args.seed))
+    server = None
+    if args.start_server:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.artifact_dir, args.port, dict(kv.split("=", 1) for kv in args.server_env),
+                              args.server_log)
+
+    meta = {"benchmark": "http", "url": args.url, "duration": args.duration, "warmup": args.warmup,
+            "batch_size": args.batch_size, "cold_fraction": args.cold_fraction, "top_k": args.top_k,
+            "poisson": args.poisson, "server_env": args.server_env}
+    print(f"\n{'scenario':<36} | {'req/s':>8} | {'p50 ms':>8} | {'p90 ms':>8} | {'p99 ms':>8} | {'errors':>6}")
+    print("-" * 88)
+    try:
+        results = asyncio.run(run_scenarios(args, customers))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    finish(args, meta, results)
+
+
+if __name__ == "__main__":
+    main()
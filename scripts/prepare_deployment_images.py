@@ -1,9 +1,15 @@
-import pandas as pd
 import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
 from PIL import Image
-import shutil
 
-# Config
+# Config (defaults for the asset container: artifacts, raw images and output are mounted)
 CANDIDATES_PATH = "/app/artifacts/candidates_pool.parquet"
 MAPPING_PATH = "/app/artifacts/article_map.parquet"
 SOURCE_IMAGES_DIR = "/data/images"
@@ -11,106 +17,244 @@ OUTPUT_DIR = "/output"
 TARGET_SIZE = (400, 600)  # Width, Height (Approx generic portrait)
 JPEG_QUALITY = 80
 
-def optimize_assets():
-    print("--- Starting Asset Optimization ---", flush=True)
-    
-    # Log file
-    log_path = os.path.join(OUTPUT_DIR, "debug_log.txt")
-    print(f"Logging to {log_path}", flush=True)
-    
-    with open(log_path, "w") as f:
-        f.write("--- Asset Optimization Log ---\n")
-        
-        # Check source
-        if not os.path.exists(SOURCE_IMAGES_DIR):
-             f.write(f"CRITICAL: Source dir {SOURCE_IMAGES_DIR} does not exist!\n")
-             return
-        else:
-             try:
-                 contents = os.listdir(SOURCE_IMAGES_DIR)[:5]
-                 f.write(f"Source dir {SOURCE_IMAGES_DIR} checked. Contents: {contents}\n")
-             except Exception as e:
-                 f.write(f"Error listing source: {e}\n")
-
-        # 1. Load Candidates & Mapping
-        if not os.path.exists(CANDIDATES_PATH) or not os.path.exists(MAPPING_PATH):
-            f.write(f"ERROR: Candidates or Mapping not found.\n")
-            return
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def size_label(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def output_path(article_id, size, primary):
+    """
+    Relative output path: the primary size keeps the frontend's layout
+    ({folder}/{id}.jpg); extra sizes go under {W}x{H}/{folder}/{id}.jpg.
+    """
+    relative = os.path.join(article_id[:3], f"{article_id}.jpg")
+    return relative if primary else os.path.join(size_label(size), relative)
+
 
-        f.write(f"Loading candidates from {CANDIDATES_PATH}...\n")
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_article_ids(candidates_path, mapping_path, all_articles=False):
+    """10-character article IDs of the candidate pool (or of the whole mapping)."""
+    m_df = pd.read_parquet(mapping_path, columns=['article_id_int', 'article_id_str'])
+    if not all_articles:
+        candidates_int = pd.read_parquet(candidates_path, columns=['article_id_int'])['article_id_int'].unique()
+        m_df = m_df[m_df['article_id_int'].isin(candidates_int)]
+    return sorted({str(a).zfill(10) for a in m_df['article_id_str']})
+
+
+def process_image(article_id, src_path, outputs, quality):
+    """
+    Worker (runs in the process pool): decodes the source once, then
+    resizes + encodes every requested size, largest first.
+    `outputs` is [(label, (w, h), absolute_path)]. Returns {label: image info}.
+    """
+    images = {}
+    outputs = sorted(outputs, key=lambda o: -o[1][0] * o[1][1])
+    with Image.open(src_path) as img:
+        # JPEG sources are decoded at a reduced scale when that is still >= 2x the
+        # largest size (what thumbnail() does for a single size)
+        largest = outputs[0][1]
+        img.draft(None, (largest[0] * 2, largest[1] * 2))
+        # Convert to RGB (in case of PNG/RGBA) to save as JPEG
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        for label, size, dst_path in outputs:
+            # thumbnail keeps the aspect ratio; each size is resized from the previous (larger) one
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            tmp_path = dst_path + ".tmp"
+            img.save(tmp_path, "JPEG", quality=quality, optimize=True)
+            os.replace(tmp_path, dst_path)
+            images[label] = {"width": img.width, "height": img.height, "bytes": os.path.getsize(dst_path)}
+    return images
+
+
+class ImagePipeline:
+    """
+    Incremental image preparation:
+    1. For each article, the source file's (size, mtime) is compared with the
+       manifest; when they changed, its sha1 decides (touched copies are skipped)
+    2. Changed / new articles and missing outputs are processed in a process
+       pool (decode, resize to every size, encode)
+    3. The manifest (article -> source fingerprint + path, dimensions and
+       bytes per size) is rewritten atomically, also periodically during
+       the run, so an interrupted run resumes where it stopped
+    """
+    def __init__(self, source_dir, output_dir, sizes, quality=JPEG_QUALITY, workers=0, force=False):
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.sizes = sizes
+        self.labels = [size_label(s) for s in sizes]
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.manifest = self._load_manifest()
+        self.stats = {"articles": 0, "processed": 0, "skipped": 0, "missing": 0, "failed": 0,
+                      "source_bytes": 0, "output_bytes": 0}
+        self.failures = {}
+
+    def _load_manifest(self):
+        empty = {"version": MANIFEST_VERSION, "quality": self.quality, "articles": {}}
+        if not os.path.exists(self.manifest_path):
+            return empty
         try:
-            # Load candidates
-            c_df = pd.read_parquet(CANDIDATES_PATH)
-            # Load mapping
-            m_df = pd.read_parquet(MAPPING_PATH)
-            
-            # Map IDs
-            # Filter mapping to only those in candidates
-            candidates_int = c_df['article_id_int'].unique()
-            mapped_df = m_df[m_df['article_id_int'].isin(candidates_int)]
-            
-            item_ids = mapped_df['article_id_str'].astype(str).tolist()
-            
-            f.write(f"Found {len(item_ids)} unique items in candidate pool (mapped).\n")
-        except Exception as e:
-             f.write(f"Error reading/mapping parquet: {e}\n")
-             return
-
-        # ... Processing ...
-        f.write(f"Processing images from {SOURCE_IMAGES_DIR} to {OUTPUT_DIR}...\n")
-        
-        success_count = 0
-        missing_count = 0
-        error_count = 0
-
-        for idx, id_str in enumerate(item_ids):
-            # ID Handling
-            # String IDs from map might be "0554598001" (10 chars)
-            if len(id_str) == 9:
-                id_str = "0" + id_str
-                
-            folder = id_str[:3]
-            src_path = os.path.join(SOURCE_IMAGES_DIR, folder, f"{id_str}.jpg")
-            dst_folder = os.path.join(OUTPUT_DIR, folder)
-            dst_path = os.path.join(dst_folder, f"{id_str}.jpg")
-
-            if idx < 10:
-                f.write(f"DEBUG: Checking ID {id_str} -> Path {src_path}\n")
-                f.write(f"DEBUG: Exists? {os.path.exists(src_path)}\n")
-
-            if os.path.exists(src_path):
-                try:
-                    # Create dest folder if needed
-                    os.makedirs(dst_folder, exist_ok=True)
-                    
-                    # Open and Resize
-                    with Image.open(src_path) as img:
-                        # Convert to RGB (in case of PNG/RGBA) to save as JPEG
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        # Resize
-                        img.thumbnail(TARGET_SIZE, Image.Resampling.LANCZOS)
-                        
-                        # Save optimized
-                        img.save(dst_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
-                        
-                    success_count += 1
-                except Exception as e:
-                    f.write(f"Failed to process {id_str}: {e}\n")
-                    error_count += 1
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        # Another encoder setting invalidates every output
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("quality") != self.quality:
+            return empty
+        return manifest
+
+    def _write_manifest(self):
+        self.manifest["sizes"] = sorted(set(self.manifest.get("sizes", [])) | set(self.labels))
+        self.manifest["primary"] = self.labels[0]
+        self.manifest["updated_at"] = time.time()
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _plan(self, article_id):
+        """Returns (src_path, source fingerprint, outputs to (re)build) or None when up to date / missing."""
+        src_path = os.path.join(self.source_dir, article_id[:3], f"{article_id}.jpg")
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            self.stats["missing"] += 1
+            return None
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entry = self.manifest["articles"].get(article_id)
+
+        unchanged = False
+        if entry is not None and not self.force:
+            old = entry["source"]
+            if (old["size"], old["mtime_ns"]) == (source["size"], source["mtime_ns"]):
+                unchanged = True
+                source["sha1"] = old["sha1"]
             else:
-                missing_count += 1
-                
-            if idx % 100 == 0:
-                print(f"Progress: {idx}/{len(item_ids)}...", end='\r')
-
-        f.write("\n--- Optimization Complete ---\n")
-        f.write(f"Successfully optimized: {success_count}\n")
-        f.write(f"Missing source images: {missing_count}\n")
-        f.write(f"Errors: {error_count}\n")
-        
-    print("\nDone.", flush=True)
+                source["sha1"] = file_sha1(src_path)
+                unchanged = source["sha1"] == old["sha1"]
+        if "sha1" not in source:
+            source["sha1"] = file_sha1(src_path)
+
+        outputs = []
+        for size, label in zip(self.sizes, self.labels):
+            relative = output_path(article_id, size, primary=size == self.sizes[0])
+            done = unchanged and label in entry["images"] and entry["images"][label]["path"] == relative \
+                and os.path.exists(os.path.join(self.output_dir, relative))
+            if not done:
+                outputs.append((label, size, os.path.join(self.output_dir, relative)))
+        if not outputs:
+            if entry["source"] != source:
+                entry["source"] = source  # touched but identical: remember the new mtime
+            self.stats["skipped"] += 1
+            return None
+        return src_path, source, outputs
+
+    def run(self, article_ids, checkpoint_every=1000):
+        start = time.perf_counter()
+        self.stats["articles"] = len(article_ids)
+        tasks = {}
+        for article_id in article_ids:
+            plan = self._plan(article_id)
+            if plan is not None:
+                tasks[article_id] = plan
+        print(f"{len(article_ids)} articles: {len(tasks)} to process, {self.stats['skipped']} up to date, "
+              f"{self.stats['missing']} without source image. {self.workers} worker process(es).", flush=True)
+
+        if tasks:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(process_image, article_id, src_path, outputs, self.quality): article_id
+                           for article_id, (src_path, _, outputs) in tasks.items()}
+                for done, future in enumerate(as_completed(futures), 1):
+                    article_id = futures[future]
+                    self._record(article_id, tasks[article_id], future)
+                    if done % checkpoint_every == 0:
+                        self._write_manifest()
+                    if done % 100 == 0 or done == len(futures):
+                        rate = done / (time.perf_counter() - start)
+                        print(f"Progress: {done}/{len(futures)} ({rate:,.1f} images/s)...", end='\r', flush=True)
+            print()
+
+        self._write_manifest()
+        self.stats["seconds"] = round(time.perf_counter() - start, 2)
+        self.stats["images_per_second"] = round(self.stats["processed"] / self.stats["seconds"], 1) \
+            if self.stats["seconds"] else 0.0
+        return self.stats
+
+    def _record(self, article_id, task, future):
+        src_path, source, outputs = task
+        try:
+            images = future.result()
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.failures[article_id] = f"{type(e).__name__}: {e}"
+            return
+        entry = self.manifest["articles"].get(article_id)
+        if entry is None or entry["source"]["sha1"] != source["sha1"]:
+            entry = self.manifest["articles"][article_id] = {"source": source, "images": {}}
+        entry["source"] = source
+        for label, size, dst_path in outputs:
+            entry["images"][label] = {"path": os.path.relpath(dst_path, self.output_dir), **images[label]}
+            self.stats["output_bytes"] += images[label]["bytes"]
+        self.stats["processed"] += 1
+        self.stats["source_bytes"] += source["size"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resize the product images for deployment (process pool, incremental via manifest.json)."
+    )
+    parser.add_argument("--candidates", default=CANDIDATES_PATH)
+    parser.add_argument("--mapping", default=MAPPING_PATH)
+    parser.add_argument("--source-dir", default=SOURCE_IMAGES_DIR, help="Raw images: {dir}/{folder}/{id}.jpg")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--all-articles", action="store_true", help="Every mapped article, not just the candidate pool")
+    parser.add_argument("--sizes", default=size_label(TARGET_SIZE),
+                        help="Comma-separated WxH bounding boxes; the first is the primary size the app shows")
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 = one per core)")
+    parser.add_argument("--force", action="store_true", help="Re-process every image")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes.split(",")]
+    print("--- Starting Asset Optimization ---", flush=True)
+    if not os.path.isdir(args.source_dir):
+        sys.exit(f"CRITICAL: Source dir {args.source_dir} does not exist!")
+
+    article_ids = load_article_ids(args.candidates, args.mapping, args.all_articles)
+    pipeline = ImagePipeline(args.source_dir, args.output_dir, sizes, quality=args.quality,
+                             workers=args.workers, force=args.force)
+    stats = pipeline.run(article_ids)
+
+    print("\n--- Optimization Complete ---")
+    print(f"Processed: {stats['processed']} ({stats['images_per_second']:,.1f} images/s, {stats['seconds']}s)")
+    print(f"Up to date (skipped): {stats['skipped']}")
+    print(f"Missing source images: {stats['missing']}")
+    print(f"Failed: {stats['failed']}")
+    if stats["processed"]:
+        print(f"Bytes: {stats['source_bytes'] / 1e6:,.1f} MB source -> {stats['output_bytes'] / 1e6:,.1f} MB output")
+    for article_id, error in sorted(pipeline.failures.items())[:20]:
+        print(f"  Failed to process {article_id}: {error}")
+
+    report_path = os.path.join(args.output_dir, "last_run.json")
+    with open(report_path, "w") as f:
+        json.dump({"stats": stats, "failures": pipeline.failures, "sizes": pipeline.labels}, f, indent=2)
+    print(f"Manifest: {pipeline.manifest_path}, report: {report_path}")
+
 
 if __name__ == "__main__":
-    optimize_assets()
+    main()
@@ -0,0 +1,195 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+try:
+    from inference import RecSysEngine, SIDE_ARTIFACTS, SOURCE_BESTSELLER, SOURCE_VISUAL
+    from bundle import compile_bundle
+    from recent_purchases import RecentPurchaseIndex
+    from generate_synthetic_artifacts import generate_artifacts
+except ImportError as e:
+    print(f"Import Error: {e}")
+    sys.exit(1)
+
+# Small synthetic catalogue: a 200-article pool, so top_k can exceed the candidates
+N_USERS = 2000
+N_ITEMS = 5000
+POOL_SIZE = 200
+
+
+def report(name, ok, detail=""):
+    print(f"{name}: {detail} -> {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def test_top_k_beyond_candidates(engine):
+    """top_k larger than the candidate count: only real, distinct articles, no padding decoded."""
+    print("\n--- Ranking: top_k > candidates ---")
+    ids = engine.features.sample_customer_ids(64, seed=1).tolist()
+    single = [engine.recommend(c, top_k=1000) for c in ids]
+    many = engine.recommend_many(ids, top_k=1000)
+    # The small synthetic ranker has many tied scores: compare the articles, not their order
+    same = all(len(s) == len(m) and set(s) == set(m) for s, m in zip(single, many))
+    ok = report("recommend vs recommend_many", same, "same articles")
+    duplicates = sum(len(r) - len(set(r)) for r in many)
+    ok &= report("distinct articles", duplicates == 0, f"{duplicates} duplicates")
+    longest = max(len(r) for r in many)
+    ok &= report("at most the candidates", POOL_SIZE <= longest < 1000, f"longest list {longest}")
+    top12 = engine.recommend_many(ids, top_k=12)
+    ok &= report("top_k=12 within the full ranking", all(len(t) == 12 and set(t) <= set(r) for r, t in zip(many, top12)))
+    return ok
+
+
+def test_exclude_purchased(artifact_dir, days=28):
+    """exclude_purchased_days: recently bought articles are never returned, whatever top_k."""
+    print("\n--- Already-bought rules: exclude_purchased_days ---")
+    engine = RecSysEngine(artifact_dir=artifact_dir, use_bundle=False, exclude_purchased_days=days)
+    try:
+        ids = engine.features.sample_customer_ids(N_USERS, seed=2)
+        history_ids, history_days = engine._purchase_history(ids.tolist())
+        bought = np.where(history_days > engine.purchases.reference_day - days, history_ids, -1)
+        ids, bought = ids[(bought >= 0).any(axis=1)][:64], bought[(bought >= 0).any(axis=1)][:64]
+        blocked = [set(engine.id_map.decode(row[row >= 0])) for row in bought]
+
+        ok = report("users with recent purchases", len(ids) > 0, f"{len(ids)} users")
+        many = engine.recommend_many(ids.tolist(), top_k=1000)
+        single = [engine.recommend(c, top_k=1000) for c in ids.tolist()]
+        leaked = sum(len(b & set(r)) for b, r in zip(blocked, many)) + \
+            sum(len(b & set(r)) for b, r in zip(blocked, single))
+        ok &= report("excluded articles returned", leaked == 0, f"{leaked} leaked")
+
+        # Without the rule the same articles are ranked (the check is not vacuous)
+        engine.exclude_purchased_days = 0
+        ranked = sum(len(b & set(r)) for b, r in zip(blocked, engine.recommend_many(ids.tolist(), top_k=1000)))
+        ok &= report("ranked without the rule", ranked > 0, f"{ranked} articles")
+        engine.exclude_purchased_days = days
+
+        user_rows, _ = engine.features.get_users(ids.tolist())
+        article_ids, _, _ = engine.score_chunk(ids.tolist(), user_rows, [None] * len(ids), 12)
+        candidates = sum(len(b & set(engine.id_map.decode(row[row >= 0]))) for b, row in zip(blocked, article_ids))
+        ok &= report("excluded articles among score_chunk candidates", candidates == 0, f"{candidates}")
+        return ok
+    finally:
+        engine.close()
+
+
+def test_recent_purchases_from_transactions():
+    """DuckDB window query == RecentPurchaseIndex.build, also for a path with a quote in it."""
+    print("\n--- RecentPurchaseIndex.from_transactions ---")
+    rng = np.random.default_rng(3)
+    days = np.datetime64("2020-08-01") + rng.integers(0, 60, 5000).astype("timedelta64[D]")
+    frame = pd.DataFrame({"t_dat": days.astype(str), "customer_id_int": rng.integers(0, 300, 5000),
+                          "article_id_int": rng.integers(0, 900, 5000)})
+    expected = RecentPurchaseIndex.build(frame["customer_id_int"], frame["article_id_int"],
+                                         days.astype(np.int64), window_days=28)
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="o'brien") as work_dir:
+        for name in ("transactions.parquet", "transactions.csv"):
+            path = os.path.join(work_dir, name)
+            frame.to_parquet(path) if name.endswith(".parquet") else frame.to_csv(path, index=False)
+            index = RecentPurchaseIndex.from_transactions(path, window_days=28)
+            same = (index.reference_day == expected.reference_day
+                    and np.array_equal(index.offsets[:len(expected.offsets)], expected.offsets)
+                    and np.array_equal(index.items, expected.items) and np.array_equal(index.days, expected.days))
+            ok &= report(name, same, f"{len(index.items)} pairs")
+    return ok
+
+
+def test_visual_candidates(engine):
+    """Visual neighbours are added as their own last block; earlier rows are never relabelled."""
+    print("\n--- Visual candidates ---")
+    ids = engine.features.sample_customer_ids(16, seed=4).tolist()
+    user_rows, _ = engine.features.get_users(ids)
+    recent = [engine.id_map.decode(engine.visual.row_article_ids[[u, u + 100]]) for u in range(len(ids))]
+    source_col, visual_col = engine.layout.index['source'], engine.layout.index['visual_score']
+
+    # Same users and seeds without the visual index: the candidates before the visual block
+    visual, engine.visual = engine.visual, None
+    try:
+        plain_ids, plain_X, _ = engine._candidates(ids, user_rows, recent)
+        plain_X = plain_X.copy()  # X is this thread's reusable buffer
+    finally:
+        engine.visual = visual
+    article_ids, X, history = engine._candidates(ids, user_rows, recent)
+    X, plain_X = X.reshape(*article_ids.shape, -1), plain_X.reshape(*plain_ids.shape, -1)
+
+    width = plain_ids.shape[1]
+    ok = report("earlier rows unchanged", np.array_equal(article_ids[:, :width], plain_ids)
+                and np.array_equal(X[:, :width], plain_X, equal_nan=True), f"{width} columns")
+    added, known = X[:, width:], article_ids[:, width:] >= 0
+    ok &= report("visual block", known.sum() > 0 and (added[..., source_col][known] == SOURCE_VISUAL).all()
+                 and (added[..., visual_col][known] > -1).all(), f"{known.sum()} rows")
+    rows = plain_ids >= 0
+    ok &= report("no visual_score before it", (plain_X[..., visual_col][rows] == -1).all()
+                 and not (plain_X[..., source_col][rows] == SOURCE_VISUAL).any())
+
+    # The block holds the seeds' nearest neighbours that no earlier source added
+    seeds = engine._seed_articles(recent, history)
+    for u in range(len(ids)):
+        neighbours = engine.similar_items(engine.id_map.decode(seeds[u]), k=engine.visual_neighbours)
+        expected = sorted({a for found in neighbours if found for a, _ in found})
+        expected = engine.id_map.encode(expected)
+        expected = set(expected[engine.features.eligible_extra(expected)].tolist())
+        expected -= set(plain_ids[u].tolist())
+        if set(article_ids[u, width:][known[u]].tolist()) != expected:
+            return report("visual rows are the seeds' neighbours", False, f"user {ids[u]}")
+    return ok & report("visual rows are the seeds' neighbours", True, f"{len(ids)} users")
+
+
+def test_decode_rejects_padding(engine):
+    print("\n--- ArticleIdMap.decode ---")
+    try:
+        engine.id_map.decode([0, -1])
+    except ValueError:
+        return report("negative id", True, "ValueError")
+    return report("negative id", False, "decoded instead of raising")
+
+
+def test_bundle_version_covers_side_artifacts(artifact_dir):
+    """With a bundle mapped, retraining an artifact read from the raw directory still changes the version."""
+    print("\n--- Artifact version with a bundle ---")
+    compile_bundle(artifact_dir)
+    try:
+        engine = RecSysEngine(artifact_dir=artifact_dir)
+        before, mapped = engine.artifact_version, engine.bundle is not None
+        engine.close()
+        ok = report("bundle mapped", mapped)
+        for name in SIDE_ARTIFACTS:
+            path = os.path.join(artifact_dir, name)
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            engine = RecSysEngine(artifact_dir=artifact_dir)
+            after = engine.artifact_version
+            engine.close()
+            ok &= report(f"{name} replaced", after != before, f"{before} -> {after}")
+            before = after
+        return ok
+    finally:
+        os.remove(os.path.join(artifact_dir, "engine.bundle"))
+
+
+if __name__ == "__main__":
+    print("Starting Verification...")
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        generate_artifacts(artifact_dir, n_users=N_USERS, n_items=N_ITEMS, pool_size=POOL_SIZE, n_trees=5,
+                           extras=True, n_transactions=50_000)
+        engine = RecSysEngine(artifact_dir=artifact_dir, use_bundle=False)
+        try:
+            results = [test_top_k_beyond_candidates(engine), test_exclude_purchased(artifact_dir),
+                       test_visual_candidates(engine), test_recent_purchases_from_transactions(),
+                       test_decode_rejects_padding(engine),
+                       test_bundle_version_covers_side_artifacts(artifact_dir)]
+        finally:
+            engine.close()
+    if all(results):
+        print("\nSUCCESS: Engine ranking checks passed.")
+    else:
+        print("\nFAILED: Engine ranking checks failed.")
+        sys.exit(1)
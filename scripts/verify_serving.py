@@ -0,0 +1,499 @@
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import contextvars
+import numpy as np
+import pandas as pd
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+try:
+    from batching import MicroBatcher
+    from cache import RecommendationCache, InMemorySharedCache
+    from executor import InferenceExecutor, Overloaded, InferenceTimeout
+    from streaming import (FeatureIngestor, TransactionFileSource, UserAggregates, IngestLease,
+                           TRAINING_REFERENCE_DATE, read_snapshot_state)
+except ImportError as e:
+    print(f"Import Error: {e}")
+    sys.exit(1)
+
+# Serving-path checks that need no artifacts: stand-in engines with the same entry points.
+
+
+def report(name, ok, detail=""):
+    print(f"{name}: {detail} -> {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+class FakeManager:
+    """EngineManager stand-in for the micro-batcher: recommend_many returns (artifact_version, results)."""
+    def __init__(self, version="v1", gate=None, error=None):
+        self.version = version
+        self.gate = gate
+        self.error = error
+        self.calls = []
+
+    def recommend_many(self, customer_ids, top_k=12, chunk_size=None, segments=None, recent_items=None,
+                       predict_threads=0):
+        self.calls.append(list(customer_ids))
+        self.predict_threads = predict_threads
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.version, [[f"{c}-{i}" for i in range(top_k)] for c in customer_ids]
+
+
+def test_micro_batcher():
+    print("\n--- MicroBatcher ---")
+
+    async def coalesce():
+        manager = FakeManager()
+        executor = InferenceExecutor(workers=2)
+        batcher = MicroBatcher(manager, executor, max_wait_ms=50, max_batch_size=4, predict_threads=8)
+        await batcher.start()
+        try:
+            results = await asyncio.gather(*(batcher.submit(c, top_k=1 + c % 3) for c in range(10)))
+        finally:
+            await batcher.stop()
+            executor.shutdown()
+        ok = report("one call per batch", [len(c) for c in manager.calls] == [4, 4, 2],
+                    f"batch sizes {[len(c) for c in manager.calls]}")
+        own = all(version == "v1" and recs == [f"{c}-{i}" for i in range(1 + c % 3)]
+                  for c, (version, recs) in enumerate(results))
+        ok &= report("each caller gets its own top_k", own)
+        ok &= report("batches run on the inference executor", executor.stats()["completed"] == 3)
+        return ok & report("batch predict threads", manager.predict_threads == 8, f"{manager.predict_threads}")
+
+    async def reload_in_window():
+        manager = FakeManager("v1")
+        executor = InferenceExecutor(workers=1)
+        batcher = MicroBatcher(manager, executor, max_wait_ms=50)
+        await batcher.start()
+        try:
+            pending = asyncio.create_task(batcher.submit(1))
+            await asyncio.sleep(0.01)
+            manager.version = "v2"
+            version, _ = await pending
+        finally:
+            await batcher.stop()
+            executor.shutdown()
+        return report("version of the engine that scored the batch", version == "v2", version)
+
+    async def admission():
+        gate = threading.Event()
+        manager = FakeManager(gate=gate)
+        executor = InferenceExecutor(workers=1)
+        batcher = MicroBatcher(manager, executor, max_wait_ms=1, max_queue=2)
+        await batcher.start()
+        try:
+            running = asyncio.create_task(batcher.submit(0))
+            await asyncio.sleep(0.05)  # dispatched, blocked in the engine
+            queued = [asyncio.create_task(batcher.submit(c, timeout=0.05)) for c in (1, 2)]
+            await asyncio.sleep(0)
+            try:
+                await batcher.submit(3)
+                ok = report("queue full", False, "accepted")
+            except Overloaded:
+                ok = report("queue full", True, "Overloaded")
+            timed_out = await asyncio.gather(*queued, return_exceptions=True)
+            ok &= report("timeout while queued", all(isinstance(r, InferenceTimeout) for r in timed_out),
+                         f"{[type(r).__name__ for r in timed_out]}")
+            gate.set()
+            await running
+            await asyncio.sleep(0.05)
+            ok &= report("timed out requests not scored", manager.calls == [[0]], f"calls {manager.calls}")
+            ok &= report("stats", batcher.stats()["rejected"] == 1 and batcher.stats()["timeouts"] == 2)
+        finally:
+            gate.set()
+            await batcher.stop()
+            executor.shutdown()
+        return ok
+
+    async def executor_full():
+        # The shared executor is saturated by other endpoints: the batch is rejected with 429
+        gate = threading.Event()
+        executor = InferenceExecutor(workers=1, max_queue=0)
+        batcher = MicroBatcher(FakeManager(), executor, max_wait_ms=1)
+        await batcher.start()
+        try:
+            busy = asyncio.create_task(executor.run(gate.wait, 5))
+            await asyncio.sleep(0.05)
+            try:
+                await batcher.submit(1)
+                ok = report("executor full", False, "accepted")
+            except Overloaded:
+                ok = report("executor full", True, "Overloaded")
+            gate.set()
+            await busy
+        finally:
+            gate.set()
+            await batcher.stop()
+            executor.shutdown()
+        return ok
+
+    async def failure():
+        executor = InferenceExecutor(workers=1)
+        batcher = MicroBatcher(FakeManager(error=ValueError("boom")), executor, max_wait_ms=1)
+        await batcher.start()
+        try:
+            await batcher.submit(1)
+            return report("engine error reaches the caller", False, "no error")
+        except ValueError as e:
+            return report("engine error reaches the caller", str(e) == "boom", str(e))
+        finally:
+            await batcher.stop()
+            executor.shutdown()
+
+    return all([asyncio.run(coalesce()), asyncio.run(reload_in_window()), asyncio.run(admission()),
+                asyncio.run(executor_full()), asyncio.run(failure())])
+
+
+def test_recommendation_cache():
+    print("\n--- RecommendationCache ---")
+    recs = [f"a{i}" for i in range(12)]
+
+    cache = RecommendationCache(max_entries=10, ttl_seconds=60)
+    cache.put(1, 12, "v1", recs)
+    ok = report("smaller top_k served from a top-12 entry", cache.get(1, 5, "v1") == recs[:5])
+    ok &= report("larger top_k is a miss", cache.get(1, 20, "v1") is None)
+    cache.put(1, 5, "v1", recs[:5])
+    ok &= report("a shorter list never replaces a longer one", cache.get(1, 12, "v1") == recs)
+
+    cache = RecommendationCache(max_entries=2, ttl_seconds=60)
+    for customer_id in (1, 2):
+        cache.put(customer_id, 12, "v1", recs)
+    cache.get(1, 12, "v1")  # 1 is now the most recently used
+    cache.put(3, 12, "v1", recs)
+    ok &= report("LRU eviction", cache.get(2, 12, "v1") is None and cache.get(1, 12, "v1") == recs
+                 and cache.stats()["evictions"] == 1)
+
+    cache = RecommendationCache(ttl_seconds=0.05)
+    cache.put(1, 12, "v1", recs)
+    time.sleep(0.1)
+    ok &= report("TTL expiry", cache.get(1, 12, "v1") is None and cache.stats()["expirations"] == 1)
+
+    cache = RecommendationCache(ttl_seconds=60)
+    cache.put(1, 12, "v1", recs)
+    ok &= report("new artifact version misses", cache.get(1, 12, "v2") is None
+                 and cache.stats()["invalidations"] == 1 and cache.stats()["entries"] == 0)
+    cache.put(2, 12, "v1", recs)
+    ok &= report("late result of the old version dropped", cache.stats()["entries"] == 0)
+
+    cache.put(4, 12, "v2", recs)
+    cache.put(4, 12, "v2", recs, segment=2)
+    cache.put(5, 12, "v2", recs)
+    ok &= report("segment is part of the key", cache.get(4, 12, "v2", segment=3) is None)
+    cache.discard([4])
+    ok &= report("discard by customer (all segments)", cache.get(4, 12, "v2") is None
+                 and cache.get(4, 12, "v2", segment=2) is None and cache.get(5, 12, "v2") == recs
+                 and cache.stats()["discarded"] == 2)
+
+    cache = RecommendationCache(max_entries=100, ttl_seconds=60)
+    for customer_id in range(1000):
+        cache.put(customer_id, 12, "v1", recs)
+    cache.discard(range(1000))
+    ok &= report("index follows evictions", cache.stats()["entries"] == 0 and not cache._keys_of
+                 and cache.stats()["discarded"] == 100)
+
+    shared = InMemorySharedCache()
+    RecommendationCache(ttl_seconds=60, shared=shared).put(7, 12, "v1", recs)
+    other = RecommendationCache(ttl_seconds=60, shared=shared)
+    ok &= report("shared backend hit from another worker", other.get(7, 12, "v1") == recs
+                 and other.stats()["shared_hits"] == 1)
+
+    cache = RecommendationCache(ttl_seconds=60, shared=shared)
+    cache.put(8, 12, "v1", recs)
+    cache.bump_epoch()
+    ok &= report("epoch bump drops local and shared entries", cache.get(7, 12, "v1") is None
+                 and cache.get(8, 12, "v1") is None and not cache._keys_of and cache.stats()["epoch"] == 1)
+    return ok
+
+
+class FakeStore:
+    """In-memory feature store stand-in: the arrays and update_users the ingestor writes to."""
+    def __init__(self, n_slots, n_features=5):
+        self.user_features = np.zeros((n_slots, n_features))
+        self.user_present = np.zeros(n_slots, dtype=bool)
+
+    def update_users(self, customer_ids, rows):
+        self.user_features[customer_ids] = rows
+        self.user_present[customer_ids] = True
+
+
+class FakeEngine:
+    def __init__(self, n_slots, repurchase_window_days=0):
+        self.features = FakeStore(n_slots)
+        self.repurchase_window_days = repurchase_window_days
+        self.purchases = 0
+
+    def add_purchases(self, customer_ids, article_ids, days):
+        self.purchases += len(customer_ids)
+
+
+def _transactions(n=3000, n_customers=200, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.datetime64("2020-08-01") + rng.integers(0, 45, n).astype("timedelta64[D]")
+    return pd.DataFrame({"t_dat": days.astype(str), "customer_id_int": rng.integers(0, n_customers, n),
+                         "article_id_int": rng.integers(0, 1000, n), "price": rng.lognormal(-3.5, 0.4, n).round(6)})
+
+
+def _expected_rows(frame, reference_day):
+    """The notebook's user features of `frame`, computed directly (pandas)."""
+    days = pd.to_datetime(frame["t_dat"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    grouped = frame.assign(day=days).groupby("customer_id_int")
+    expected = pd.DataFrame({
+        "user_avg_price": grouped["price"].mean(),
+        "user_price_std": grouped["price"].std(),
+        "user_total_purchases": grouped.size(),
+        "user_tenure_days": grouped["day"].max() - grouped["day"].min(),
+        "days_since_last_buy": reference_day - grouped["day"].max(),
+    })
+    return expected.index.to_numpy(), expected.to_numpy(dtype=np.float64)
+
+
+def _rows_match(aggregates, ids, expected):
+    actual = aggregates.feature_rows(ids)
+    return bool(np.allclose(actual, expected, rtol=1e-9, atol=1e-12, equal_nan=True))
+
+
+def test_streaming_ingestion():
+    print("\n--- Streaming feature ingestion ---")
+    frame = _transactions()
+    reference_day = int(np.datetime64(TRAINING_REFERENCE_DATE, "D").astype(np.int64))
+    ids, expected = _expected_rows(frame, reference_day)
+
+    # Welford / Chan merges over several batches == the aggregates of all transactions
+    aggregates = UserAggregates.empty(0, reference_day)
+    days = pd.to_datetime(frame["t_dat"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    for part in np.array_split(np.arange(len(frame)), 7):
+        aggregates.update(frame["customer_id_int"].to_numpy()[part], days[part], frame["price"].to_numpy()[part])
+    ok = report("batched aggregates", _rows_match(aggregates, ids, expected), f"{len(ids)} customers")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        feed = os.path.join(work_dir, "feed.csv")
+        snapshot_dir = os.path.join(work_dir, "snapshots")
+        half = len(frame) // 2
+        frame[:half].to_csv(feed, index=False)
+        with open(feed, "a") as f:
+            f.write("2020-09-01,1,1")  # a line still being written
+
+        engine = FakeEngine(200)
+        ingestor = FeatureIngestor.resume(lambda: engine, TransactionFileSource(feed), snapshot_dir, batch_rows=500)
+        while ingestor.poll_once():
+            pass
+        ok &= report("partial line left for the next poll", ingestor.transactions == half, f"{ingestor.transactions}")
+        ingestor.snapshot()
+        state = read_snapshot_state(snapshot_dir)
+        ok &= report("one snapshot file carries the offset", os.listdir(snapshot_dir) == ["features_user.parquet"]
+                     and state["offset"] == ingestor.source.offset, f"offset {state['offset']}")
+        served = engine.features.user_present.sum()
+        ok &= report("features pushed to the serving store", served == len(np.unique(frame["customer_id_int"][:half])),
+                     f"{served} customers")
+
+        # Restart: resume from the snapshot, finish the partial line and read the rest once
+        with open(feed, "a") as f:
+            f.write(",0.03\n")
+            frame[half:].to_csv(f, index=False, header=False)
+        resumed = FeatureIngestor.resume(lambda: FakeEngine(200), TransactionFileSource(feed), snapshot_dir)
+        while resumed.poll_once():
+            pass
+        everything = pd.concat([frame[:half], pd.DataFrame([{"t_dat": "2020-09-01", "customer_id_int": 1,
+                                                             "article_id_int": 1, "price": 0.03}]), frame[half:]])
+        ids, expected = _expected_rows(everything, reference_day)
+        ok &= report("resumed without double counting", _rows_match(resumed.aggregates, ids, expected),
+                     f"{resumed.transactions} transactions")
+
+        # Day roll ("latest" reference): one reset instead of a discard per customer
+        updates, resets = [], []
+        engine = FakeEngine(200)
+        rolling = FeatureIngestor.resume(lambda: engine, TransactionFileSource(feed), snapshot_dir,
+                                         reference_date="latest", on_update=updates.append,
+                                         on_reset=lambda: resets.append(1))
+        while rolling.poll_once():
+            pass
+        updates.clear()
+        resets.clear()
+        with open(feed, "a") as f:
+            f.write("2020-09-20,3,1,0.02\n")
+        rolling.poll_once()
+        ok &= report("day roll resets once", len(resets) == 1 and not updates
+                     and rolling.stats()["reference_date"] == "2020-09-20",
+                     f"{len(resets)} resets, {len(updates)} discards")
+    return ok
+
+
+def test_ingest_lease():
+    print("\n--- Single ingesting worker ---")
+    frame = _transactions()
+    reference_day = int(np.datetime64(TRAINING_REFERENCE_DATE, "D").astype(np.int64))
+    with tempfile.TemporaryDirectory() as work_dir:
+        feed = os.path.join(work_dir, "feed.csv")
+        snapshot_dir = os.path.join(work_dir, "snapshots")
+        half = len(frame) // 2
+        frame[:half].to_csv(feed, index=False)
+
+        engines = [FakeEngine(200, repurchase_window_days=28) for _ in range(2)]
+        workers = [FeatureIngestor.resume(lambda engine=engine: engine, TransactionFileSource(feed), snapshot_dir,
+                                          batch_rows=500, lease=IngestLease(snapshot_dir)) for engine in engines]
+        leader, follower = workers
+        ok = report("one lease holder", leader.lease.acquire() and not follower.lease.acquire())
+        while leader.poll_once():
+            pass
+        ok &= report("follower waits for a snapshot", follower.follow_once() == 0 and engines[1].purchases == 0)
+        leader.snapshot()
+        follower.follow_once()
+        same = np.array_equal(engines[0].features.user_features, engines[1].features.user_features, equal_nan=True)
+        # Purchases still inside the repurchase window are replayed
+        window = len(leader._purchases[0])
+        ok &= report("follower applies the snapshot", same and engines[1].purchases == window
+                     and follower.stats()["role"] == "follower", f"{engines[1].purchases} purchases")
+        ok &= report("unchanged snapshot is not re-applied", follower.follow_once() == 0)
+
+        # The leader exits: the follower takes over from the snapshot offset
+        with open(feed, "a") as f:
+            frame[half:].to_csv(f, index=False, header=False)
+        leader.stop()
+        ok &= report("lease freed on exit", follower.lease.acquire())
+        follower._take_over()
+        while follower.poll_once():
+            pass
+        ids, expected = _expected_rows(frame, reference_day)
+        ok &= report("takeover continues the feed once", _rows_match(follower.aggregates, ids, expected)
+                     and engines[1].purchases == window + len(frame) - half
+                     and follower.stats()["role"] == "leader",
+                     f"{follower.transactions} transactions")
+        follower.stop()
+    return ok
+
+
+def test_inference_executor():
+    print("\n--- InferenceExecutor admission ---")
+    trace = contextvars.ContextVar("trace", default=None)
+
+    async def admission():
+        gate = threading.Event()
+        executor = InferenceExecutor(workers=1, max_queue=1)
+        try:
+            running = asyncio.create_task(executor.run(gate.wait, 5))
+            queued = asyncio.create_task(executor.run(lambda: "queued"))
+            await asyncio.sleep(0.05)
+            try:
+                await executor.run(lambda: "third")
+                ok = report("workers + max_queue in flight", False, "accepted")
+            except Overloaded:
+                ok = report("workers + max_queue in flight", True, "Overloaded")
+            stats = executor.stats()
+            ok &= report("running / queued", stats["running"] == 1 and stats["queued"] == 1,
+                         f"{stats['running']} / {stats['queued']}")
+            gate.set()
+            ok &= report("admitted calls complete", await running is True and await queued == "queued")
+            await asyncio.sleep(0.05)
+            ok &= report("admission after the queue drains", await executor.run(lambda: "again") == "again")
+            stats = executor.stats()
+            ok &= report("stats", stats["completed"] == 3 and stats["rejected"] == 1 and stats["queued"] == 0,
+                         f"completed {stats['completed']}, rejected {stats['rejected']}")
+        finally:
+            gate.set()
+            executor.shutdown()
+        return ok
+
+    async def timeout():
+        gate = threading.Event()
+        executor = InferenceExecutor(workers=1, max_queue=0)
+        try:
+            try:
+                await executor.run(gate.wait, 5, timeout=0.05)
+                ok = report("slow call", False, "no timeout")
+            except InferenceTimeout:
+                ok = report("slow call", True, "InferenceTimeout")
+            # The timed-out call is still running on its thread: its slot stays taken
+            try:
+                await executor.run(lambda: None)
+                ok &= report("slot held while the timed-out call runs", False, "accepted")
+            except Overloaded:
+                ok &= report("slot held while the timed-out call runs", True, "Overloaded")
+            gate.set()
+            await asyncio.sleep(0.05)
+            ok &= report("slot released when it finishes", await executor.run(lambda: "done") == "done")
+            ok &= report("timeouts counted", executor.stats()["timeouts"] == 1)
+        finally:
+            gate.set()
+            executor.shutdown()
+        return ok
+
+    async def context_and_errors():
+        executor = InferenceExecutor(workers=2)
+        try:
+            trace.set("request-1")
+            ok = report("context variables in the worker thread", await executor.run(trace.get) == "request-1")
+            try:
+                await executor.run(int, "x")
+                ok &= report("error reaches the caller", False, "no error")
+            except ValueError:
+                ok &= report("error reaches the caller", executor.stats()["failed"] == 1, "ValueError")
+        finally:
+            executor.shutdown()
+        return ok
+
+    ok = all([asyncio.run(admission()), asyncio.run(timeout()), asyncio.run(context_and_errors())])
+    try:
+        from main import _rejected
+    except ImportError as e:
+        print(f"HTTP mapping skipped ({e})")
+        return ok
+    statuses = [(_rejected(e).status_code, _rejected(e).headers) for e in (Overloaded("full"), InferenceTimeout("slow"))]
+    return ok & report("HTTP status", statuses == [(429, {"Retry-After": "1"}), (503, {"Retry-After": "1"})],
+                       f"{[status for status, _ in statuses]}")
+
+
+def test_admin_guards():
+    print("\n--- Admin endpoints ---")
+    try:
+        import main
+        from fastapi import HTTPException
+    except ImportError as e:
+        print(f"Admin checks skipped ({e})")
+        return True
+
+    def status(fn, *args):
+        try:
+            fn(*args)
+            return 200
+        except HTTPException as e:
+            return e.status_code
+
+    token, root = main.ADMIN_TOKEN, main.artifact_root
+    try:
+        main.ADMIN_TOKEN = ""
+        ok = report("no ADMIN_TOKEN: disabled", status(main._require_admin, "anything") == 404)
+        main.ADMIN_TOKEN = "secret"
+        ok &= report("token required", [status(main._require_admin, t) for t in (None, "wrong", "secret")]
+                     == [401, 401, 200])
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            main.artifact_root = os.path.realpath(os.path.join(work_dir, "artifacts"))
+            os.makedirs(os.path.join(main.artifact_root, "v2"))
+            os.makedirs(os.path.join(work_dir, "elsewhere"))
+            ok &= report("reload dir under the root", main._reload_dir("v2") == os.path.join(main.artifact_root, "v2"))
+            outside = [status(main._reload_dir, d) for d in ("../elsewhere", os.path.join(work_dir, "elsewhere"), "/")]
+            ok &= report("reload dir outside the root", outside == [403, 403, 403], f"{outside}")
+            ok &= report("missing reload dir", status(main._reload_dir, "v3") == 400)
+    finally:
+        main.ADMIN_TOKEN, main.artifact_root = token, root
+    return ok
+
+
+if __name__ == "__main__":
+    print("Starting Verification...")
+    results = [test_micro_batcher(), test_recommendation_cache(), test_inference_executor(),
+               test_streaming_ingestion(), test_ingest_lease(), test_admin_guards()]
+    if all(results):
+        print("\nSUCCESS: Serving checks passed.")
+    else:
+        print("\nFAILED: Serving checks failed.")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+import sys
+import os
+import numpy as np
+
+# Add backend to sys.path to ensure imports work
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+try:
+    import lightgbm as lgb
+    from tree_model import TreeEnsemble
+except ImportError as e:
+    print(f"Import Error: {e}")
+    sys.exit(1)
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("backend", "artifacts"))
+TOLERANCE = 1e-9
+
+
+def random_inputs(booster, n_rows, seed=42, nan_rate=0.05):
+    """Random rows spread over each feature's training range (from feature_infos), with NaNs."""
+    rng = np.random.default_rng(seed)
+    infos = booster.dump_model()["feature_infos"]
+    X = np.empty((n_rows, booster.num_feature()))
+    for j, name in enumerate(booster.feature_name()):
+        info = infos[name]
+        if info.get("values"):
+            X[:, j] = rng.choice(info["values"] + [-1, max(info["values"]) + 5], size=n_rows)
+        else:
+            lo, hi = info["min_value"], info["max_value"]
+            pad = 0.1 * (hi - lo + 1)
+            X[:, j] = rng.uniform(lo - pad, hi + pad, size=n_rows)
+    X[rng.random(X.shape) < nan_rate] = np.nan
+    return X
+
+
+def check(name, booster, native, n_rows=20000):
+    X = random_inputs(booster, n_rows)
+    expected = booster.predict(X)
+    actual = native.predict(X)
+    max_err = np.abs(expected - actual).max()
+    ok = max_err <= TOLERANCE
+    print(f"{name}: {n_rows} rows, max |native - booster| = {max_err:.3e} -> {'OK' if ok else 'MISMATCH'}")
+    return ok
+
+
+def test_shipped_ranker():
+    print("\n--- Parity: shipped lgbm_ranker.txt ---")
+    model_path = os.path.join(ARTIFACT_DIR, "lgbm_ranker.txt")
+    booster = lgb.Booster(model_file=model_path)
+    native = TreeEnsemble.from_model_file(model_path)
+    return check("lgbm_ranker", booster, native)
+
+
+def test_categorical_and_missing():
+    """The shipped ranker has numeric splits only; train a small model that uses
+    categorical bitsets and NaN/zero missing handling to cover those paths."""
+    print("\n--- Parity: synthetic model (categorical + missing values) ---")
+    rng = np.random.default_rng(0)
+    n = 5000
+    X = np.column_stack([
+        rng.normal(size=n),
+        rng.integers(0, 40, size=n),      # categorical, > 32 categories (multi-word bitset)
+        rng.integers(0, 5, size=n),       # categorical
+        np.where(rng.random(n) < 0.3, 0.0, rng.normal(size=n)),
+    ]).astype(np.float64)
+    X[rng.random(n) < 0.1, 0] = np.nan
+    y = (X[:, 1] % 7 == 0) * 2.0 + np.nan_to_num(X[:, 0]) + (X[:, 2] == 3) + rng.normal(scale=0.1, size=n)
+
+    ok = True
+    for zero_as_missing in (False, True):
+        params = {"objective": "regression", "num_leaves": 15, "min_data_in_leaf": 5,
+                  "zero_as_missing": zero_as_missing, "verbose": -1, "seed": 42}
+        data = lgb.Dataset(X, y, categorical_feature=[1, 2])
+        booster = lgb.train(params, data, num_boost_round=30)
+        native = TreeEnsemble.from_model_string(booster.model_to_string())
+        ok &= check(f"synthetic (zero_as_missing={zero_as_missing})", booster, native)
+    return ok
+
+
+if __name__ == "__main__":
+    print("Starting Verification...")
+    results = [test_shipped_ranker(), test_categorical_and_missing()]
+    if all(results):
+        print("\nSUCCESS: Native evaluator matches Booster.predict.")
+    else:
+        print("\nFAILED: Native evaluator differs from Booster.predict.")
+        sys.exit(1)